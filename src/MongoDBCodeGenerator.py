@@ -19,37 +19,69 @@ find/aggregate
 
 Main function:
 execute, table_name, pipeline = mongo_compile
+
+The query is parsed once by "mongo_compile" (see query_parser.py) and the parsed
+query (doc) is shared by the pipeline stages (templated questions are tagged by
+the rule-based fast path instead, see fast_path.py). The query is then segmented into
+clauses in one pass over its tokens and one over its words (see clause_segmenter.py
+and mongo_clauses), and each stage reads its clause span from the segmented query.
  
 '''
-import spacy
-import nltk
-nltk.download("wordnet")
-from nltk.corpus import stopwords
-from spacy.lang.en.stop_words import STOP_WORDS
-from nltk.corpus import wordnet
-nltk.download('stopwords')  # Download the stopwords list
+import logging
 from collections import Counter
-# Load SpaCy's small English model
-nlp = spacy.load("en_core_web_sm")
+from clause_segmenter import clause_rule, segment_query
+from fast_path import fast_path
+from keyword_table import expand_keywords
+from query_parser import parse_query
+from schema_index import get_column_sets, get_schema_index
+from tracing import traced
+from translation_cache import normalize_query, translation_cache
+
+# Debug output of the pipeline stages (enable with logging.getLogger("MongoDBCodeGenerator").setLevel(logging.DEBUG))
+logger = logging.getLogger(__name__)
+# SpaCy's small English model is loaded lazily, once per process (see nlp_models.py)
 
 # Define specific SQL-related keywords and lists
 aggregation_functions = {"sum", "average", "min", "max", "count", "total"}
 
-# Define SQL action lists directly
-ping_join = {'combine', 'unite', 'aggregate', 'blend', 'mix', 'fuse', 'coalesce', 'meld', 
-             'merge', 'unify', 'connect', 'join', 'union', 'conjoin', 'link'}
-ping_select = {'choose', 'take', 'select', 'pick'}
+# Define SQL action lists directly. The join, select and sort verbs are extended with
+# their WordNet synonyms from the frozen table (see keyword_table.py)
+ping_join = expand_keywords("ping_join", {'combine', 'unite', 'aggregate', 'blend', 'mix', 'fuse', 'coalesce', 'meld', 
+             'merge', 'unify', 'connect', 'join', 'union', 'conjoin', 'link'})
+ping_select = expand_keywords("ping_select", {'choose', 'take', 'select', 'pick'})
 ping_where = {"where", "if", "when"}
 ping_conditions = {'equal', 'more', 'greater', 'less'}
 ping_group = {"group", "by", "for"}
-ping_order = {'arrange', 'order', 'organize', 'sort', 'descending', 'ascending'}
+ping_order = expand_keywords("ping_order", {'arrange', 'order', 'organize', 'sort', 'descending', 'ascending'})
 ping_agg = {"sum", "average", "min", "max", "count", "total"}
 ping_having = {"having", "with"}
 order_directions = {'ascending': 1, 'descending': -1}
 ping_from = {"from"}
 
-
-def find_table_and_column_names(query, api_data):
+# Keywords that end each clause
+match_exit_triggers = ping_agg | ping_group | ping_order | ping_join | ping_select | ping_from
+group_exit_triggers = {"select", "order", "sort", "from", "where", "having"}
+sort_exit_triggers = {"where", "group", "join", "aggregate", "select"}
+project_exit_triggers = {"from", "where", "group", "order", "join"}
+
+# Clauses found by the segmenter (see clause_segmenter.py). The $match stages read the
+# parsed tokens; the other stages read the whitespace-separated words of the query.
+# The group-by fields are read from the first group keyword to the end of the query.
+# The FROM and JOIN spans only tag word roles.
+mongo_clauses = (
+    clause_rule("match", "where", ping_where, match_exit_triggers, key="text"),
+    clause_rule("having", "having", ping_having, match_exit_triggers, key="text"),
+    clause_rule("group", "group", ping_group, key="text", stream="words"),
+    clause_rule("group_agg", "group", ping_agg, group_exit_triggers, key="text", stream="words"),
+    clause_rule("sort", "order", ping_order, sort_exit_triggers, key="text", stream="words"),
+    clause_rule("project", "select", ping_select, project_exit_triggers, key="lower_", stream="words"),
+    clause_rule("from", "from", ping_from, ping_where | {"group"} | ping_order | ping_having | ping_join, key="lower_", stream="words"),
+    clause_rule("lookup", "join", ping_join, ping_where | {"group"} | ping_order | ping_having, key="text", stream="words"),
+)
+
+
+@traced("mongo.find_tables")
+def find_table_and_column_names(query, api_data, schema_index=None):
     """
     Business Rules: 
     We only going to find/select coloumn names found in ther data. If not found we print a warning and print select *. 
@@ -57,34 +89,28 @@ def find_table_and_column_names(query, api_data):
     The code logic:
     Identify table and column names in the query based on API data.
     Returns a dictionary with table names as keys and lists of columns found as values.
+    The names are matched in one pass over the query by the schema index (see schema_index.py).
     """
-    detected_tables = [table for table in api_data['collections'] if table in query]
-    columns_for_tables = {}
-    print(f"collections in que: {detected_tables}")
-    
-
-    for table in detected_tables:
-        detected_columns = []  # Initialize an empty list for detected columns
-        for col in api_data[table]:  # Loop through each column in the current table
-            if col in query:  # Check if the column is in the query
-                detected_columns.append(col)  # Add the column to the detected list
-        if detected_columns:  # If any columns were detected
-            columns_for_tables[table] = detected_columns  # Add to the result dictionary
+    if schema_index is None:
+        schema_index = get_schema_index(api_data, "collections")
+    detected_tables, columns_for_tables = schema_index.find_tables_and_columns(query)
+    logger.debug("collections in que: %s", detected_tables)
 
 
     # Warning logic if no column names are found for detected tables
     if not columns_for_tables:
-        print("Warning: No column names found for detected tables.")
+        logger.warning("No column names found for detected tables.")
         columns_for_tables = {table: ["*"] for table in detected_tables}  # Default to SELECT * if no columns found
 
     # Default table_a if no tables found
     if not detected_tables:
-        print("Warning: No table names found. Using default 'table_a'.")
+        logger.warning("No table names found. Using default 'table_a'.")
         columns_for_tables = {"table_a": ["*"]}
 
     return detected_tables, columns_for_tables
 
 
+@traced("mongo.find_or_agg")
 def find_or_agg(query, detected_tables):
     '''
     If there is aggregate or join then were going to go with aggregate. If neither then were going to go with find.
@@ -92,14 +118,14 @@ def find_or_agg(query, detected_tables):
     
     # decide between agg or find
     query_tokens = query.split()
-    print(f"query tokens {query_tokens}")
+    logger.debug("query tokens %s", query_tokens)
     
-    print(f"{detected_tables}")
+    logger.debug("%s", detected_tables)
     
     ftab = detected_tables[0]
     
-    print(f"{detected_tables}")    
-    print(f"Found table: {ftab}")
+    logger.debug("%s", detected_tables)
+    logger.debug("Found table: %s", ftab)
     
     #base case
     element = "aggregate"
@@ -108,7 +134,7 @@ def find_or_agg(query, detected_tables):
     #     if word in ping_join or word in ping_agg:
     #         element  = "aggregate"
     #Check element
-    print(f"element: {element}")
+    logger.debug("element: %s", element)
     
     #output 
     execute = element
@@ -117,86 +143,88 @@ def find_or_agg(query, detected_tables):
     return execute, table_name
 
 
-def generate_match_clause(query, columns_for_tables, detected_tables):
+def clause_tokens(doc, span):
+    """
+    Return the parsed tokens of a clause span, without whitespace tokens.
+
+    Args:
+        doc (ParsedQuery): The parsed query.
+        span (tuple): The (start, end) span of the clause (see clause_segmenter.py), or None.
+
+    Returns:
+        list: The parsed tokens of the clause, empty if the clause is not in the query.
+    """
+    if span is None:
+        return []
+    start, end = span
+    return [token for token in doc[start:end] if not token.text.isspace()]
+
+
+@traced("mongo.match")
+def generate_match_clause(query, columns_for_tables, detected_tables, doc=None, segments=None):
     """
     Converts a SQL-like WHERE clause into a MongoDB $match clause.
     Produces a basic pipeline with the $match stage.
+    The parsed query (doc) and its clauses (segments) are computed here if not provided.
     """
-    import spacy
-    
-    nlp = spacy.load("en_core_web_sm")
-
     match_conditions = {}
     
     # Tokenize
-    query_tokens = query.split()
+    if segments is None:
+        if doc is None:
+            doc = parse_query(query)
+        segments = segment_query(query, doc, mongo_clauses)
     
     # Check to continue
-    contains_match = any(word in ping_where for word in query_tokens)
+    contains_match = segments.has(ping_where, key="text", stream="words")
 
-    print(f"Contains Match: {contains_match}")
+    logger.debug("Contains Match: %s", contains_match)
     
     if not contains_match:
-        print("No WHERE clause detected. Skipping processing.")
+        logger.debug("No WHERE clause detected. Skipping processing.")
         return []
 
     # Proceed with the rest of the processing as is
-    # Find the shortened query (stop at the first exit trigger)
-    exit_triggers = ping_agg | ping_group | ping_order | ping_join | ping_select | ping_from
-    
-    start_query = []
-    start_at_trigger = False
-    for word in query_tokens:
-        if word in ping_where:
-            start_at_trigger = True
-        if start_at_trigger:
-            start_query.append(word)
+    # Find the shortened query (start at the WHERE trigger, stop at the first exit trigger)
+    doc = segments.doc
 
-    start_query = " ".join(start_query)
-
-    print(f"Start Query: {start_query}", type(start_query))
-    print(f"Columns for Tables: {columns_for_tables}")
+    logger.debug("Columns for Tables: %s", columns_for_tables)
 
     # Shorten the query
-    short_query = []
-    for word in start_query.split():
-        if word in exit_triggers:
-            break
-        short_query.append(word)
+    short_tokens = clause_tokens(doc, segments.span("match"))
+    short_query = " ".join(token.text for token in short_tokens)
+    logger.debug("Shortened Query: %s %s", short_query, type(short_query))
 
-    short_query = " ".join(short_query)
-    print(f"Shortened Query: {short_query}", type(short_query))
+    # Remove stop words using the shared parse
+    tokens_without_stopwords = [token.text for token in short_tokens if not token.is_stop]
 
-    # Process the shortened query using NLP
-    doc = nlp(short_query)
-    tokens_without_stopwords = [token.text for token in doc if not token.is_stop]
-
-    print(f"Tokens without stopwords: {tokens_without_stopwords}")
+    logger.debug("Tokens without stopwords: %s", tokens_without_stopwords)
 
     # Check if any 'where' keyword is found in the query
     column_name = None
+    column_sets = get_column_sets(columns_for_tables)
     for token in tokens_without_stopwords:
         for table in detected_tables:
-            print(f"Checking if token '{token}' is a column in table '{table}'.")
-            if token in columns_for_tables.get(table, []):
+            logger.debug("Checking if token '%s' is a column in table '%s'.", token, table)
+            if token in column_sets.get(table, ()):
                 column_name = f"{token}"
-                print(f"Detected column name: {column_name}")
+                logger.debug("Detected column name: %s", column_name)
                 break
         if column_name:
             break
 
     if not column_name:
-        print(f"Available detected tables: {detected_tables}")
-        print(f"Available columns for detected tables: {columns_for_tables}")
-        print(f"Tokens being checked: {tokens_without_stopwords}")
+        logger.debug("Available detected tables: %s", detected_tables)
+        logger.debug("Available columns for detected tables: %s", columns_for_tables)
+        logger.debug("Tokens being checked: %s", tokens_without_stopwords)
     
-    if 'greater' in query_tokens:
+    if segments.has({'greater'}, key="text", stream="words"):
         tokens_without_stopwords.append('greater')
     
-    if 'less' in query_tokens:
+    if segments.has({'less'}, key="text", stream="words"):
         tokens_without_stopwords.append('less')
         
-    print(f"Tokens without stopwords2: {tokens_without_stopwords}")
+    logger.debug("Tokens without stopwords2: %s", tokens_without_stopwords)
 
     # Extract operator and value
     operator = None
@@ -208,7 +236,7 @@ def generate_match_clause(query, columns_for_tables, detected_tables):
     elif "less" in tokens_without_stopwords:
         operator = "$lt"
         
-    print(f"value:{value}, operator:{operator}")
+    logger.debug("value:%s, operator:%s", value, operator)
 
     # Extract the value (assumes the value is the last token)
     for token in tokens_without_stopwords:
@@ -217,7 +245,7 @@ def generate_match_clause(query, columns_for_tables, detected_tables):
         elif token.isalpha() and token not in {"equal", "greater", "less"}:
             value = token  # Text value
             
-    print(f"extracted col name: {column_name}")
+    logger.debug("extracted col name: %s", column_name)
 
     if operator and value is not None:
         match_conditions[column_name] = {operator: value}
@@ -226,7 +254,8 @@ def generate_match_clause(query, columns_for_tables, detected_tables):
 
     return {"$match": match_conditions}
 
-def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, ping_group):
+@traced("mongo.group")
+def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, ping_group, segments=None):
     """
     Generate the $group stage for a MongoDB aggregation pipeline based on the input query.
 
@@ -236,38 +265,33 @@ def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, p
         detected_tables (list): List of tables detected in the query.
         ping_agg (set): Set of aggregation keywords to check in the query.
         ping_group (set): Set of group-by keywords to check in the query.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         list: A MongoDB aggregation pipeline stage for $group.
     """
     # Tokenize the query
-    query_tokens = query.split()
+    if segments is None:
+        segments = segment_query(query, rules=mongo_clauses)
+    query_tokens = segments.words
 
-    print(f"Query Tokens: {query_tokens}")
+    logger.debug("Query Tokens: %s", query_tokens)
 
     # Check for grouping or aggregation presence
-    contains_group = any(word in ping_group for word in query_tokens)
-    contains_aggregation = any(word in ping_agg for word in query_tokens)
+    contains_group = segments.has(ping_group, key="text", stream="words")
+    contains_aggregation = segments.has(ping_agg, key="text", stream="words")
 
-    print(f"Contains Group: {contains_group}, Contains Aggregation: {contains_aggregation}")
+    logger.debug("Contains Group: %s, Contains Aggregation: %s", contains_group, contains_aggregation)
 
     # Continue only if grouping or aggregation is detected
     if not (contains_group or contains_aggregation):
-        print("Neither grouping nor aggregation detected. Skipping processing.")
+        logger.debug("Neither grouping nor aggregation detected. Skipping processing.")
         return []
 
-    # Short query to extract group-by fields
-    exit_triggers = {"select", "order", "sort", "from", "where", "having"}
-    start_query = []
-    start_at_trigger = False
-    for word in query_tokens:
-        if word in ping_group:
-            start_at_trigger = True
-        if start_at_trigger:
-            start_query.append(word)
-
-    start_query = " ".join(start_query)
-    print(f"Start Query: {start_query}", type(start_query))
+    # Short query to extract group-by fields (from the first group keyword to the end of the query)
+    group_span = segments.span("group")
+    start_query = " ".join(query_tokens[group_span[0]:]) if group_span else ""
+    logger.debug("Start Query: %s %s", start_query, type(start_query))
 
     # Detect group-by columns
     detected_columns = []
@@ -276,36 +300,20 @@ def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, p
             if column in start_query:
                 detected_columns.append((table, column))
 
-    print(f"Detected Columns: {detected_columns}", f"type: {type(detected_columns)}")
+    logger.debug("Detected Columns: %s type: %s", detected_columns, type(detected_columns))
 
     # Group-by field
     group_by_field = f"${detected_columns[0][1]}" if detected_columns else None
 
-    # Detect aggregation fields
-    start_agg = []
-    start_agg_trigger = False
-    for word in query_tokens:
-        if word in ping_agg:
-            start_agg_trigger = True
-        if start_agg_trigger:
-            start_agg.append(word)
-
-    start_agg = " ".join(start_agg)
-    print(f"Start Aggregation Query: {start_agg}", type(start_agg))
-
-    # Shorten aggregation query
-    short_agg = []
-    for word in start_agg.split():
-        if word in exit_triggers:
-            break
-        short_agg.append(word)
+    # Detect aggregation fields (from the first aggregation keyword up to the next exit trigger)
+    agg_span = segments.span("group_agg")
+    short_agg_tokens = query_tokens[agg_span[0]:agg_span[1]] if agg_span else []
 
-    short_agg = " ".join(short_agg)
-    print(f"Shortened Aggregation Query: {short_agg}", type(short_agg))
+    short_agg = " ".join(short_agg_tokens)
+    logger.debug("Shortened Aggregation Query: %s %s", short_agg, type(short_agg))
 
     # Process the shortened aggregation query
     agg_function = None
-    short_agg_tokens = short_agg.split()
     aggregation_fields = {}
 
     # Fetch all columns from detected tables
@@ -313,34 +321,42 @@ def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, p
     for table in detected_tables:
         relevant_columns.extend(columns_for_tables.get(table, []))
 
-    print(f"Relevant Columns for Aggregation: {relevant_columns}")
+    logger.debug("Relevant Columns for Aggregation: %s", relevant_columns)
+
+    # The next relevant column after each word, found in one pass from the end
+    relevant_column_set = set(relevant_columns)
+    next_columns = [None] * len(short_agg_tokens)
+    next_column = None
+    for i in range(len(short_agg_tokens) - 1, -1, -1):
+        next_columns[i] = next_column
+        if short_agg_tokens[i] in relevant_column_set:
+            next_column = short_agg_tokens[i]
 
     for i, word in enumerate(short_agg_tokens):
         if word in ping_agg:  # Check for aggregation function
             agg_function = word
             agg_field = None
 
-            print(f"agg_function: {agg_function}")
+            logger.debug("agg_function: %s", agg_function)
 
             # Look for the field to aggregate on
-            for next_word in short_agg_tokens[i + 1:]:
-                if next_word in relevant_columns:  # Match column from relevant columns
-                    agg_field = f"${next_word}"  # Use the first detected table
-
-                    # Map to MongoDB aggregation functions
-                    if agg_function == "sum":
-                        aggregation_fields[f"total_{next_word}"] = {"$sum": agg_field}
-                    elif agg_function == "average":
-                        aggregation_fields[f"avg_{next_word}"] = {"$avg": agg_field}
-                    elif agg_function == "count":
-                        aggregation_fields["count"] = {"$sum": 1}  # MongoDB count approximation
-
-                    # Debug output
-                    print(f"DEBUG: Aggregation Field: {agg_field}, Function: {agg_function}")
-                    break  # Exit loop once field is matched
+            next_word = next_columns[i]
+            if next_word is not None:  # Match column from relevant columns
+                agg_field = f"${next_word}"  # Use the first detected table
+
+                # Map to MongoDB aggregation functions
+                if agg_function == "sum":
+                    aggregation_fields[f"total_{next_word}"] = {"$sum": agg_field}
+                elif agg_function == "average":
+                    aggregation_fields[f"avg_{next_word}"] = {"$avg": agg_field}
+                elif agg_function == "count":
+                    aggregation_fields["count"] = {"$sum": 1}  # MongoDB count approximation
+
+                # Debug output
+                logger.debug("Aggregation Field: %s, Function: %s", agg_field, agg_function)
 
     # Final debug output
-    print("Final Aggregation Fields:", aggregation_fields)
+    logger.debug("Final Aggregation Fields: %s", aggregation_fields)
 
     # Construct the $group stage
     group_stage = {
@@ -350,10 +366,11 @@ def generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, p
         }
     }
 
-    print("Generated $group Stage:", group_stage)
+    logger.debug("Generated $group Stage: %s", group_stage)
     return [group_stage]
 
-def generate_sort_clause(query, detected_tables, columns_for_tables, ping_order, order_directions):
+@traced("mongo.sort")
+def generate_sort_clause(query, detected_tables, columns_for_tables, ping_order, order_directions, segments=None):
     """
     Generate a MongoDB $sort clause based on the user query.
 
@@ -363,49 +380,45 @@ def generate_sort_clause(query, detected_tables, columns_for_tables, ping_order,
         columns_for_tables (dict): Dictionary of detected tables and their corresponding columns.
         ping_order (set): Set of keywords that indicate sorting.
         order_directions (dict): Dictionary mapping sort direction keywords to MongoDB direction values.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         dict: MongoDB $sort clause in the correct format.
     """
     # Split the query into words for processing
-    words = query.split()
+    if segments is None:
+        segments = segment_query(query, rules=mongo_clauses)
+    words = segments.words
     sort_columns = []
     direction = 1  # Default to ascending
-    exit_triggers = {"where", "group", "join", "aggregate", "select"}
     
     # Check if the query contains sorting keywords
-    if not any(word in ping_order for word in words):
-        print("No sorting keyword detected in the query. Exiting.")
+    if not segments.has(ping_order, key="text", stream="words"):
+        logger.debug("No sorting keyword detected in the query. Exiting.")
         return None  # Exit if no sorting keyword is detected
     
-    # Detect projection trigger and shorten query
-    shortened_query = []
-    for idx, word in enumerate(words):
-        if word in ping_order:
-            for word_after in words[idx + 1:]:
-                if word_after in exit_triggers:
-                    break
-                shortened_query.append(word_after)
-            break
-    print(f"Shortened Query (raw): {shortened_query}")
+    # Detect projection trigger and shorten query (the words after it, up to the next exit trigger)
+    sort_span = segments.span("sort")
+    shortened_query = words[sort_span[0] + 1:sort_span[1]] if sort_span else []
+    logger.debug("Shortened Query (raw): %s", shortened_query)
     
     # Filter out stop words
     filtered_query = shortened_query  # Simplified for clarity
-    print(f"Filtered Query: {filtered_query}")
+    logger.debug("Filtered Query: %s", filtered_query)
     
     # Identify columns for sorting
     sort_columns = []
+    column_sets = get_column_sets(columns_for_tables)
     for word in filtered_query:
         for table in detected_tables:
-            if word in columns_for_tables.get(table, []):
+            if word in column_sets.get(table, ()):
                 sort_columns.append(word)
                 break  # Stop searching once a match is found for this word
     
     # Detect sorting direction in the query
-    for word in words:
-        if word in order_directions:
-            direction = order_directions[word]
-            break
+    direction_index = segments.find(order_directions, key="text", stream="words")
+    if direction_index is not None:
+        direction = order_directions[words[direction_index]]
     
     # Special handling for grouped fields (_id)
     if "group" in query and "by" in query:
@@ -421,10 +434,11 @@ def generate_sort_clause(query, detected_tables, columns_for_tables, ping_order,
             # Default case: Sort by `_id` if no valid columns detected
             result = {"$sort": {"_id": direction}}
     
-    print(f"Generated $sort clause: {result}")
+    logger.debug("Generated $sort clause: %s", result)
     return result
 
-def generate_have_clause(query, columns_for_tables, detected_tables, group_stage):
+@traced("mongo.having")
+def generate_have_clause(query, columns_for_tables, detected_tables, group_stage, doc=None, segments=None):
     """
     Converts a SQL-like HAVING clause into a MongoDB $match clause using the outputs of a $group stage.
     Produces a $match stage for the pipeline.
@@ -434,54 +448,39 @@ def generate_have_clause(query, columns_for_tables, detected_tables, group_stage
         columns_for_tables (dict): Detected tables and their columns.
         detected_tables (list): List of detected tables in the query.
         group_stage (dict): The output of a $group stage to reference aggregated fields.
+        doc (ParsedQuery): The parsed query. Parsed here if not provided.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         dict: A MongoDB $match clause.
     """
-    import spacy
-    
-    nlp = spacy.load("en_core_web_sm")
-
     match_conditions = {}
     
     # Tokenize the query
-    query_tokens = query.split()
+    if segments is None:
+        if doc is None:
+            doc = parse_query(query)
+        segments = segment_query(query, doc, mongo_clauses)
 
     # Check for HAVING clause trigger
-    contains_have = any(word in ping_having for word in query_tokens)
-    print(f"HAVING: Ping list? {contains_have}")
+    contains_have = segments.has(ping_having, key="text", stream="words")
+    logger.debug("HAVING: Ping list? %s", contains_have)
 
     if not contains_have:
-        print("No HAVING clause detected. Skipping processing.")
+        logger.debug("No HAVING clause detected. Skipping processing.")
         return []
 
-    # Find the shortened query after HAVING
-    exit_triggers = ping_agg | ping_group | ping_order | ping_join | ping_select | ping_from
-    start_query = []
-    start_at_trigger = False
-    for word in query_tokens:
-        if word in ping_having:
-            start_at_trigger = True
-        if start_at_trigger:
-            start_query.append(word)
-
-    start_query = " ".join(start_query)
-    print(f"Start Query: {start_query}")
+    # Find the shortened query after HAVING (up to the first exit trigger)
+    doc = segments.doc
 
     # Shorten the query to remove exit triggers
-    short_query = []
-    for word in start_query.split():
-        if word in exit_triggers:
-            break
-        short_query.append(word)
+    short_tokens = clause_tokens(doc, segments.span("having"))
+    short_query = " ".join(token.text for token in short_tokens)
+    logger.debug("Shortened Query: %s", short_query)
 
-    short_query = " ".join(short_query)
-    print(f"Shortened Query: {short_query}")
-
-    # Process the shortened query using NLP
-    doc = nlp(short_query)
-    tokens_without_stopwords = [token.text for token in doc if not token.is_stop]
-    print(f"Tokens without stopwords: {tokens_without_stopwords}")
+    # Remove stop words using the shared parse
+    tokens_without_stopwords = [token.text for token in short_tokens if not token.is_stop]
+    logger.debug("Tokens without stopwords: %s", tokens_without_stopwords)
  # Extract necessary components for $match
     if len(tokens_without_stopwords) < 3:
         raise ValueError("Insufficient tokens to construct a HAVING clause.")
@@ -501,12 +500,13 @@ def generate_have_clause(query, columns_for_tables, detected_tables, group_stage
 
     # Construct the $match condition
     match_conditions[field_name] = {operator: value}
-    print(f"Constructed HAVING $match condition: {match_conditions}")
+    logger.debug("Constructed HAVING $match condition: %s", match_conditions)
 
     return {"$match": match_conditions}
 
 
-def generate_project_clause(query, columns_for_tables, detected_tables, group_stage, execute):
+@traced("mongo.project")
+def generate_project_clause(query, columns_for_tables, detected_tables, group_stage, execute, segments=None):
     """
     Generate a MongoDB $project clause based on the query and conditions.
 
@@ -516,6 +516,7 @@ def generate_project_clause(query, columns_for_tables, detected_tables, group_st
         columns_for_tables (dict): A dictionary of detected tables and their respective columns.
         detected_tables (list): A list of tables detected in the query.
         execute (str): Determines the type of operation ('aggregate' or 'find').
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         dict: The MongoDB $project clause with a flag indicating the processing path.
@@ -526,7 +527,7 @@ def generate_project_clause(query, columns_for_tables, detected_tables, group_st
     # Step 1: Always Include Grouping Field in the $project Clause (if exists)
     if group_stage and len(group_stage) > 0 and "$group" in group_stage[0] and execute == "aggregate":
         group_fields = group_stage[0]["$group"]
-        print(f"1. group_fields: {group_fields}")
+        logger.debug("1. group_fields: %s", group_fields)
  
         # Include grouping field (_id) in the project clause
         if "_id" in group_fields:
@@ -538,7 +539,7 @@ def generate_project_clause(query, columns_for_tables, detected_tables, group_st
             else:
                 project_clause["grouped_by"] = "$_id"
 
-        print(f"2. Project clause 1: {project_clause}")
+        logger.debug("2. Project clause 1: %s", project_clause)
 
         # Include all other aggregated fields in the project clause
         for field in group_fields:
@@ -548,43 +549,35 @@ def generate_project_clause(query, columns_for_tables, detected_tables, group_st
         project_clause["_id"] = 0
         processing_path = "aggregation"
         
-        print(f"3. Project clause 2: {project_clause}")
+        logger.debug("3. Project clause 2: %s", project_clause)
 
     # Step 2: Fallback to Column Detection if `project_clause` is Empty or if `execute == 'find'`
     if not project_clause or execute == "find":
-        query_lower = query.lower()
-        query_tokens = query_lower.split()
-        print(f"check project from agg: {project_clause}")
+        if segments is None:
+            segments = segment_query(query, rules=mongo_clauses)
+        query_tokens = segments.lower_words
+        logger.debug("check project from agg: %s", project_clause)
 
         # Shorten the query: Extract everything after `SELECT` and stop at `FROM` or other exit triggers
-        exit_triggers = {"from", "where", "group", "order", "join"}
         shortened_query = []
-        start_query = []
-        start_collecting = False
-        for word in query_tokens:
-            # Start collecting after a `ping_select` keyword
-            if word in ping_select:
-                start_collecting = True
-                start_query.append(word)
-                continue
-
-            # Stop collecting at an exit trigger
-            if start_collecting and word in exit_triggers:
-                break
-            if start_collecting:
-                shortened_query.append(word)
+        project_span = segments.span("project")
+        if project_span:
+            # Skip the further `ping_select` keywords of the clause
+            shortened_query = [word for word in query_tokens[project_span[0] + 1:project_span[1]]
+                               if word not in ping_select]
 
         shortened_query = " ".join(shortened_query).strip()
-        print(f"Project Shortened Query: {shortened_query}")
+        logger.debug("Project Shortened Query: %s", shortened_query)
 
         # Detect columns in the shortened query
+        shortened_words = set(shortened_query.split())
         detected_columns = []
         for table in detected_tables:
             for column in columns_for_tables.get(table, []):
-                if column in shortened_query.split():  # Match columns in the shortened query
+                if column in shortened_words:  # Match columns in the shortened query
                     detected_columns.append((table, column))
 
-        print(f"Detected Columns: {detected_columns}")
+        logger.debug("Detected Columns: %s", detected_columns)
 
         # Add detected columns to the $project clause
         for table, column in detected_columns:
@@ -594,11 +587,12 @@ def generate_project_clause(query, columns_for_tables, detected_tables, group_st
         project_clause["_id"] = 0
         processing_path = "default_select" if execute == "find" else "aggregation_fallback"
     
-    print(f"Processed By: {processing_path}")
+    logger.debug("Processed By: %s", processing_path)
     return {"$project": project_clause}
 
 
-def generate_lookup_clause(query, api_data, ping_join):
+@traced("mongo.lookup")
+def generate_lookup_clause(query, api_data, ping_join, schema_index=None, segments=None):
     """
     Generate a MongoDB $lookup clause for joining two tables based on a natural language query.
 
@@ -606,6 +600,8 @@ def generate_lookup_clause(query, api_data, ping_join):
         query (str): The input query string.
         api_data (dict): API dictionary containing table names and their columns.
         ping_join (set): Set of keywords indicating a join operation.
+        schema_index (SchemaIndex): The index of api_data. Looked up here if not provided.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         list: A MongoDB $lookup stage and any subsequent stages for the pipeline,
@@ -613,23 +609,24 @@ def generate_lookup_clause(query, api_data, ping_join):
     """
 
     # Tokenize the query
-    words = query.split()  # Basic tokenization for simplicity
+    if segments is None:
+        segments = segment_query(query, rules=mongo_clauses)
+    words = segments.words  # Basic tokenization for simplicity
     
     # Step 1: Check for ping join keywords
-    if any(word in ping_join for word in words):
-        print("Ping join keyword found. Proceeding with query analysis.")
+    if segments.has(ping_join, key="text", stream="words"):
+        logger.debug("Ping join keyword found. Proceeding with query analysis.")
     else:
-        print("No ping join keyword detected in the query. Exiting.")
+        logger.debug("No ping join keyword detected in the query. Exiting.")
         return None  # Exit if no keyword from ping_join is detected
     
     # Step 2: Detect all known tables in the query
-    detected_tables = []  # To store identified table names
-    for word in words:
-        if word in api_data['collections']:
-            detected_tables.append(word)
-            detected_tables = list(dict.fromkeys(detected_tables))  # Remove duplicates
+    if schema_index is None:
+        schema_index = get_schema_index(api_data, "collections")
+    detected_tables = [word for word in words if schema_index.has_table(word)]  # To store identified table names
+    detected_tables = list(dict.fromkeys(detected_tables))  # Remove duplicates
             
-    print(f"dec tables {detected_tables}")
+    logger.debug("dec tables %s", detected_tables)
 
     # Step 3: Handle scenarios for detected tables
     table_count = len(detected_tables)
@@ -640,19 +637,18 @@ def generate_lookup_clause(query, api_data, ping_join):
 
         # Step 4: Find the ON condition
         join_condition = None
-        for idx, word in enumerate(words):
-            if word.lower() == "on":
-                # Look for the column name following "ON"
-                if idx + 1 < len(words):
-                    potential_column = words[idx + 1]
-                    if (potential_column in api_data[primary_table] and
-                            potential_column in api_data[secondary_table]):
-                        join_condition = potential_column
-                        break
+        for idx in segments.positions("on", key="lower_", stream="words"):
+            # Look for the column name following "ON"
+            if idx + 1 < len(words):
+                potential_column = words[idx + 1]
+                if (schema_index.has_column(primary_table, potential_column) and
+                        schema_index.has_column(secondary_table, potential_column)):
+                    join_condition = potential_column
+                    break
 
         # Default to 'id' if no condition is found
         if not join_condition:
-            print(f"WARNING: No ON condition found for {primary_table} and {secondary_table}. Defaulting to 'id'.")
+            logger.warning("No ON condition found for %s and %s. Defaulting to 'id'.", primary_table, secondary_table)
             join_condition = "id"
 
         # Step 5: Generate the $lookup stage
@@ -667,7 +663,7 @@ def generate_lookup_clause(query, api_data, ping_join):
 
         return [lookup_stage]
     else:
-        print("Insufficient tables detected for a join operation.")
+        logger.debug("Insufficient tables detected for a join operation.")
         return None
 
 def assemble_pipeline(*pipeline_stages):
@@ -692,6 +688,54 @@ def assemble_pipeline(*pipeline_stages):
     return pipeline
 
 
+def apply_result_budget(pipeline, limit):
+    """
+    Push a result budget into an assembled pipeline so that only the documents and
+    fields that are rendered leave the database.
+
+    1. A trailing $project that keeps every field a preceding $sort reads is moved
+       ahead of that $sort, so the sort works on the projected documents.
+    2. A $limit stage is placed after the last stage that decides which documents
+       are returned and before the trailing $project.
+
+    Args:
+        pipeline (list): The assembled pipeline.
+        limit (int): The maximum number of documents to return. None or 0 leaves
+            the pipeline unchanged.
+
+    Returns:
+        list: The pipeline with the budget applied.
+    """
+    if not limit:
+        return pipeline
+
+    pipeline = list(pipeline)
+
+    # Step 1: Move the trailing $project ahead of the $sort stages it does not affect
+    if pipeline and "$project" in pipeline[-1]:
+        project_stage = pipeline.pop()
+        projected_fields = {field for field, value in project_stage["$project"].items() if value not in (0, False)}
+
+        project_index = len(pipeline)
+        while project_index > 0:
+            previous_stage = pipeline[project_index - 1]
+            if "$sort" in previous_stage and set(previous_stage["$sort"]) <= projected_fields:
+                project_index -= 1
+            else:
+                break
+
+        pipeline.insert(project_index, project_stage)
+
+    # Step 2: Place $limit before the trailing $project
+    limit_index = len(pipeline)
+    if limit_index > 0 and "$project" in pipeline[-1]:
+        limit_index -= 1
+
+    pipeline.insert(limit_index, {"$limit": int(limit)})
+
+    return pipeline
+
+
 # Example usage
 
 '''
@@ -718,13 +762,54 @@ find/aggregate
 
 # print(execute_on, pipeline)
 
-def mongo_compile(api_data, query):
+@traced("mongo.generate")
+def mongo_compile(api_data, query, limit=None):
     """
-    Compile a MongoDB query pipeline and determine execution context.
+    Compile a MongoDB query pipeline, reusing cached translations.
+
+    The query is normalized (whitespace collapsed) before it is compiled, and the
+    result is cached by normalized query text and schema fingerprint.
 
     Args:
         api_data (dict): The metadata of available tables and columns.
         query (str): The query string to process.
+        limit (int): Optional result budget, pushed into the pipeline as a $limit stage.
+
+    Returns:
+        tuple: (execute, table_name, pipeline) as returned by translate_mongo_query.
+    """
+    cache_key = translation_cache.make_key("mongo", query, api_data, limit)
+    hit, compiled = translation_cache.get(cache_key)
+    if hit:
+        return compiled
+
+    compiled = translate_mongo_query(api_data, normalize_query(query), limit)
+    translation_cache.put(cache_key, compiled)
+
+    return compiled
+
+
+def fast_parse(query, schema_index):
+    """
+    Tag a templated question with the fast path instead of the spaCy model (see fast_path.py).
+    The stages only read the text and lexical flags of the tokens, so no check is needed.
+
+    Returns:
+        ParsedQuery: The parsed query, or None if the question needs the full NLP path.
+    """
+    return fast_path.parse(query, schema_index, "mongo")
+
+
+@traced("mongo.translate")
+def translate_mongo_query(api_data, query, limit=None, doc=None):
+    """
+    Compile a MongoDB query pipeline and determine execution context (without the translation cache).
+
+    Args:
+        api_data (dict): The metadata of available tables and columns.
+        query (str): The query string to process.
+        limit (int): Optional result budget, pushed into the pipeline (see apply_result_budget).
+        doc (ParsedQuery): Optional parsed query (see batch_translate). Parsed here if not given.
 
     Returns:
         tuple: A tuple containing:
@@ -732,22 +817,37 @@ def mongo_compile(api_data, query):
             - pipeline (list): The MongoDB pipeline to execute.
     """
     # Step 1: Detect tables and columns
-    detected_tables, columns_for_tables = find_table_and_column_names(query, api_data)
+    schema_index = get_schema_index(api_data, "collections")
+    detected_tables, columns_for_tables = find_table_and_column_names(query, api_data, schema_index)
 
     # Step 2: Determine execution context
     execute, table_name = find_or_agg(query, detected_tables)
 
+    # Parse the query once and share the parsed tokens with the pipeline stages;
+    # templated questions are tagged by the fast path, the others by the spaCy model
+    if doc is None:
+        doc = fast_parse(query, schema_index)
+    if doc is None:
+        doc = parse_query(query)
+
+    # Segment the query into clauses once; every stage reads its span
+    segments = segment_query(query, doc, mongo_clauses)
+    logger.debug("Clause roles: %s", segments.word_roles)
+
     # Step 3: Generate stages
-    pipe_group = generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, ping_group)
-    pipe_match = generate_match_clause(query, columns_for_tables, detected_tables)
-    pipe_sort = generate_sort_clause(query, detected_tables, columns_for_tables, ping_order, order_directions)
-    pipe_have = generate_have_clause(query, columns_for_tables, detected_tables, group_stage= pipe_group)
-    pipe_proj =  generate_project_clause(query, columns_for_tables, detected_tables, group_stage= pipe_group, execute = execute)
-    pipe_look = generate_lookup_clause(query, api_data, ping_join)
+    pipe_group = generate_group_stage(query, columns_for_tables, detected_tables, ping_agg, ping_group, segments)
+    pipe_match = generate_match_clause(query, columns_for_tables, detected_tables, doc, segments)
+    pipe_sort = generate_sort_clause(query, detected_tables, columns_for_tables, ping_order, order_directions, segments)
+    pipe_have = generate_have_clause(query, columns_for_tables, detected_tables, group_stage= pipe_group, doc=doc, segments=segments)
+    pipe_proj =  generate_project_clause(query, columns_for_tables, detected_tables, group_stage= pipe_group, execute = execute, segments=segments)
+    pipe_look = generate_lookup_clause(query, api_data, ping_join, schema_index, segments)
 
     # Step 4: Assemble the pipeline
     pipeline = assemble_pipeline(pipe_match, pipe_look, pipe_group, pipe_sort, pipe_have, pipe_proj)
 
+    # Step 5: Push the result budget into the pipeline
+    pipeline = apply_result_budget(pipeline, limit)
+
     return execute, table_name, pipeline
 
 # my_data = {'collections': ['salaries', 'loan', 'purchases'], 'salaries': ['work_year', 'person_gender', 'experience_level', 'employment_type', 'job_title', 'salary', 'income_class', 'salary_currency', 'salary_in_usd', 'employee_residence', 'remote_ratio', 'company_location', 'company_size'], 
@@ -9,48 +9,130 @@ Expected input:
         }
 
 Process Details:
+The query is parsed once by "generate_sql_query" (see query_parser.py) and the
+parsed query (doc) is shared by every clause generator (templated questions are
+tagged by the rule-based fast path instead, see fast_path.py). The parsed query is then
+segmented into clauses in one pass (see clause_segmenter.py and sql_clauses), and
+each clause generator reads its clause span from the segmented query (segments).
 Seven functions results compiled into string by "generate_sql_query" function.
     1. find_table_and_column_names(query, api_data)
-    2. generate_select_clause(query, api_data, columns_for_tables, detected_tables)
-    3. generate_from_and_joins(query, api_data, ping_join)  # Pass the query and columns_for_tables
-    4. generate_where_clause(query, columns_for_tables, detected_tables)
-    5. generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg)
-    6. generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause)
-    7. generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts)
+    2. generate_select_clause(query, api_data, columns_for_tables, detected_tables, doc, segments)
+    3. generate_from_and_joins(query, api_data, ping_join, doc, schema_index, segments)
+    4. generate_where_clause(query, columns_for_tables, detected_tables, doc, segments)
+    5. generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg, doc, segments)
+    6. generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause, doc, segments)
+    7. generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts, doc, segments)
     
 Output:
 String = sql_query
 
 '''
-import spacy
-import nltk
-from spacy.lang.en.stop_words import STOP_WORDS
-from nltk.corpus import wordnet
+import logging
 from collections import Counter
+from clause_segmenter import clause_rule, segment_query
+from fast_path import fast_path
+from keyword_table import expand_keywords
+from query_parser import parse_query
+from schema_index import get_column_sets, get_schema_index
+from tracing import traced
+from translation_cache import normalize_query, translation_cache
 
-# Load SpaCy's small English model
-nlp = spacy.load("en_core_web_sm")
+# Debug output of the clause generators (enable with logging.getLogger("SQLCodeGenerator").setLevel(logging.DEBUG))
+logger = logging.getLogger(__name__)
 
-# Download WordNet data if not already downloaded
-nltk.download("wordnet")
+# SpaCy's small English model is loaded lazily, once per process (see nlp_models.py)
 
 # Define specific SQL-related keywords and lists
 aggregation_functions = {"sum", "average", "min", "max", "count", "total"}
 
-# Define SQL action lists directly
-ping_join = {'combine', 'unite', 'aggregate', 'blend', 'mix', 'fuse', 'coalesce', 'meld', 
-             'merge', 'unify', 'connect', 'join', 'union', 'conjoin', 'link'}
-ping_select = {'choose', 'take', 'select', 'pick'}
+# Define SQL action lists directly. The join, select and sort verbs are extended with
+# their WordNet synonyms from the frozen table (see keyword_table.py)
+ping_join = expand_keywords("ping_join", {'combine', 'unite', 'aggregate', 'blend', 'mix', 'fuse', 'coalesce', 'meld', 
+             'merge', 'unify', 'connect', 'join', 'union', 'conjoin', 'link'})
+ping_select = expand_keywords("ping_select", {'choose', 'take', 'select', 'pick'})
 ping_where = {"where", "if", "when"}
 ping_conditions = {'equal', 'more', 'greater', 'less'}
 ping_group = {"group", "by", "for"}
-ping_order = {'arrange', 'order', 'organize', 'sort', 'descending', 'ascending'}
+ping_order = expand_keywords("ping_order", {'arrange', 'order', 'organize', 'sort', 'descending', 'ascending'})
 ping_agg = {"sum", "average", "min", "max", "count", "total"}
 ping_having = {"having", "with"}
 ping_from = {"from"}
 
+# Keywords that end the SELECT list (and the columns of its aggregation) and the GROUP BY clause
+select_exit_triggers = ping_where | ping_group | ping_order | ping_join
+group_exit_triggers = {"select", "sum", "order", "sort", "from", "where", "having"}
+
+# Clauses found by the segmenter in one pass over the parsed query (see clause_segmenter.py).
+# The WHERE and HAVING clauses run to the end of the query. The GROUP BY clause starts at
+# "group", else at "by", else at "for". The FROM, JOIN and ORDER BY spans only tag token roles.
+sql_clauses = (
+    clause_rule("select", "select", ping_select, select_exit_triggers),
+    clause_rule("select_agg", "select", aggregation_functions, select_exit_triggers),
+    clause_rule("from", "from", ping_from, ping_where | {"group"} | ping_order | ping_having | ping_join),
+    clause_rule("join", "join", ping_join, ping_where | {"group"} | ping_order | ping_having),
+    clause_rule("where", "where", ping_where),
+    clause_rule("group", "group", {"group"}, group_exit_triggers, key="lower_"),
+    clause_rule("group_by", "group", {"by"}, group_exit_triggers, key="lower_"),
+    clause_rule("group_for", "group", {"for"}, group_exit_triggers, key="lower_"),
+    clause_rule("having", "having", ping_having, key="lower_"),
+    clause_rule("order", "order", ping_order, ping_where | {"group"} | ping_having | ping_join),
+)
+
+
+def check_fast_parse(query, doc, schema_index):
+    """
+    Decline the fast path (see fast_path.py) for the questions whose SQL depends on tags of the model.
+
+    Args:
+        query (str): The natural language query.
+        doc (ParsedQuery): The query tagged by the fast path.
+        schema_index (SchemaIndex): The index of api_data.
+
+    Returns:
+        str: The reason to use the full NLP path, or None if the fast path translation is exact.
+    """
+    segments = segment_query(query, doc, sql_clauses)
+
+    # Before the sort keyword, whether "descending"/"ascending" end a clause depends on their lemma
+    order_span = segments.span("order")
+    for direction in ("descending", "ascending"):
+        for index in segments.positions(direction):
+            if order_span is None or index < order_span[0]:
+                return "sort direction before the sort keyword"
+
+    # Without a known column, GROUP BY falls back to the first noun found by the tagger
+    group_span = segments.span("group") or segments.span("group_by") or segments.span("group_for")
+    if group_span:
+        _, columns_for_tables = schema_index.find_tables_and_columns(query)
+        columns = {column for columns in columns_for_tables.values() for column in columns}
+        start, end = group_span
+        if not any(token.lower_ in columns for token in doc[start:end] if not token.is_stop):
+            return "group by without a column"
+
+    # HAVING only takes a noun as its value, and literals may be tagged as adjectives by the model
+    having_span = segments.span("having")
+    if having_span:
+        start, end = having_span
+        for token in doc[start + 1:end]:
+            if token.pos_ in {"NOUN", "PROPN"} and not (token.text in schema_index.column_tables
+                                                        or schema_index.has_table(token.text)):
+                return "literal in the having clause"
+
+    return None
+
+
+def fast_parse(query, schema_index):
+    """
+    Tag a templated question with the fast path instead of the spaCy model.
 
-def find_table_and_column_names(query, api_data):
+    Returns:
+        ParsedQuery: The parsed query, or None if the question needs the full NLP path.
+    """
+    return fast_path.parse(query, schema_index, "sql", check=check_fast_parse)
+
+
+@traced("sql.find_tables")
+def find_table_and_column_names(query, api_data, schema_index=None):
     """
     Business Rules: 
     We only going to find/select coloumn names found in ther data. If not found we print a warning and print select *. 
@@ -58,28 +140,26 @@ def find_table_and_column_names(query, api_data):
     The code logic:
     Identify table and column names in the query based on API data.
     Returns a dictionary with table names as keys and lists of columns found as values.
+    The names are matched in one pass over the query by the schema index (see schema_index.py).
     """
-    detected_tables = [table for table in api_data['tables'] if table in query]
-    columns_for_tables = {}
-
-    for table in detected_tables:
-        detected_columns = [col for col in api_data[table] if col in query]
-        if detected_columns:
-            columns_for_tables[table] = detected_columns
+    if schema_index is None:
+        schema_index = get_schema_index(api_data, "tables")
+    detected_tables, columns_for_tables = schema_index.find_tables_and_columns(query)
 
     # Warning logic if no column names are found for detected tables
     if not columns_for_tables:
-        print("Warning: No column names found for detected tables.")
+        logger.warning("No column names found for detected tables.")
         columns_for_tables = {table: ["*"] for table in detected_tables}  # Default to SELECT * if no columns found
 
     # Default table_a if no tables found
     if not detected_tables:
-        print("Warning: No table names found. Using default 'table_a'.")
+        logger.warning("No table names found. Using default 'table_a'.")
         columns_for_tables = {"table_a": ["*"]}
 
     return detected_tables, columns_for_tables
 
-def generate_select_clause(query, api_data, columns_for_tables, detected_tables):
+@traced("sql.select")
+def generate_select_clause(query, api_data, columns_for_tables, detected_tables, doc=None, segments=None):
     """
     Generate the SELECT clause of an SQL query based on a natural language query.
 
@@ -96,53 +176,46 @@ def generate_select_clause(query, api_data, columns_for_tables, detected_tables)
         api_data (dict): API data containing table names and their columns.
         columns_for_tables (dict): A dictionary of detected tables and their respective columns.
         detected_tables (list): A list of tables detected in the query.
+        doc (ParsedQuery): The parsed query. Parsed here if not provided.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         str: The SQL SELECT clause.
         list: A list of selected columns.
     """
     select_clause_parts = []
-    doc = nlp(query)
-
-    # Define clause triggers
-    select_triggers = ping_select
-    exit_triggers = ping_where | ping_group | ping_order | ping_join
+    if doc is None:
+        doc = parse_query(query)
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
+    column_sets = get_column_sets(columns_for_tables)
 
-    # Step 1: Detect SELECT trigger and shorten query
+    # Step 1: Detect SELECT trigger and shorten query (up to the next WHERE, GROUP, ORDER or JOIN keyword)
     shortened_query = ""
-    select_trigger_found = False
-    for idx, token in enumerate(doc):
-        if token.lemma_ in select_triggers:
-            select_trigger_found = True
-
-            for token_after in doc[idx:]:
-                if token_after.lemma_ in exit_triggers:
-                    break
-                shortened_query += token_after.text + " "
-            shortened_query = shortened_query.strip()
-       
-            break
+    select_span = segments.span("select")
+    select_trigger_found = select_span is not None
+    if select_trigger_found:
+        start, end = select_span
+        shortened_query = " ".join(token.text for token in doc[start:end]).strip()
 
     # Step 2: Look for known column names in shortened query
     if shortened_query:
+        shortened_words = set(shortened_query.split())
         for table, columns in columns_for_tables.items():
             for col in columns:
-                if col in shortened_query.split():
+                if col in shortened_words:
                     select_clause_parts.append(f"{table}.{col}")
 
-    # Step 3: Check for aggregation functions
-    if any(token.lemma_ in aggregation_functions for token in doc):
+    # Step 3: Check for aggregation functions (columns after the first one, up to the same exit keywords)
+    aggregation_span = segments.span("select_agg")
+    if aggregation_span:
+        start, end = aggregation_span
+        aggregation_function = doc[start].lemma_
         aggregation_parts = []
-        for idx, token in enumerate(doc):
-            if token.lemma_ in aggregation_functions:
-
-                for token_after in doc[idx + 1:]:
-                    if token_after.lemma_ in exit_triggers:
-                        break
-                    for table, columns in columns_for_tables.items():
-                        if token_after.text in columns:
-                            aggregation_parts.append(f"{token.lemma_}({table}.{token_after.text})")
-                break
+        for token_after in doc[start + 1:end]:
+            for table, columns in column_sets.items():
+                if token_after.text in columns:
+                    aggregation_parts.append(f"{aggregation_function}({table}.{token_after.text})")
         if aggregation_parts:
             select_clause_parts = aggregation_parts
 
@@ -155,7 +228,7 @@ def generate_select_clause(query, api_data, columns_for_tables, detected_tables)
 
     # Step 5: Default to SELECT * if no columns are found
     if not select_clause_parts:
-        print("Warning: No column names found, defaulting to SELECT *.")
+        logger.warning("No column names found, defaulting to SELECT *.")
         select_clause_parts = ["*"]
 
     # Create the SELECT clause
@@ -163,7 +236,8 @@ def generate_select_clause(query, api_data, columns_for_tables, detected_tables)
 
 
 
-def generate_from_and_joins(query, api_data, ping_join):
+@traced("sql.from")
+def generate_from_and_joins(query, api_data, ping_join, doc=None, schema_index=None, segments=None):
     """
     Parse the SQL query to detect tables and generate a FROM clause with LEFT JOINs based on the primary table.
 
@@ -171,18 +245,26 @@ def generate_from_and_joins(query, api_data, ping_join):
         query (str): The input SQL query.
         api_data (dict): API dictionary containing table names and their columns.
         ping_join (set): Set of keywords indicating a join operation.
+        doc (ParsedQuery): The parsed query. Parsed here if not provided.
+        schema_index (SchemaIndex): The index of api_data. Looked up here if not provided.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         str: The SQL FROM and JOIN clauses as a single string.
     """
     # Tokenize the query
-    doc = nlp(query)
+    if doc is None:
+        doc = parse_query(query)
+    if schema_index is None:
+        schema_index = get_schema_index(api_data, "tables")
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
     detected_tables = []  # To store identified table names
     join_conditions = []  # To store identified ON conditions
 
     # Step 1: Detect all known tables in the query
     for token in doc:
-        if token.text in api_data['tables']:
+        if schema_index.has_table(token.text):
             detected_tables.append(token.text)
     detected_tables = list(dict.fromkeys(detected_tables))  # Remove duplicates
 
@@ -194,7 +276,7 @@ def generate_from_and_joins(query, api_data, ping_join):
         if "from" in query.lower():  # Check for FROM clause
             return f"FROM {detected_tables[0]}"
         else:
-            print("WARNING: FROM clause not clear. Defaulting to table_a.")
+            logger.warning("FROM clause not clear. Defaulting to table_a.")
             return "FROM table_a"
 
     # Case 2 and beyond: Multiple tables
@@ -204,20 +286,19 @@ def generate_from_and_joins(query, api_data, ping_join):
     for secondary_table in detected_tables[1:]:
         # Look for "ON [known column]" phrases
         on_condition = None
-        for token in doc:
-            if token.text.lower() == "on":
-                # Collect the known column name following "ON"
-                column_index = token.i + 1  # Use token.i to get the index
-                if column_index < len(doc):
-                    column = doc[column_index].text
-                    if column in api_data[primary_table] and column in api_data[secondary_table]:
-                        on_condition = column
-                        break
+        for on_index in segments.positions("on"):
+            # Collect the known column name following "ON"
+            column_index = on_index + 1
+            if column_index < len(doc):
+                column = doc[column_index].text
+                if schema_index.has_column(primary_table, column) and schema_index.has_column(secondary_table, column):
+                    on_condition = column
+                    break
         # Use the found column or default to a generic column
         if on_condition:
             join_clauses.append(f"INNER JOIN {secondary_table} as {secondary_table} ON {primary_table}.{on_condition} = {secondary_table}.{on_condition}")
         else:
-            print(f"WARNING: No ON condition found for {primary_table} and {secondary_table}. Defaulting to 'id'.")
+            logger.warning("No ON condition found for %s and %s. Defaulting to 'id'.", primary_table, secondary_table)
             join_clauses.append(f"INNER JOIN {secondary_table} as {secondary_table} ON {primary_table}.id = {secondary_table}.id")
 
     # Assemble the FROM and JOIN clauses
@@ -225,73 +306,81 @@ def generate_from_and_joins(query, api_data, ping_join):
     return from_clause
 
 
-def generate_where_clause(query, columns_for_tables, detected_tables):
+@traced("sql.where")
+def generate_where_clause(query, columns_for_tables, detected_tables, doc=None, segments=None):
     '''
     Business Rules:
     If a where-related keyword is triggered, search the query for the next column name
     based on `columns_for_tables`, then search for a condition keyword, and finally locate
     the next noun or number for the value.
+    The WHERE clause runs from the first where-related keyword to the end of the query and
+    is read in a single walk: the column, then the condition after it, then the value.
     '''
-    doc = nlp(query)
+    if doc is None:
+        doc = parse_query(query)
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
     where_conditions = []
+    column_sets = get_column_sets(columns_for_tables)
     
-    print(f"WHERE doc: {doc}")
+    logger.debug("WHERE doc: %s", doc)
     
     # Check if any 'where' keyword is found in the query
-    if any(token.lemma_ in ping_where for token in doc):
-        for token in doc:
-            # Check for 'where' keywords without skipping them
-            if token.lemma_ in ping_where:
-     
-                # Look for the nearest column name after 'where' keyword
-                column_name = None
-                for next_token in doc[token.i + 1:]:
-                    # Find first matching column for any detected table
-                    for table in detected_tables:
-                        if next_token.text in columns_for_tables.get(table, []):
-                            column_name = f"{table}.{next_token.text}"
-                            print(f"WHERE column_name in loop: {column_name}")
-                            break
-                    if column_name:
-                        # Look for condition words after finding a column
-                        operator = None
-                        for condition_token in doc[next_token.i + 1:]:
-                            # Check both .text and .lemma_ for condition matching
-                            if condition_token.text in ping_conditions or condition_token.lemma_ in ping_conditions:
-                                # Map condition keywords to SQL operators
-                                if condition_token.lemma_ == "equal":
-                                    operator = "="
-                                elif condition_token.lemma_ in {"more", "greater"} or condition_token.text in {"more", "greater"}:
-                                    operator = ">"
-                                elif condition_token.lemma_ == "less" or condition_token.text == "less":
-                                    operator = "<"
-                                    
-                                print(f"WHERE condition in loop: {condition_token.lemma_}")
-                                print(f"WHERE operator in loop: {operator}")
-                                break
-                        
-                        # Only proceed to find value if a condition was found
-                        if operator:
-                            value = None
-                            for value_token in doc[condition_token.i + 1:]:
-                                print(f"WHERE value token in loop: {value_token}")
-                                if value_token.is_stop:
-                                    continue  # Skip stop words
-                                
-                                if value_token.like_num:
-                                    value = value_token.text
-                                    break
-                                elif value_token.pos_ in {"NOUN", "PROPN", "ADJ"}:
-                                    value = f"'{value_token.text}'"  # Quote strings
-                                    break
-                            if value:  # Append the full condition if value is found
-                                where_conditions.append(f"{column_name} {operator} {value}")
-                        break
+    where_span = segments.span("where")
+    if where_span:
+        start, end = where_span
+
+        # Look for the nearest column name after 'where' keyword
+        column_name = None
+        for next_token in doc[start + 1:end]:
+            # Find first matching column for any detected table
+            for table in detected_tables:
+                if next_token.text in column_sets.get(table, ()):
+                    column_name = f"{table}.{next_token.text}"
+                    logger.debug("WHERE column_name in loop: %s", column_name)
+                    break
+            if column_name:
                 break
 
+        # Look for condition words after finding a column
+        operator = None
+        if column_name:
+            for condition_token in doc[next_token.i + 1:end]:
+                # Check both .text and .lemma_ for condition matching
+                if condition_token.text in ping_conditions or condition_token.lemma_ in ping_conditions:
+                    # Map condition keywords to SQL operators
+                    if condition_token.lemma_ == "equal":
+                        operator = "="
+                    elif condition_token.lemma_ in {"more", "greater"} or condition_token.text in {"more", "greater"}:
+                        operator = ">"
+                    elif condition_token.lemma_ == "less" or condition_token.text == "less":
+                        operator = "<"
+
+                    logger.debug("WHERE condition in loop: %s", condition_token.lemma_)
+                    logger.debug("WHERE operator in loop: %s", operator)
+                    break
+
+        # Only proceed to find value if a condition was found
+        if operator:
+            value = None
+            for value_token in doc[condition_token.i + 1:end]:
+                logger.debug("WHERE value token in loop: %s", value_token)
+                if value_token.is_stop:
+                    continue  # Skip stop words
+
+                if value_token.like_num:
+                    value = value_token.text
+                    break
+                elif value_token.pos_ in {"NOUN", "PROPN", "ADJ"}:
+                    value = f"'{value_token.text}'"  # Quote strings
+                    break
+            if value:  # Append the full condition if value is found
+                where_conditions.append(f"{column_name} {operator} {value}")
+
     return f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
 
-def generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg):
+@traced("sql.group_by")
+def generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg, doc=None, segments=None):
     """
     Generate the GROUP BY clause for an SQL query based on identified aggregations and column names.
 
@@ -300,84 +389,67 @@ def generate_group_by_clause(query, columns_for_tables, detected_tables, ping_ag
         columns_for_tables (dict): Mapping of table names to their respective columns.
         detected_tables (list): List of tables detected in the query.
         ping_agg (list): List of aggregation keywords to check in the query.
+        doc (ParsedQuery): The parsed query. Parsed here if not provided.
+        segments (SegmentedQuery): The clauses of the query. Segmented here if not provided.
 
     Returns:
         str: The generated GROUP BY clause, or an empty string if no aggregation is found.
     """
-    # Define exit trigger keywords
-    exit_triggers = {"select", "sum", "order", "sort", "from", "where", "having"}
-
     # # Step 1: Check for aggregation keywords in the query
-    doc = nlp(query)
+    if doc is None:
+        doc = parse_query(query)
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
     # contains_aggregation = any(token.text.lower() in ping_agg for token in doc)
     # print(f"contains agg {contains_aggregation}")
 
     # if not contains_aggregation:
     #     return ""  # Skip GROUP BY clause generation if no aggregation detected
 
-    # Step 2: Determine the starting point for shortening the query
-    start_keyword = None
-    for keyword in ["group", "by", "for"]:
-        for token in doc:
-            if token.text.lower() == keyword:
-                start_keyword = keyword
-                break
-        if start_keyword:
-            break
-
-    if not start_keyword:
+    # Step 2: Determine the starting point for shortening the query ("group", else "by", else "for")
+    group_span = segments.span("group") or segments.span("group_by") or segments.span("group_for")
+    if not group_span:
 
         return ""
-    
-    print(f"group start keyword: {start_keyword}")
 
-    # Step 3: Shorten the query based on the starting keyword and exit triggers
-    start_index = next((idx for idx, token in enumerate(doc) if token.text.lower() == start_keyword), -1)
-    if start_index == -1:
+    start_index, end_index = group_span
+    logger.debug("group start keyword: %s", doc[start_index].lower_)
 
-        return ""
+    # Step 3: Shorten the query based on the starting keyword and exit triggers (group_exit_triggers)
+    shortened_query_tokens = list(doc[start_index:end_index])
 
-    # Collect tokens until an exit trigger is found
-    shortened_query_tokens = []
-    for token in doc[start_index:]:
-        if token.text.lower() in exit_triggers:
+    shortened_query = " ".join(token.text for token in shortened_query_tokens)
+    logger.debug("Group func short que: %s", shortened_query)
 
-            break
-        shortened_query_tokens.append(token.text)
-
-    shortened_query = " ".join(shortened_query_tokens)
-    print(f"Group func short que: {shortened_query}")
-
-    # Step 4: Remove stop words from the shortened query
-    cleaned_tokens = [token.text for token in nlp(shortened_query) if not token.is_stop]
-    cleaned_query = " ".join(cleaned_tokens)
-    print(f"Group func no stop : {cleaned_query}")
+    # Step 4: Remove stop words from the shortened query (reuses the parsed tokens)
+    cleaned_doc = [token for token in shortened_query_tokens if not token.is_stop and not token.text.isspace()]
+    cleaned_query = " ".join(token.text for token in cleaned_doc)
+    logger.debug("Group func no stop : %s", cleaned_query)
 
     # Step 5: Identify columns for GROUP BY from the cleaned query
-    cleaned_doc = cleaned_query.lower().split()
     group_by_columns = []
     
-    print(f"Group func nlp doc : {cleaned_doc}")
-    print(f"known tables: {detected_tables}")
-    print(f"pre loop cols: {columns_for_tables}")
+    logger.debug("Group func nlp doc : %s", cleaned_doc)
+    logger.debug("known tables: %s", detected_tables)
+    logger.debug("pre loop cols: %s", columns_for_tables)
 
     # Loop through tokens to match columns
     for token in cleaned_doc:
         for table, columns in columns_for_tables.items():
-            if token in columns:  # Match token to columns
-                column = f"{table}.{token}"  # Fully qualified column name
-                print(f"Matched column: {column}")
+            if token.lower_ in columns:  # Match token to columns
+                column = f"{table}.{token.lower_}"  # Fully qualified column name
+                logger.debug("Matched column: %s", column)
                 if column not in group_by_columns:  # Avoid duplicates
                     group_by_columns.append(column)
 
-        print(f"Group func for known cols: {group_by_columns}")
+        logger.debug("Group func for known cols: %s", group_by_columns)
 
     # Step 6: Resort to the next noun if no columns are found
     if not group_by_columns:
         for token in cleaned_doc:
             if token.pos_ == "NOUN":
                 group_by_columns.append(token.text)
-                print(f"DEBUG: Falling back to noun: {token.text}")
+                logger.debug("Falling back to noun: %s", token.text)
                 break
 
     # Step 7: Return the GROUP BY clause
@@ -389,13 +461,18 @@ def generate_group_by_clause(query, columns_for_tables, detected_tables, ping_ag
     return ""
 
 # ORDER BY clause generation function
-def generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts):
-    doc = nlp(query)
+@traced("sql.order_by")
+def generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts, doc=None, segments=None):
+    if doc is None:
+        doc = parse_query(query)
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
     order_by_columns = []
+    column_sets = get_column_sets(columns_for_tables)
     order_direction = ""  # ASC or DESC based on "ascending" or "descending"
     
     # Trigger ORDER BY clause on detecting relevant keywords
-    if any(token.lemma_ in ping_order for token in doc):
+    if segments.has(ping_order, key="lemma_"):
         for idx, token in enumerate(doc):
             # Set direction if "ascending" or "descending" is found
             if token.text == "ascending":
@@ -405,29 +482,23 @@ def generate_order_by_clause(query, columns_for_tables, detected_tables, select_
             elif token.lemma_ in ping_order:
                 # Situation 1: Look for the next valid column for ORDER BY across all detected tables
                 # Skip stop words and proceed to the next non-stop word
-                next_token = None
-                for j in range(idx + 1, len(doc)):
-                    if not doc[j].is_stop:  # Check if the token is not a stop word
-                        next_token = doc[j]
-                        break
+                next_index = segments.next_non_stop(idx + 1)
+                next_token = doc[next_index] if next_index is not None else None
 
                 column_added = False
                 if next_token:
                     for table in detected_tables:
-                        if next_token.text in columns_for_tables.get(table, []):
+                        if next_token.text in column_sets.get(table, ()):
                             order_by_columns.append(f"{table}.{next_token.text}")
                             column_added = True
                             break
                 
                 # Situation 2: Check for "and" followed by a second column name, skipping stop words
                 if column_added and idx + 2 < len(doc) and doc[idx + 1].text == "and":
-                    second_token = None
-                    for k in range(idx + 2, len(doc)):
-                        if not doc[k].is_stop:
-                            second_token = doc[k]
-                            break
+                    second_index = segments.next_non_stop(idx + 2)
+                    second_token = doc[second_index] if second_index is not None else None
                     for table in detected_tables:
-                        if second_token and second_token.text in columns_for_tables.get(table, []):
+                        if second_token and second_token.text in column_sets.get(table, ()):
                             order_by_columns.append(f"{table}.{second_token.text}")
                             break
                 
@@ -442,7 +513,8 @@ def generate_order_by_clause(query, columns_for_tables, detected_tables, select_
     else:
         return ""
     
-def generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause):
+@traced("sql.having")
+def generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause, doc=None, segments=None):
     """
     Generate the HAVING clause for an SQL query.
 
@@ -455,12 +527,16 @@ def generate_having_clause(query, columns_for_tables, detected_tables, group_by_
     if not group_by_clause:
         return ""
 
-    doc = nlp(query)
+    if doc is None:
+        doc = parse_query(query)
+    if segments is None:
+        segments = segment_query(query, doc, sql_clauses)
     having_conditions = []
+    lower_column_sets = get_column_sets(columns_for_tables, lower=True)
     
     # Check for HAVING keyword
-    having_triggered = any(token.text.lower() in ping_having for token in doc)
-    if not having_triggered:
+    having_span = segments.span("having")
+    if not having_span:
         return ""
 
     # Exit triggers to stop processing
@@ -472,59 +548,99 @@ def generate_having_clause(query, columns_for_tables, detected_tables, group_by_
     operator = None
     value = None
 
-    # Process tokens after the HAVING keyword
-    for idx, token in enumerate(doc):
-        if token.text.lower() in ping_having:  # Detect HAVING keyword
-            for next_token in doc[idx + 1:]:
-         
-                # Step 1: Find the next known column name
-                if column_name is None:
-                    for table in detected_tables:
-                        if next_token.text.lower() in map(str.lower, columns_for_tables.get(table, [])):
-                            column_name = f"{table}.{next_token.text}"
-                            break
+    # Process tokens after the (first) HAVING keyword
+    start, end = having_span
+    for next_token in doc[start + 1:end]:
+
+        # Step 1: Find the next known column name
+        if column_name is None:
+            for table in detected_tables:
+                if next_token.text.lower() in lower_column_sets.get(table, ()):
+                    column_name = f"{table}.{next_token.text}"
+                    break
+
+        # Step 2: Find a condition keyword
+        if column_name and operator is None:
+            if next_token.text.lower() in ping_conditions:
+                operator = "=" if next_token.text.lower() == "equal" else (
+                    ">" if next_token.text.lower() in {"more", "greater"} else (
+                        "<" if next_token.text.lower() == "less" else None
+                    )
+                )
+                continue
+
+        # Step 3: Find the next noun or number as the value
+        if column_name and operator and value is None:
+            if next_token.like_num:
+                value = next_token.text
+                break
+            elif next_token.pos_ in {"NOUN", "PROPN"}:
+                value = f"'{next_token.text}'"
+                break
 
-                # Step 2: Find a condition keyword
-                if column_name and operator is None:
-                    if next_token.text.lower() in ping_conditions:
-                        operator = "=" if next_token.text.lower() == "equal" else (
-                            ">" if next_token.text.lower() in {"more", "greater"} else (
-                                "<" if next_token.text.lower() == "less" else None
-                            )
-                        )
-                        continue
-
-                # Step 3: Find the next noun or number as the value
-                if column_name and operator and value is None:
-                    if next_token.like_num:
-                        value = next_token.text
-                        break
-                    elif next_token.pos_ in {"NOUN", "PROPN"}:
-                        value = f"'{next_token.text}'"
-                        break
-
-            # Build the condition
-            if column_name and operator and value:
-                having_conditions.append(f"sum({column_name}) {operator} {value}")
-            break  # Process only one HAVING clause
+    # Build the condition
+    if column_name and operator and value:
+        having_conditions.append(f"sum({column_name}) {operator} {value}")
 
     # Return the HAVING clause
     return f"HAVING {' AND '.join(having_conditions)}" if having_conditions else ""
 
 
 # Main function to generate SQL query
-def generate_sql_query(query, api_data):
+@traced("sql.generate")
+def generate_sql_query(query, api_data, limit=None):
+    """
+    Translate a natural language query to SQL, reusing cached translations.
+
+    The query is normalized (whitespace collapsed) before it is compiled, and the
+    result is cached by normalized query text and schema fingerprint.
+
+    Args:
+        query (str): The natural language query.
+        api_data (dict): API data containing table names and their columns.
+        limit (int): Optional result budget, pushed into the query as a LIMIT clause.
+
+    Returns:
+        str: The SQL query.
+    """
+    cache_key = translation_cache.make_key("sql", query, api_data, limit)
+    hit, sql_query = translation_cache.get(cache_key)
+    if hit:
+        return sql_query
+
+    sql_query = translate_sql_query(normalize_query(query), api_data, limit)
+    translation_cache.put(cache_key, sql_query)
+
+    return sql_query
+
+
+# Compile the SQL query without the translation cache
+@traced("sql.translate")
+def translate_sql_query(query, api_data, limit=None, doc=None):
     # Detect tables and columns in the query
-    detected_tables, columns_for_tables = find_table_and_column_names(query, api_data)
+    schema_index = get_schema_index(api_data, "tables")
+    detected_tables, columns_for_tables = find_table_and_column_names(query, api_data, schema_index)
     join_column = None  # Define a default or optional join column based on context
+
+    # Parse the query once and share the parsed tokens with every clause generator
+    # (batch_translate passes the queries it parsed with nlp.pipe). Templated questions
+    # are tagged by the fast path, the others by the spaCy model.
+    if doc is None:
+        doc = fast_parse(query, schema_index)
+    if doc is None:
+        doc = parse_query(query)
+
+    # Segment the parsed query into clauses once; every clause generator reads its span
+    segments = segment_query(query, doc, sql_clauses)
+    logger.debug("Clause roles: %s", segments.roles)
     
     # Generate each clause
-    select_clause, select_clause_parts = generate_select_clause(query, api_data, columns_for_tables, detected_tables)
-    from_clause = generate_from_and_joins(query, api_data, ping_join)  # Pass the query and columns_for_tables
-    where_clause = generate_where_clause(query, columns_for_tables, detected_tables)
-    group_by_clause = generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg)
-    having_clause = generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause)
-    order_by_clause = generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts)
+    select_clause, select_clause_parts = generate_select_clause(query, api_data, columns_for_tables, detected_tables, doc, segments)
+    from_clause = generate_from_and_joins(query, api_data, ping_join, doc, schema_index, segments)  # Pass the query and columns_for_tables
+    where_clause = generate_where_clause(query, columns_for_tables, detected_tables, doc, segments)
+    group_by_clause = generate_group_by_clause(query, columns_for_tables, detected_tables, ping_agg, doc, segments)
+    having_clause = generate_having_clause(query, columns_for_tables, detected_tables, group_by_clause, doc, segments)
+    order_by_clause = generate_order_by_clause(query, columns_for_tables, detected_tables, select_clause_parts, doc, segments)
     
     # Handle case where ping_join is in the query
     if isinstance(ping_join, (set, list)):
@@ -553,6 +669,10 @@ def generate_sql_query(query, api_data):
     # Combine all clauses into the final SQL query
     sql_query = f"{select_clause} {from_clause} {where_clause}{group_by_clause} {having_clause}{order_by_clause};"
 
+    # Push the result budget to the database
+    if limit:
+        sql_query = f"{sql_query.strip().rstrip(';').strip()} LIMIT {int(limit)};"
+
     return sql_query.strip()
 
 
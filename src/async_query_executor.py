@@ -0,0 +1,141 @@
+# Load dependent libraries.
+import asyncio
+import contextvars
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from query_executor import CancelHandle, QueryExecutor
+
+#
+# Process-wide worker thread pools, keyed by their size. They are shared by
+# every AsyncQueryExecutor instance, so re-running the Streamlit script does
+# not start new threads.
+#
+_thread_pools = dict()
+_thread_pool_lock = threading.Lock()
+
+# Seconds a timed out or cancelled call waits for its query to be killed on the server.
+KILL_TIMEOUT = 5
+
+#
+# This class executes MySQL and MongoDB queries from asyncio code, so that
+# several queries (e.g. the SQL and MongoDB translation of a question) run
+# concurrently without blocking the caller.
+#
+# The MySQL connector and pymongo are blocking libraries, so each query runs
+# on a bounded pool of worker threads through the pooled connections of a
+# QueryExecutor. Every method accepts a timeout in seconds, which is also
+# sent to the server as the time limit of the query, and a CancelHandle
+# (see query_executor.py). When the timeout expires or the awaiting task is
+# cancelled, the query is stopped on the server through the handle and
+# asyncio.TimeoutError or asyncio.CancelledError is raised to the caller.
+#
+class AsyncQueryExecutor:
+
+    # Constructor method to initialize class variables.
+    # max_workers: maximum number of queries that run at the same time.
+    # timeout: default timeout in seconds (None waits indefinitely).
+    def __init__(self, query_executor: QueryExecutor = None, max_workers: int = 8, timeout: float = None):
+
+        self.query_executor = query_executor or QueryExecutor()
+        self.timeout = timeout
+
+        with _thread_pool_lock:
+
+            self.thread_pool = _thread_pools.get(max_workers)
+
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chatdb-query')
+                _thread_pools[max_workers] = self.thread_pool
+
+    # Run a blocking function on the worker threads and wait for its result.
+    # cancel (optional) is run on a worker thread if the wait times out or is cancelled.
+    async def runBlocking(self, function, *args, timeout: float = None, cancel=None, **kwargs):
+
+        loop = asyncio.get_running_loop()
+        timeout = timeout if timeout is not None else self.timeout
+
+        # Run the function in a copy of the caller's context, so that its spans join the caller's trace.
+        context = contextvars.copy_context()
+        result_future = loop.run_in_executor(self.thread_pool, functools.partial(context.run, function, *args, **kwargs))
+
+        try:
+            return await asyncio.wait_for(result_future, timeout)
+
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+
+            # Stop the query on the server; the worker thread returns once it is killed.
+            # The caller waits at most KILL_TIMEOUT seconds for the kill.
+            if cancel is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(loop.run_in_executor(None, cancel)), KILL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print("Error::runBlocking::The query could not be stopped on the server in time.")
+            raise
+
+    # Return the cancel handle of a query, creating one if none is given.
+    def getCancelHandle(self, cancel_handle: CancelHandle = None):
+
+        return cancel_handle if cancel_handle is not None else CancelHandle(self.query_executor)
+
+    # Execute the query in the MySQL database.
+    async def execMySQLQuery(self, query: str, params: dict = None, timeout: float = None,
+                             cancel_handle: CancelHandle = None):
+
+        timeout = timeout if timeout is not None else self.timeout
+        cancel_handle = self.getCancelHandle(cancel_handle)
+
+        return await self.runBlocking(self.query_executor.execMySQLQuery, query, params,
+                                      self.getMaxTimeMS(timeout), cancel_handle,
+                                      timeout=timeout, cancel=cancel_handle.cancel)
+
+    # Execute a SELECT statement with its result limited to the first rows.
+    async def previewMySQLQuery(self, query: str, limit: int = 10, params: dict = None, timeout: float = None,
+                                cancel_handle: CancelHandle = None):
+
+        statement = self.query_executor.getPreviewStatement(query, limit)
+
+        return await self.execMySQLQuery(statement, params, timeout, cancel_handle)
+
+    # Execute the find query.
+    async def execMongoFind(self, collection_name: str, query: dict, limit = 0, projection: dict = None,
+                            timeout: float = None, cancel_handle: CancelHandle = None):
+
+        timeout = timeout if timeout is not None else self.timeout
+        cancel_handle = self.getCancelHandle(cancel_handle)
+
+        return await self.runBlocking(self.query_executor.execMongoFind, collection_name, query, limit, projection,
+                                      self.getMaxTimeMS(timeout), cancel_handle,
+                                      timeout=timeout, cancel=cancel_handle.cancel)
+
+    # Execute the find query with the result limited to the first documents.
+    async def previewMongoFind(self, collection_name: str, query: dict, limit: int = 10, projection: dict = None,
+                               timeout: float = None, cancel_handle: CancelHandle = None):
+
+        return await self.execMongoFind(collection_name, query, limit, projection, timeout, cancel_handle)
+
+    # Execute the aggregate query.
+    async def execMongoAggregate(self, collection_name: str, query: list, timeout: float = None,
+                                 cancel_handle: CancelHandle = None):
+
+        timeout = timeout if timeout is not None else self.timeout
+        cancel_handle = self.getCancelHandle(cancel_handle)
+
+        return await self.runBlocking(self.query_executor.execMongoAggregate, collection_name, query,
+                                      self.getMaxTimeMS(timeout), cancel_handle,
+                                      timeout=timeout, cancel=cancel_handle.cancel)
+
+    # Execute the aggregate query with the result limited to the first documents.
+    async def previewMongoAggregate(self, collection_name: str, query: list, limit: int = 10, timeout: float = None,
+                                    cancel_handle: CancelHandle = None):
+
+        return await self.execMongoAggregate(collection_name, list(query) + [{"$limit": int(limit)}], timeout,
+                                             cancel_handle)
+
+    # Return the server-side time limit (in milliseconds) of a timeout.
+    @staticmethod
+    def getMaxTimeMS(timeout: float = None):
+
+        return int(timeout * 1000) if timeout is not None else None
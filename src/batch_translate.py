@@ -0,0 +1,234 @@
+'''
+Batched translation of natural language queries.
+
+translate_many translates a list of queries to SQL or MongoDB in one call, for
+backlogs of saved questions (e.g. regenerating reports). Compared with calling
+generate_sql_query / mongo_compile once per query:
+
+    - templated questions are tagged by the rule-based fast path (see
+      fast_path.py) and the other queries are parsed in batches with
+      nlp.pipe instead of one nlp() call per query;
+    - the batches are spread over worker processes (n_process), each with its
+      own copy of the spaCy pipeline, so both the parse and the clause
+      generators run on every core;
+    - queries found in the translation cache, and repeated queries, are only
+      translated once.
+
+The workers use the trace sample rate and fast path setting of the calling
+process. Their fast path counters and stage timings are returned with each
+batch and added to those of the calling process; the traces they record stay
+in the workers.
+
+A query that cannot be translated does not fail the batch: its result carries
+the error message instead. Results are returned in the order of the queries.
+
+Main function:
+    results = translate_many(queries, api_data, target="sql", n_process=-1)
+    for item in results:
+        print(item.query, item.result if item.ok else item.error)
+'''
+import copy
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, NamedTuple, Optional
+
+from MongoDBCodeGenerator import fast_parse as fast_parse_mongo
+from MongoDBCodeGenerator import translate_mongo_query
+from fast_path import fast_path
+from nlp_models import get_nlp
+from query_parser import parse_queries, parse_query
+from schema_index import get_schema_index
+from SQLCodeGenerator import fast_parse as fast_parse_sql
+from SQLCodeGenerator import translate_sql_query
+from tracing import tracer
+from translation_cache import normalize_query, translation_cache
+
+logger = logging.getLogger(__name__)
+
+# Number of queries per nlp.pipe batch and per worker task.
+DEFAULT_BATCH_SIZE = 64
+
+
+class TranslationResult(NamedTuple):
+    """
+    Translation of one query of a batch.
+
+    result is the SQL string (target "sql") or the (execute, collection, pipeline)
+    tuple (target "mongo"). error is None on success and the error message otherwise.
+    """
+    query: str
+    result: Any
+    error: Optional[str]
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def translate_sql(query, api_data, limit, doc):
+    return translate_sql_query(query, api_data, limit, doc)
+
+
+def translate_mongo(query, api_data, limit, doc):
+    return translate_mongo_query(api_data, query, limit, doc)
+
+
+# Uncached translation of each target, called with (query, api_data, limit, doc).
+TARGETS = {"sql": translate_sql, "mongo": translate_mongo}
+
+# Fast path of each target and the key of the table names in api_data.
+FAST_PARSERS = {"sql": (fast_parse_sql, "tables"), "mongo": (fast_parse_mongo, "collections")}
+
+
+def translate_batch(target, queries, api_data, limit=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Parse a batch of normalized queries and translate each of them.
+
+    The queries the fast path declines are parsed together with nlp.pipe.
+
+    Runs in the calling process or in a worker process of translate_many.
+
+    Args:
+        target (str): "sql" or "mongo".
+        queries (list): The normalized natural language queries.
+        api_data (dict): The mapping of tables/collections to columns.
+        limit (int): Optional result budget of every query.
+        batch_size (int): Number of queries processed together by the pipeline.
+
+    Returns:
+        list: A (result, error) pair for each query, in order.
+    """
+    translate = TARGETS[target]
+    fast_parse, tables_key = FAST_PARSERS[target]
+    schema_index = get_schema_index(api_data, tables_key)
+
+    docs = [fast_parse(query, schema_index) for query in queries]
+    missed = [index for index, doc in enumerate(docs) if doc is None]
+    if missed:
+        try:
+            parsed = parse_queries([queries[index] for index in missed], batch_size=batch_size)
+            for index, doc in zip(missed, parsed):
+                docs[index] = doc
+        except Exception as ex:
+            # Parse the queries one at a time so that only the failing ones report an error
+            logger.warning("Batch parse failed, parsing the queries one at a time: %s", ex)
+
+    outcomes = []
+    for query, doc in zip(queries, docs):
+        try:
+            if doc is None:
+                doc = parse_query(query)
+            outcomes.append((translate(query, api_data, limit, doc), None))
+        except Exception as ex:
+            outcomes.append((None, f"{type(ex).__name__}: {ex}"))
+    return outcomes
+
+
+def init_worker(sample_rate=None, fast_path_enabled=None):
+    """
+    Load the spaCy pipeline once in each worker process.
+
+    Args:
+        sample_rate (float): The trace sample rate of the calling process.
+        fast_path_enabled (bool): Whether the fast path is enabled in the calling process.
+    """
+    if sample_rate is not None:
+        tracer.set_sample_rate(sample_rate)
+    fast_path.configure(enabled=fast_path_enabled)
+    get_nlp()
+
+
+def translate_worker_batch(target, queries, api_data, limit=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Translate a batch in a worker process of translate_many.
+
+    The fast path counters and stage timings of a worker are not seen by the
+    calling process, so those recorded for the batch are returned with it.
+
+    Returns:
+        tuple: The outcomes of translate_batch, the fast path counters (see
+            FastPath.counters) and the stage timing metrics (see Tracer.get_metrics).
+    """
+    fast_path.reset()
+    tracer.reset()
+    outcomes = translate_batch(target, queries, api_data, limit, batch_size)
+    return outcomes, fast_path.counters(), tracer.get_metrics()
+
+
+def translate_many(queries, api_data, target="sql", limit=None, n_process=1, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Translate a list of natural language queries to SQL or MongoDB.
+
+    Args:
+        queries (iterable): The natural language queries.
+        api_data (dict): The mapping of tables/collections to columns.
+        target (str): "sql" or "mongo".
+        limit (int): Optional result budget of every query (see generate_sql_query and mongo_compile).
+        n_process (int): Number of worker processes, -1 for one per CPU core. With 1,
+            the batches are translated in the calling process.
+        batch_size (int): Number of queries per nlp.pipe batch and per worker task.
+
+    Returns:
+        list: A TranslationResult for each query, in the order of the queries.
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target {target!r}, expected one of {sorted(TARGETS)}")
+    if n_process == -1:
+        n_process = os.cpu_count() or 1
+    if n_process < 1 or batch_size < 1:
+        raise ValueError("n_process must be -1 or at least 1, and batch_size at least 1")
+
+    queries = list(queries)
+    outcomes = [None] * len(queries)
+
+    # Look up the translation cache; the queries left are translated once per cache key
+    pending = {}
+    for index, query in enumerate(queries):
+        key = translation_cache.make_key(target, query, api_data, limit)
+        if key in pending:
+            pending[key].append(index)
+            continue
+        hit, value = translation_cache.get(key)
+        if hit:
+            outcomes[index] = (value, None)
+        else:
+            pending[key] = [index]
+
+    keys = list(pending)
+    texts = [normalize_query(queries[pending[key][0]]) for key in keys]
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    workers = min(n_process, len(batches))
+
+    with tracer.span("batch.translate", target=target, queries=len(queries), translated=len(texts),
+                     workers=workers):
+        if workers <= 1:
+            batch_outcomes = [translate_batch(target, batch, api_data, limit, batch_size) for batch in batches]
+        else:
+            # Spawn the workers: forking a threaded caller (Streamlit, connection pool and
+            # monitor threads) can deadlock on locks held by its other threads.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_worker,
+                                     initargs=(tracer.sample_rate, fast_path.enabled)) as executor:
+                batch_outcomes = []
+                for worker_outcomes, fast_path_counters, stage_metrics in executor.map(
+                        translate_worker_batch, repeat(target), batches, repeat(api_data), repeat(limit),
+                        repeat(batch_size)):
+                    batch_outcomes.append(worker_outcomes)
+                    fast_path.merge(fast_path_counters)
+                    tracer.merge_metrics(stage_metrics)
+
+    translated = [outcome for batch in batch_outcomes for outcome in batch]
+    for key, (result, error) in zip(keys, translated):
+        if error is None:
+            translation_cache.put(key, result)
+        else:
+            logger.warning("Could not translate %r: %s", queries[pending[key][0]], error)
+
+        # Repeated queries get their own copy of the translation
+        for position, index in enumerate(pending[key]):
+            outcomes[index] = (result if position == 0 else copy.deepcopy(result), error)
+
+    return [TranslationResult(query, result, error) for query, (result, error) in zip(queries, outcomes)]
@@ -0,0 +1,145 @@
+'''
+Before/after latency benchmark for the index advisor.
+
+Requires the MySQL and MongoDB databases with the loan, salaries and purchases
+data sets loaded (see data_set_processor.py). The benchmark:
+    1. translates the sample query corpus to SQL and MongoDB pipelines,
+    2. executes every translation --runs times without indexes (before); the
+       executions are recorded in the query log,
+    3. asks the index advisor for recommendations and creates them,
+    4. executes the translations again (after),
+    5. drops the indexes it created, unless --keep is given.
+With --dry-run, only the advisor report of step 3 is printed.
+
+Usage (from the src directory):
+    python benchmarks/bench_index_advisor.py [--runs 5] [--dry-run] [--keep] [--output index.json]
+'''
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from corpus import mongo_schema, sample_corpus, sql_schema
+
+from sqlalchemy import text
+
+from MongoDBCodeGenerator import mongo_compile
+from SQLCodeGenerator import generate_sql_query
+from index_advisor import IndexAdvisor
+from query_executor import QueryExecutor
+from query_log import query_log
+
+
+def translate_corpus(queries):
+    """
+    Translate the natural language queries, skipping the ones a generator rejects.
+
+    Returns:
+        list: (backend, collection name or None, statement) tuples.
+    """
+    statements = []
+    for query in queries:
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                statements.append(("mysql", None, generate_sql_query(query, sql_schema())))
+            except Exception:
+                pass
+            try:
+                execute, collection_name, pipeline = mongo_compile(mongo_schema(), query)
+                if execute == "aggregate":
+                    statements.append(("mongodb", collection_name, pipeline))
+            except Exception:
+                pass
+    return statements
+
+
+def run_statements(query_executor, statements, runs):
+    """
+    Execute every statement runs times.
+
+    Returns:
+        dict: The latencies in milliseconds by backend.
+    """
+    latencies = {"mysql": [], "mongodb": []}
+    for _ in range(runs):
+        for backend, collection_name, statement in statements:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if backend == "mysql":
+                    query_executor.execMySQLQuery(statement)
+                else:
+                    query_executor.execMongoAggregate(collection_name, statement)
+            latencies[backend].append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    """
+    Summarize a list of latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    if not ordered:
+        return None
+    return {
+        "calls": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
+
+
+def drop_indexes(query_executor, recommendations):
+    """
+    Drop the indexes created by the benchmark.
+    """
+    for recommendation in recommendations:
+        if recommendation["status"] != "created":
+            continue
+        if recommendation["backend"] == "mysql":
+            with query_executor.getMySQLEngine().begin() as connection:
+                connection.execute(text(f"DROP INDEX `{recommendation['index_name']}` ON `{recommendation['name']}`"))
+        else:
+            query_executor.getMongoClient()[query_executor.database][recommendation["name"]].drop_index(
+                recommendation["index_name"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure query latency before and after the advised indexes.")
+    parser.add_argument("--runs", type=int, default=5, help="Executions of every statement per measurement.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the index recommendations.")
+    parser.add_argument("--keep", action="store_true", help="Keep the created indexes.")
+    parser.add_argument("--output", help="Optional path of the JSON results file.")
+    args = parser.parse_args()
+
+    # Measure execution, not result cache hits.
+    query_executor = QueryExecutor(cache_results=False)
+    statements = translate_corpus(sample_corpus())
+
+    query_log.clear()
+    before = run_statements(query_executor, statements, args.runs)
+
+    advisor = IndexAdvisor(query_executor)
+    recommendations = advisor.buildIndexes(dry_run=args.dry_run)
+
+    results = {"benchmark": "index_advisor", "statements": len(statements), "indexes": recommendations}
+
+    if not args.dry_run:
+        try:
+            after = run_statements(query_executor, statements, args.runs)
+        finally:
+            if not args.keep:
+                drop_indexes(query_executor, recommendations)
+
+        for backend in ("mysql", "mongodb"):
+            results[backend] = {"before": summarize(before[backend]), "after": summarize(after[backend])}
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=4)
+
+
+if __name__ == "__main__":
+    main()
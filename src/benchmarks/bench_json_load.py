@@ -0,0 +1,119 @@
+'''
+Benchmark for reading the JSON data sets loaded into MongoDB.
+
+Compares the two ways insertSetToMongoDB can read a data set file:
+    1. json_load: the previous behaviour, json.load of the whole file before
+       the first insert.
+    2. streaming: iterJSONBatches, which yields batches of documents while the
+       file is read.
+
+Each mode runs in a fresh Python process so that the peak resident set size
+(ru_maxrss) of one mode is not inherited by the other. The documents are only
+counted, not inserted, so no database is needed. Larger inputs are synthesized
+by repeating the documents of the data set file.
+
+Usage (from the src directory):
+    python benchmarks/bench_json_load.py [--file ../data/loan.json] [--repeat 20] [--batch-size 10000] [--output load.json]
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code executed in the child process; prints one JSON record.
+CHILD_CODE = """
+import json, resource, sys, time
+mode, file_name, batch_size = sys.argv[1], sys.argv[2], int(sys.argv[3])
+from json_stream import iterJSONBatches
+base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+documents = 0
+with open(file_name, 'r', encoding='utf-8') as jf:
+    if mode == 'json_load':
+        json_obj = json.load(jf)
+        for batch_start in range(0, len(json_obj), batch_size):
+            documents += len(json_obj[batch_start:batch_start + batch_size])
+    else:
+        for batch in iterJSONBatches(jf, batch_size):
+            documents += len(batch)
+elapsed = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"documents": documents, "seconds": elapsed, "docs_per_sec": documents / elapsed,
+                  "peak_rss_mb": peak_kb / 1024, "peak_rss_growth_mb": (peak_kb - base_kb) / 1024}))
+"""
+
+
+def run_mode(mode, file_name, batch_size):
+    """
+    Read the file in a child process.
+
+    Args:
+        mode (str): "json_load" or "streaming".
+        file_name (str): The JSON data set file.
+        batch_size (int): Number of documents per batch.
+
+    Returns:
+        dict: The measurements reported by the child process.
+    """
+    completed = subprocess.run([sys.executable, "-c", CHILD_CODE, mode, file_name, str(batch_size)],
+                               cwd=SRC_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"The {mode} sample failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def write_repeated(file_name, repeat, out):
+    """
+    Write the documents of a JSON array file repeat times as one JSON array.
+
+    Args:
+        file_name (str): The JSON data set file.
+        repeat (int): Number of copies of the documents.
+        out: The open output file.
+    """
+    with open(file_name, "r", encoding="utf-8") as jf:
+        documents = json.load(jf)
+
+    out.write("[\n")
+    for copy_index in range(repeat):
+        for doc_index, document in enumerate(documents):
+            separator = "" if copy_index == 0 and doc_index == 0 else ",\n"
+            out.write(separator + json.dumps(document, indent=4))
+    out.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare json.load and streaming reads of a JSON data set.")
+    parser.add_argument("--file", default=os.path.join(SRC_DIR, "..", "data", "loan.json"), help="JSON data set file.")
+    parser.add_argument("--repeat", type=int, default=20, help="Copies of the documents in the measured file.")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Number of documents per insert batch.")
+    parser.add_argument("--output", help="Optional path of the JSON results file.")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8", delete=False) as out:
+        write_repeated(args.file, args.repeat, out)
+        file_name = out.name
+
+    try:
+        results = {
+            "benchmark": "json_load",
+            "file_mb": os.path.getsize(file_name) / (1024 * 1024),
+            "batch_size": args.batch_size,
+            "json_load": run_mode("json_load", file_name, args.batch_size),
+            "streaming": run_mode("streaming", file_name, args.batch_size),
+        }
+    finally:
+        os.remove(file_name)
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+'''
+Regression benchmark for mongo_compile latency.
+
+Measures the per-call latency of mongo_compile over the sample query corpus:
+    1. after: the current compiler, sharing the preloaded pipeline and one parse
+       of the query across all stages.
+    2. before: the previous behaviour, where generate_match_clause and
+       generate_have_clause each called spacy.load("en_core_web_sm") on every
+       request. It is reproduced by loading the model twice before each call.
+
+Usage (from the src directory):
+    python benchmarks/bench_mongo_compile.py [--runs 20] [--legacy-runs 2] [--output mongo.json]
+'''
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from corpus import mongo_schema, sample_corpus
+
+from MongoDBCodeGenerator import mongo_compile
+from nlp_models import MODEL_NAME, get_nlp
+from translation_cache import translation_cache
+
+
+def compile_once(query, legacy=False):
+    """
+    Compile a single query and return the elapsed time in milliseconds.
+
+    Args:
+        query (str): The natural language query.
+        legacy (bool): Reproduce the two model loads per call of the previous compiler.
+
+    Returns:
+        float: The elapsed time in milliseconds.
+    """
+    start = time.perf_counter()
+    if legacy:
+        import spacy
+
+        spacy.load(MODEL_NAME)
+        spacy.load(MODEL_NAME)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mongo_compile(mongo_schema(), query)
+    except Exception:
+        # Queries the compiler rejects still count towards the latency.
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+def summarize(latencies):
+    """
+    Summarize a list of latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    return {
+        "calls": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure mongo_compile latency before and after sharing the parse.")
+    parser.add_argument("--runs", type=int, default=20, help="Passes over the corpus for the current compiler.")
+    parser.add_argument("--legacy-runs", type=int, default=2, help="Passes over the corpus for the previous behaviour.")
+    parser.add_argument("--output", help="Optional path of the JSON results file.")
+    args = parser.parse_args()
+
+    queries = sample_corpus()
+
+    # Measure compilation, not translation cache hits.
+    translation_cache.configure(maxsize=0)
+
+    # Warm up: load the shared pipeline outside of the measurements.
+    get_nlp()
+
+    after = [compile_once(query) for _ in range(args.runs) for query in queries]
+    before = [compile_once(query, legacy=True) for _ in range(args.legacy_runs) for query in queries]
+
+    results = {"benchmark": "mongo_compile", "before": summarize(before), "after": summarize(after)}
+    results["speedup_p50"] = results["before"]["p50_ms"] / results["after"]["p50_ms"]
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+'''
+Startup benchmark for the code generators.
+
+Each sample runs in a fresh Python process so that every measurement is a true
+cold start. The benchmark records:
+    1. import_ms: time to import SQLCodeGenerator and MongoDBCodeGenerator.
+    2. model_load_ms: time for the first get_nlp() call (loads the spaCy pipeline).
+    3. first_query_ms: time for the first generate_sql_query call after the load.
+
+Usage (from the src directory):
+    python benchmarks/bench_startup.py [--runs 5] [--output startup.json]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code executed in the child process; prints one JSON record.
+CHILD_CODE = """
+import contextlib, io, json, time
+t0 = time.perf_counter()
+import SQLCodeGenerator
+import MongoDBCodeGenerator
+t1 = time.perf_counter()
+from nlp_models import get_nlp
+get_nlp()
+t2 = time.perf_counter()
+api_data = {'tables': ['loan'], 'loan': ['person_age', 'person_income', 'loan_amnt']}
+with contextlib.redirect_stdout(io.StringIO()):
+    SQLCodeGenerator.generate_sql_query("choose loan_amnt from loan where person_income is greater than 20000", api_data)
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "model_load_ms": (t2 - t1) * 1000, "first_query_ms": (t3 - t2) * 1000}))
+"""
+
+
+def run_sample():
+    """
+    Run one cold start in a child process.
+
+    Returns:
+        dict: The timings reported by the child process.
+    """
+    completed = subprocess.run([sys.executable, "-c", CHILD_CODE], cwd=SRC_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"Cold start sample failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the code generators.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to sample.")
+    parser.add_argument("--output", help="Optional path of the JSON results file.")
+    args = parser.parse_args()
+
+    samples = [run_sample() for _ in range(args.runs)]
+
+    results = {"benchmark": "startup", "runs": args.runs}
+    for metric in ("import_ms", "model_load_ms", "first_query_ms"):
+        values = [sample[metric] for sample in samples]
+        results[metric] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+'''
+Throughput and latency benchmark of the natural language translation.
+
+Measures generate_sql_query and mongo_compile separately over the benchmark
+corpus (see corpus.py: the sample queries, the commented examples of both
+generators and seeded synthetic variants over the loan, salaries and
+purchases schemas). Runs offline: no database is needed, only the spaCy model.
+
+For each generator:
+    1. queries/sec and the mean, p50, p95 and p99 latency of a call, over
+       --runs timed passes after --warmup passes.
+    2. the peak traced memory (tracemalloc) of a call, in a separate pass,
+       since tracing allocations slows the calls down.
+The translation cache is disabled, so every call compiles its query. The
+templated queries are tagged by the fast path (see fast_path.py) unless
+--no-fast-path is given; its hit rate over the run is reported.
+
+The results are written as JSON (--output). With --baseline, they are compared
+with an earlier results file and the metrics that are worse by more than
+--tolerance are reported as regressions (--fail-on-regression exits with 1).
+
+Usage (from the src directory):
+    python benchmarks/bench_translate.py [--runs 5] [--synthetic 200] [--output after.json]
+    python benchmarks/bench_translate.py --baseline before.json --fail-on-regression
+    python benchmarks/bench_translate.py --no-fast-path --output model_only.json
+'''
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from corpus import SRC_DIR, benchmark_corpus, mongo_schema, sql_schema
+
+from fast_path import fast_path
+from MongoDBCodeGenerator import mongo_compile
+from nlp_models import get_nlp
+from SQLCodeGenerator import generate_sql_query
+from translation_cache import translation_cache
+
+# Metrics compared with the baseline and whether a higher value is better.
+COMPARED_METRICS = {
+    "qps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "peak_kb_mean": False,
+}
+
+
+def sql_target(query):
+    return generate_sql_query(query, sql_schema())
+
+
+def mongo_target(query):
+    return mongo_compile(mongo_schema(), query)
+
+
+# Generators measured by the benchmark.
+TARGETS = {"generate_sql_query": sql_target, "mongo_compile": mongo_target}
+
+
+def call(target, query):
+    """
+    Translate a single query. Queries the generator rejects still count
+    towards the measurements; return False for them.
+    """
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            target(query)
+        return True
+    except Exception:
+        return False
+
+
+def percentile(ordered, fraction):
+    """
+    Return the nearest-rank percentile of a sorted list.
+    """
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def measure_latency(target, queries, runs, warmup):
+    """
+    Return the throughput and latency of a generator over the corpus.
+    """
+    for _ in range(warmup):
+        for query in queries:
+            call(target, query)
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in queries:
+            call_start = time.perf_counter()
+            if not call(target, query):
+                errors += 1
+            latencies.append((time.perf_counter() - call_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    return {
+        "calls": len(ordered),
+        "errors": errors,
+        "qps": len(ordered) / elapsed,
+        "mean_ms": sum(ordered) / len(ordered),
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "max_ms": ordered[-1],
+    }
+
+
+def measure_memory(target, queries):
+    """
+    Return the peak memory allocated by a call (tracemalloc), in KB.
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for query in queries:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            call(target, query)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - baseline) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {"peak_kb_mean": sum(peaks) / len(peaks), "peak_kb_max": max(peaks)}
+
+
+def get_environment():
+    """
+    Return the commit and the platform of the run.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results with a baseline results file.
+
+    Returns:
+        dict: Mapping of target to metric to the baseline value, the current
+            value, the relative change and whether it is a regression.
+    """
+    comparison = {}
+    for target, metrics in results["targets"].items():
+        baseline_metrics = baseline.get("targets", {}).get(target)
+        if baseline_metrics is None:
+            continue
+        comparison[target] = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = baseline_metrics.get(metric), metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            comparison[target][metric] = {"baseline": before, "current": after, "change": change,
+                                          "regression": worse > tolerance}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput, latency and memory of the translation.")
+    parser.add_argument("--runs", type=int, default=5, help="Timed passes over the corpus.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes over the corpus.")
+    parser.add_argument("--synthetic", type=int, default=200, help="Number of synthetic queries in the corpus.")
+    parser.add_argument("--seed", type=int, default=551, help="Seed of the synthetic queries.")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS),
+                        help="Generators to measure.")
+    parser.add_argument("--output", help="Optional path of the JSON results file.")
+    parser.add_argument("--baseline", help="Optional results file of an earlier run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative change of a metric reported as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if a metric regressed.")
+    parser.add_argument("--no-fast-path", action="store_true", help="Parse every query with the spaCy model.")
+    args = parser.parse_args()
+
+    # The generators log their fallbacks; keep them out of the measurements.
+    logging.basicConfig(level=logging.ERROR)
+
+    queries = benchmark_corpus(args.synthetic, args.seed)
+
+    # Measure compilation, not translation cache hits.
+    translation_cache.configure(maxsize=0)
+    fast_path.configure(enabled=not args.no_fast_path)
+    fast_path.reset()
+
+    # Load the shared pipeline outside of the measurements.
+    get_nlp()
+
+    results = {
+        "benchmark": "translate",
+        "environment": get_environment(),
+        "corpus": {"queries": len(queries), "seed": args.seed,
+                   "sha1": hashlib.sha1("\n".join(queries).encode("utf-8")).hexdigest()},
+        "settings": {"runs": args.runs, "warmup": args.warmup, "fast_path": fast_path.enabled},
+        "targets": {},
+    }
+
+    for name in args.targets:
+        metrics = measure_latency(TARGETS[name], queries, args.runs, args.warmup)
+        metrics.update(measure_memory(TARGETS[name], queries))
+        results["targets"][name] = metrics
+
+    results["fast_path"] = fast_path.stats()
+    results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("corpus", {}).get("sha1") != results["corpus"]["sha1"]:
+            print("Warning: the baseline was measured on a different corpus.", file=sys.stderr)
+        results["comparison"] = compare(results, baseline, args.tolerance)
+        regressions = [f"{target}.{metric} {values['change']:+.1%}"
+                       for target, metrics in results["comparison"].items()
+                       for metric, values in metrics.items() if values["regression"]]
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=4)
+
+    if regressions:
+        print("Regressions: " + ", ".join(regressions), file=sys.stderr)
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
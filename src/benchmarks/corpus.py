@@ -0,0 +1,131 @@
+'''
+Query corpus and schemas shared by the benchmark scripts.
+
+The schemas mirror the loan, salaries and purchases data sets in the data
+directory, so the benchmarks run offline without a database.
+'''
+import os
+import random
+import re
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from sample_queries import sample_queries
+
+# Columns of the data sets in the data directory.
+DATA_SET_COLUMNS = {
+    'salaries': ['work_year', 'person_gender', 'experience_level', 'employment_type', 'job_title', 'salary',
+                 'income_class', 'salary_currency', 'salary_in_usd', 'employee_residence', 'remote_ratio',
+                 'company_location', 'company_size'],
+    'loan': ['person_age', 'person_gender', 'person_education', 'person_income', 'income_class', 'person_emp_exp',
+             'person_home_ownership', 'loan_amnt', 'loan_intent', 'loan_int_rate', 'loan_percent_income',
+             'cb_person_cred_hist_length', 'credit_score', 'previous_loan_defaults_on_file', 'loan_status'],
+    'purchases': ['person_age', 'person_gender', 'person_income', 'income_class', 'number_of_purchases',
+                  'product_category', 'time_on_site', 'loyalty_program', 'discounts', 'purchase_status'],
+}
+
+
+def sql_schema():
+    """
+    Return the schema in the format returned by DataSetProcessor.getMySQLSchema.
+    """
+    schema = {'tables': list(DATA_SET_COLUMNS)}
+    schema.update({table: list(columns) for table, columns in DATA_SET_COLUMNS.items()})
+    return schema
+
+
+def mongo_schema():
+    """
+    Return the schema in the format returned by DataSetProcessor.getMongoDBSchema.
+    """
+    schema = {'collections': list(DATA_SET_COLUMNS)}
+    schema.update({collection: list(keys) for collection, keys in DATA_SET_COLUMNS.items()})
+    return schema
+
+
+def sample_corpus():
+    """
+    Return the natural language queries from sample_queries.py.
+    """
+    return list(sample_queries)
+
+
+# Source files whose commented examples are part of the corpus.
+GENERATOR_FILES = ('SQLCodeGenerator.py', 'MongoDBCodeGenerator.py')
+
+# Example values used in the conditions of the synthetic queries.
+TEXT_VALUES = ['female', 'male', 'middle', 'high', 'low', 'rent', 'own', 'mortgage']
+NUMBER_VALUES = [25, 30, 2021, 20000, 50000, 100000]
+
+# Templates of the synthetic queries. The placeholders are filled from a data set schema.
+SYNTHETIC_TEMPLATES = [
+    "{select} {column} from {table}",
+    "{select} {column} and {other} from {table}",
+    "{select} {column} from {table} where {other} equal {text}",
+    "{select} {column} from {table} where {other} is greater than {number}",
+    "{select} {column} from {table} where {other} is less than {number}",
+    "{select} {column} and {other} from {table} {order} by {other} {direction}",
+    "{aggregate} {column} from {table} by {other}",
+    "{aggregate} {column} from {table} group by {other} having {third} equal {text}",
+    "{select} {column} from {table} where {other} equal {text} sort by {third} {direction}",
+    "{join} {table} and {table2} to find the {aggregate} of {column} grouped by {other}",
+]
+
+SELECT_WORDS = ['select', 'choose', 'take', 'pick']
+AGGREGATE_WORDS = ['sum', 'average', 'min', 'max', 'count', 'total']
+ORDER_WORDS = ['sort', 'order', 'arrange']
+DIRECTION_WORDS = ['ascending', 'descending']
+JOIN_WORDS = ['combine', 'unite', 'blend', 'merge']
+
+
+def generator_examples():
+    """
+    Return the example queries in the comments of the code generators.
+    """
+    examples = []
+    for file_name in GENERATOR_FILES:
+        with open(os.path.join(SRC_DIR, file_name), encoding='utf-8') as source:
+            for line in source:
+                match = re.match(r'\s*#[#\s]*\w*query\s*=\s*"([^"]+)"', line)
+                if match:
+                    examples.append(match.group(1))
+    return examples
+
+
+def synthetic_corpus(count=200, seed=551):
+    """
+    Return synthetic query variants over the data set schemas.
+
+    The variants are drawn with a fixed seed, so the corpus is the same on every run.
+
+    Args:
+        count (int): Number of queries.
+        seed (int): Seed of the random generator.
+    """
+    rng = random.Random(seed)
+    tables = sorted(DATA_SET_COLUMNS)
+    queries = []
+
+    for index in range(count):
+        template = SYNTHETIC_TEMPLATES[index % len(SYNTHETIC_TEMPLATES)]
+        table, table2 = rng.sample(tables, 2)
+        column, other, third = rng.sample(DATA_SET_COLUMNS[table], 3)
+        queries.append(template.format(
+            select=rng.choice(SELECT_WORDS), aggregate=rng.choice(AGGREGATE_WORDS),
+            order=rng.choice(ORDER_WORDS), direction=rng.choice(DIRECTION_WORDS), join=rng.choice(JOIN_WORDS),
+            table=table, table2=table2, column=column, other=other, third=third,
+            text=rng.choice(TEXT_VALUES), number=rng.choice(NUMBER_VALUES)))
+
+    return queries
+
+
+def benchmark_corpus(synthetic_count=200, seed=551):
+    """
+    Return the benchmark corpus: the sample queries, the generator examples and
+    the synthetic variants, without duplicates and in a fixed order.
+    """
+    corpus = sample_corpus() + generator_examples() + synthetic_corpus(synthetic_count, seed)
+    return list(dict.fromkeys(query.strip() for query in corpus if query.strip()))
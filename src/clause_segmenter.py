@@ -0,0 +1,231 @@
+'''
+Single-pass clause segmentation of a natural language query.
+
+The clause generators each look for the keyword that starts their clause (e.g.
+"where", "group", "having") and read the tokens up to the keyword of the next
+clause. Rescanning the query from every keyword they meet makes a translation
+quadratic in the length of long questions. The segmenter walks the query once
+instead and records, for every clause rule:
+
+    - the span of the clause: from the first start keyword up to (not
+      including) the next exit keyword, or the end of the query;
+    - the clause role of every token (select, from, where, group, having,
+      order or join): the role of the most recently opened clause.
+
+Each code generator declares its clause rules next to its keyword lists (see
+sql_clauses in SQLCodeGenerator.py and mongo_clauses in MongoDBCodeGenerator.py).
+A rule matches either the parsed tokens (by lemma, lowercase text or text) or
+the whitespace-separated words of the query (by text or lowercase text), as the
+MongoDB stages do.
+
+The segmented query also answers the other lookups the generators repeated over
+the query in constant time: the positions of a keyword and the next token that
+is not a stop word.
+
+Main function:
+    segments = segment_query(query, doc, sql_clauses)
+    span = segments.span("where")  # (start, end) or None
+'''
+from typing import NamedTuple
+
+
+class ClauseRule(NamedTuple):
+    """
+    A clause of the query: the span from the first start keyword to the next exit keyword.
+
+    Attributes:
+        name (str): Name of the span, e.g. "select" or "select_agg".
+        role (str): Clause role tagged on the tokens of the span.
+        start (frozenset): Keywords that open the span. Only the first one found opens it.
+        exit (frozenset): Keywords that close the span. The closing token is not part
+            of the span. Empty: the span runs to the end of the query.
+        key (str): Attribute matched against the keywords: "lemma_", "lower_" or "text".
+        stream (str): "tokens" (the parsed tokens) or "words" (the whitespace-separated
+            words of the query, matched by "text" or "lower_").
+    """
+    name: str
+    role: str
+    start: frozenset
+    exit: frozenset = frozenset()
+    key: str = "lemma_"
+    stream: str = "tokens"
+
+
+def clause_rule(name, role, start, exit=(), key="lemma_", stream="tokens"):
+    """
+    Build a ClauseRule from any iterables of keywords.
+    """
+    return ClauseRule(name, role, frozenset(start), frozenset(exit), key, stream)
+
+
+class SegmentedQuery:
+    """
+    A query segmented into clauses, built by segment_query.
+
+    Attributes:
+        doc (ParsedQuery): The parsed query (None if it was segmented by words only).
+        words (list): The whitespace-separated words of the query.
+        lower_words (list): The lowercase words.
+        roles (list): The clause role of each token, None outside every clause.
+        word_roles (list): The clause role of each word, None outside every clause.
+    """
+
+    __slots__ = ("doc", "words", "lower_words", "roles", "word_roles", "_spans", "_values", "_positions",
+                 "_next_non_stop")
+
+    def __init__(self, doc, words, lower_words, roles, word_roles, spans, values, next_non_stop):
+        self.doc = doc
+        self.words = words
+        self.lower_words = lower_words
+        self.roles = roles
+        self.word_roles = word_roles
+        self._spans = spans
+        self._values = values
+        self._positions = {}
+        self._next_non_stop = next_non_stop
+
+    def span(self, name):
+        """
+        Return the (start, end) indexes of a clause, or None if it is not in the query.
+
+        start is the index of the start keyword and end the index of the exit keyword
+        (or the length of the stream), in the stream of the rule.
+        """
+        return self._spans.get(name)
+
+    def positions(self, keyword, key="lower_", stream="tokens"):
+        """
+        Return the indexes of the tokens (or words) whose attribute equals the keyword.
+        """
+        index = self._positions.get((stream, key))
+        if index is None:
+            index = {}
+            for position, value in enumerate(self._values[stream][key]):
+                index.setdefault(value, []).append(position)
+            self._positions[(stream, key)] = index
+        return index.get(keyword, [])
+
+    def find(self, keywords, key="lower_", stream="tokens"):
+        """
+        Return the index of the first token (or word) that matches any of the keywords, or None.
+        """
+        found = [positions[0] for positions in (self.positions(keyword, key, stream) for keyword in keywords)
+                 if positions]
+        return min(found) if found else None
+
+    def has(self, keywords, key="lower_", stream="tokens"):
+        """
+        Check whether any token (or word) matches any of the keywords.
+        """
+        return self.find(keywords, key, stream) is not None
+
+    def next_non_stop(self, index):
+        """
+        Return the index of the first token at or after index that is not a stop word, or None.
+        """
+        if index >= len(self._next_non_stop):
+            return None
+        return self._next_non_stop[index]
+
+
+def segment_stream(values, rules, length):
+    """
+    Walk a stream of tokens (or words) once and find the first span of every rule.
+
+    Only the positions of the keywords of the rules can open or close a clause, so
+    the other positions just take the role of the enclosing clause.
+
+    Args:
+        values (dict): The lists of matched attributes of the stream, by key.
+        rules (list): The clause rules of the stream.
+        length (int): Number of tokens (or words) in the stream.
+
+    Returns:
+        tuple: (spans, roles), the mapping of rule name to (start, end) and the
+            clause role of each position.
+    """
+    keywords = {}
+    for rule in rules:
+        keywords.setdefault(rule.key, set()).update(rule.start, rule.exit)
+    keyword_positions = sorted({position for key, matched in keywords.items()
+                                for position, value in enumerate(values[key]) if value in matched})
+
+    spans = {}
+    roles = [None] * length
+    pending = list(rules)
+    open_rules = []
+    role = None
+    previous = 0
+
+    for position in keyword_positions:
+        roles[previous:position] = [role] * (position - previous)
+        previous = position
+
+        # Close the open clauses at their exit keyword
+        if open_rules:
+            still_open = []
+            for rule in open_rules:
+                if rule.exit and values[rule.key][position] in rule.exit:
+                    spans[rule.name] = (spans[rule.name][0], position)
+                else:
+                    still_open.append(rule)
+            open_rules = still_open
+
+        # Open the clauses that start here (once per rule)
+        if pending:
+            not_started = []
+            for rule in pending:
+                if values[rule.key][position] in rule.start:
+                    spans[rule.name] = (position, length)
+                    open_rules.append(rule)
+                else:
+                    not_started.append(rule)
+            pending = not_started
+
+        role = open_rules[-1].role if open_rules else None
+
+    roles[previous:length] = [role] * (length - previous)
+    return spans, roles
+
+
+def segment_query(query, doc=None, rules=()):
+    """
+    Segment a query into the clauses of the rules in one pass over its tokens and one over its words.
+
+    Args:
+        query (str): The natural language query.
+        doc (ParsedQuery): The parsed query. If None, only the rules on words are applied.
+        rules (iterable): The clause rules of the code generator.
+
+    Returns:
+        SegmentedQuery: The segmented query.
+    """
+    tokens = list(doc) if doc is not None else []
+    words = query.split()
+    lower_words = [word.lower() for word in words]
+
+    values = {
+        "tokens": {
+            "text": [token.text for token in tokens],
+            "lower_": [token.lower_ for token in tokens],
+            "lemma_": [token.lemma_ for token in tokens],
+        },
+        "words": {"text": words, "lower_": lower_words},
+    }
+
+    token_rules = [rule for rule in rules if rule.stream == "tokens"] if doc is not None else []
+    word_rules = [rule for rule in rules if rule.stream == "words"]
+
+    spans, roles = segment_stream(values["tokens"], token_rules, len(tokens))
+    word_spans, word_roles = segment_stream(values["words"], word_rules, len(words))
+    spans.update(word_spans)
+
+    # Index of the next token that is not a stop word, from the end
+    next_non_stop = [None] * len(tokens)
+    following = None
+    for position in range(len(tokens) - 1, -1, -1):
+        if not tokens[position].is_stop:
+            following = position
+        next_non_stop[position] = following
+
+    return SegmentedQuery(doc, words, lower_words, roles, word_roles, spans, values, next_non_stop)
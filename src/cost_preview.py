@@ -0,0 +1,310 @@
+# Load dependent libraries.
+from query_executor import QueryExecutor
+
+# MySQL access types that read every row of a table or index.
+FULL_SCAN_ACCESS_TYPES = {'ALL': 'full table scan', 'index': 'full index scan'}
+
+# MongoDB plan stages that read every document of a collection.
+FULL_SCAN_STAGES = {'COLLSCAN'}
+
+# MongoDB plan stages that read an index.
+INDEX_SCAN_STAGES = {'IXSCAN', 'EXPRESS_IXSCAN', 'IDHACK', 'EXPRESS_CLUSTERED_IXSCAN', 'COUNT_SCAN', 'DISTINCT_SCAN'}
+
+#
+# This class estimates the cost of a generated query before it is run, from
+# the execution plan of the database: EXPLAIN FORMAT=JSON for MySQL and the
+# explain command for MongoDB finds and aggregations. Neither executes the
+# query (unless the MongoDB verbosity is 'executionStats').
+#
+# Each estimate is a dictionary with:
+#   'rows_examined': estimated rows/documents read (None if unknown).
+#   'rows_returned': estimated rows produced by the joins (MySQL only).
+#   'cost': the query cost of the MySQL optimizer.
+#   'full_scans': the tables/collections read by a full scan.
+#   'indexes': the indexes used, as 'table.index'.
+#   'join_blowup': True if a join is expected to produce more rows than its largest input.
+#   'warnings': printable descriptions of the above.
+#   'status': 'ok', 'warn' (above warn_rows or join blow-up), 'refuse'
+#             (above refuse_rows) or 'unknown' (the plan could not be read, see 'error').
+#
+class CostPreview:
+
+    # Constructor method to initialize class variables.
+    # warn_rows: rows examined above which the query is flagged (None disables the warning).
+    # refuse_rows: rows examined above which the query must not be run (None never refuses).
+    # mongo_verbosity: verbosity of the MongoDB explain command.
+    def __init__(self, query_executor: QueryExecutor = None, warn_rows: int = 100000, refuse_rows: int = None,
+                 mongo_verbosity: str = 'queryPlanner'):
+
+        self.query_executor = query_executor or QueryExecutor()
+        self.warn_rows = warn_rows
+        self.refuse_rows = refuse_rows
+        self.mongo_verbosity = mongo_verbosity
+
+    # Return an empty estimate.
+    @staticmethod
+    def getEstimate(backend: str):
+
+        return {'backend': backend, 'rows_examined': None, 'rows_returned': None, 'cost': None,
+                'full_scans': [], 'indexes': [], 'join_blowup': False, 'warnings': [], 'status': 'unknown'}
+
+    # Estimate the cost of an SQL statement.
+    def estimateMySQLQuery(self, query: str):
+
+        estimate = self.getEstimate('mysql')
+
+        try:
+            plan = self.query_executor.explainMySQLQuery(query)
+        except Exception as ex:
+            print(f"Error::estimateMySQLQuery::{ex}")
+            estimate['error'] = str(ex)
+            return estimate
+
+        query_block = plan.get('query_block', plan)
+        query_cost = query_block.get('cost_info', {}).get('query_cost')
+        if query_cost is not None:
+            estimate['cost'] = float(query_cost)
+
+        estimate['rows_examined'], estimate['rows_returned'] = self.addMySQLPlan(estimate, query_block)
+
+        return self.checkEstimate(estimate)
+
+    # Add the tables of a MySQL plan node to the estimate.
+    # Return the rows examined and the rows produced by the node.
+    def addMySQLPlan(self, estimate: dict, node):
+
+        rows_examined, rows_produced = 0, 0
+
+        if isinstance(node, list):
+            for child in node:
+                child_examined, child_produced = self.addMySQLPlan(estimate, child)
+                rows_examined += child_examined
+                rows_produced = max(rows_produced, child_produced)
+            return rows_examined, rows_produced
+
+        if not isinstance(node, dict):
+            return 0, 0
+
+        # The tables of a nested loop join are read once for every row produced by the tables before them.
+        if isinstance(node.get('nested_loop'), list):
+
+            prefix_rows, largest_input = 1, 0
+
+            for child in node['nested_loop']:
+
+                table = child.get('table', child)
+                rows_per_scan = float(table.get('rows_examined_per_scan', 0))
+
+                # A table read through a join buffer (block nested loop or hash join) is scanned once.
+                scans = 1 if table.get('using_join_buffer') else prefix_rows
+
+                # The child counts one scan of the table.
+                child_examined, child_produced = self.addMySQLPlan(estimate, child)
+                rows_examined += child_examined + (scans - 1) * rows_per_scan
+
+                largest_input = max(largest_input, rows_per_scan)
+                prefix_rows = max(child_produced, 1)
+
+            if len(node['nested_loop']) > 1 and prefix_rows > largest_input:
+                estimate['join_blowup'] = True
+                estimate['warnings'].append(f"The join is expected to produce {prefix_rows:,.0f} rows "
+                                            f"from tables of at most {largest_input:,.0f} rows.")
+
+            node = {key: value for key, value in node.items() if key != 'nested_loop'}
+            remaining_examined, remaining_produced = self.addMySQLPlan(estimate, node)
+
+            return rows_examined + remaining_examined, max(prefix_rows, remaining_produced)
+
+        if 'table_name' in node and 'access_type' in node:
+
+            table_name = node['table_name']
+            rows_examined = float(node.get('rows_examined_per_scan', 0))
+            rows_produced = float(node.get('rows_produced_per_join', 0))
+
+            if node['access_type'] in FULL_SCAN_ACCESS_TYPES:
+                estimate['full_scans'].append(table_name)
+                estimate['warnings'].append(f"A {FULL_SCAN_ACCESS_TYPES[node['access_type']]} of `{table_name}` "
+                                            f"reads {rows_examined:,.0f} rows.")
+
+            if node.get('key'):
+                estimate['indexes'].append(f"{table_name}.{node['key']}")
+
+        # Subqueries, derived tables, unions, sorting and grouping operations.
+        for key, child in node.items():
+            if isinstance(child, (dict, list)) and key not in ('cost_info', 'used_columns', 'possible_keys',
+                                                               'used_key_parts', 'ref', 'key_parts'):
+                child_examined, child_produced = self.addMySQLPlan(estimate, child)
+                rows_examined += child_examined
+                rows_produced = max(rows_produced, child_produced)
+
+        return rows_examined, rows_produced
+
+    # Estimate the cost of a find query.
+    def estimateMongoFind(self, collection_name: str, query: dict, limit = 0, projection: dict = None):
+
+        estimate = self.getEstimate('mongodb')
+
+        try:
+            plan = self.query_executor.explainMongoFind(collection_name, query, limit, projection, self.mongo_verbosity)
+            self.addMongoPlan(estimate, collection_name, plan)
+        except Exception as ex:
+            print(f"Error::estimateMongoFind::{ex}")
+            estimate['error'] = str(ex)
+            return estimate
+
+        return self.checkEstimate(estimate)
+
+    # Estimate the cost of an aggregate query, including the $lookup stages.
+    def estimateMongoAggregate(self, collection_name: str, query: list):
+
+        estimate = self.getEstimate('mongodb')
+
+        try:
+            plan = self.query_executor.explainMongoAggregate(collection_name, query, self.mongo_verbosity)
+            self.addMongoPlan(estimate, collection_name, plan)
+            self.addMongoLookups(estimate, collection_name, query)
+        except Exception as ex:
+            print(f"Error::estimateMongoAggregate::{ex}")
+            estimate['error'] = str(ex)
+            return estimate
+
+        return self.checkEstimate(estimate)
+
+    # Estimate the cost of a generated MongoDB query, a (method, collection, pipeline) tuple.
+    def estimateMongoQuery(self, mongo_query: tuple):
+
+        execute_on, collection_name, pipeline = mongo_query
+
+        if execute_on == "find":
+            find_filter = next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+            find_projection = next((stage["$project"] for stage in pipeline if "$project" in stage), None)
+            find_limit = next((stage["$limit"] for stage in pipeline if "$limit" in stage), 0)
+            return self.estimateMongoFind(collection_name, find_filter, find_limit, find_projection)
+
+        return self.estimateMongoAggregate(collection_name, pipeline)
+
+    # Add the winning plan of a MongoDB explain result to the estimate.
+    def addMongoPlan(self, estimate: dict, collection_name: str, plan: dict):
+
+        winning_plans, execution_stats = [], []
+
+        # Find and single-stage plans are at the top; aggregations nest them in stages ($cursor) or shards.
+        pending = [plan]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, dict):
+                for key, child in node.items():
+                    if key == 'winningPlan':
+                        winning_plans.append(child)
+                    elif key == 'executionStats':
+                        execution_stats.append(child)
+                    elif key != 'rejectedPlans':
+                        pending.append(child)
+            elif isinstance(node, list):
+                pending.extend(node)
+
+        full_scan = False
+
+        for winning_plan in winning_plans:
+            pending = [winning_plan]
+            while pending:
+                node = pending.pop()
+                if isinstance(node, dict):
+                    if node.get('stage') in FULL_SCAN_STAGES:
+                        full_scan = True
+                    elif node.get('stage') in INDEX_SCAN_STAGES:
+                        estimate['indexes'].append(f"{collection_name}.{node.get('indexName', '_id_')}")
+                    pending.extend(node.values())
+                elif isinstance(node, list):
+                    pending.extend(node)
+
+        if full_scan:
+            estimate['full_scans'].append(collection_name)
+
+        if full_scan:
+            document_count = self.getDocumentCount(collection_name)
+            estimate['rows_examined'] = document_count
+            estimate['warnings'].append(f"A collection scan of `{collection_name}` reads {document_count:,} documents.")
+
+        # The documents examined are only known exactly when the query was executed.
+        if execution_stats:
+            estimate['rows_examined'] = sum(stats.get('totalDocsExamined', 0) + stats.get('totalKeysExamined', 0)
+                                            for stats in execution_stats)
+
+    # Add the $lookup stages of a pipeline to the estimate. A $lookup whose
+    # foreign field is not indexed scans the joined collection for every input document.
+    def addMongoLookups(self, estimate: dict, collection_name: str, query: list):
+
+        for stage in query or []:
+
+            lookup = stage.get('$lookup') if isinstance(stage, dict) else None
+            if not isinstance(lookup, dict) or 'from' not in lookup:
+                continue
+
+            foreign_name = lookup['from']
+            foreign_field = lookup.get('foreignField')
+
+            if foreign_field is not None and self.isMongoFieldIndexed(foreign_name, foreign_field):
+                estimate['indexes'].append(f"{foreign_name}.{foreign_field}")
+                continue
+
+            input_documents = estimate['rows_examined'] or self.getDocumentCount(collection_name)
+            foreign_documents = self.getDocumentCount(foreign_name)
+
+            estimate['full_scans'].append(foreign_name)
+            estimate['join_blowup'] = True
+            estimate['rows_examined'] = (estimate['rows_examined'] or 0) + input_documents * foreign_documents
+            estimate['warnings'].append(f"The $lookup scans the {foreign_documents:,} documents of `{foreign_name}` "
+                                        f"for each of {input_documents:,} input documents.")
+
+    # Return True if a field is the leading key of an index of a collection.
+    def isMongoFieldIndexed(self, collection_name: str, field: str):
+
+        index_information = self.query_executor.getMongoClient()[self.query_executor.database][collection_name].index_information()
+
+        return any(index['key'][0][0] == field for index in index_information.values())
+
+    # Return the estimated number of documents of a collection.
+    def getDocumentCount(self, collection_name: str):
+
+        return self.query_executor.getMongoClient()[self.query_executor.database][collection_name].estimated_document_count()
+
+    # Set the status of an estimate from the thresholds.
+    def checkEstimate(self, estimate: dict):
+
+        rows_examined = estimate['rows_examined']
+
+        if rows_examined is not None:
+            estimate['rows_examined'] = int(rows_examined)
+        if estimate['rows_returned'] is not None:
+            estimate['rows_returned'] = int(estimate['rows_returned'])
+
+        if self.refuse_rows is not None and rows_examined is not None and rows_examined > self.refuse_rows:
+            estimate['status'] = 'refuse'
+            estimate['warnings'].append(f"The query would examine more than {self.refuse_rows:,} rows.")
+        elif (self.warn_rows is not None and rows_examined is not None and rows_examined > self.warn_rows) \
+                or estimate['join_blowup']:
+            estimate['status'] = 'warn'
+        else:
+            estimate['status'] = 'ok'
+
+        return estimate
+
+    # Return a one-line summary of an estimate.
+    @staticmethod
+    def describeEstimate(estimate: dict):
+
+        if estimate['status'] == 'unknown':
+            return f"Cost preview unavailable: {estimate.get('error', 'no execution plan')}"
+
+        summary = []
+        if estimate['rows_examined'] is not None:
+            summary.append(f"~{estimate['rows_examined']:,} rows examined")
+        if estimate['rows_returned'] is not None:
+            summary.append(f"~{estimate['rows_returned']:,} rows returned")
+        if estimate['cost'] is not None:
+            summary.append(f"cost {estimate['cost']:,.1f}")
+        summary.append(f"full scans: {', '.join(estimate['full_scans']) or 'none'}")
+        summary.append(f"indexes: {', '.join(estimate['indexes']) or 'none'}")
+
+        return "; ".join(summary)
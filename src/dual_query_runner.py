@@ -0,0 +1,158 @@
+# Load dependent libraries.
+import asyncio
+import time
+
+from async_query_executor import AsyncQueryExecutor
+
+from data_set_processor import DataSetProcessor
+
+from MongoDBCodeGenerator import mongo_compile
+
+from query_executor import CancelHandle
+
+from tracing import tracer
+
+from SQLCodeGenerator import generate_sql_query
+
+#
+# This class runs the same natural language question against MySQL and
+# MongoDB at the same time. Each engine fetches its schema, compiles the
+# question and executes the translation independently of the other, so the
+# wall time is close to that of the slower engine rather than the sum.
+#
+# Every method returns one report per engine: a dictionary with the
+# translation ('query'), the result data frame ('result'), the error message
+# if a step failed ('error') and the time of each step in milliseconds
+# ('compile_ms', 'execute_ms', 'total_ms'). An error in one engine does not
+# affect the other.
+#
+class DualQueryRunner:
+
+    # Constructor method to initialize class variables.
+    # limit: number of rows/documents requested from each engine (None returns every row).
+    def __init__(self, processor: DataSetProcessor = None, async_query_executor: AsyncQueryExecutor = None,
+                 limit: int = 10):
+
+        self.processor = processor or DataSetProcessor()
+        self.async_query_executor = async_query_executor or self.processor.async_query_executor
+        self.limit = limit
+
+    # Compile the question to SQL.
+    async def compileSQL(self, natural_query: str, tables: list, report: dict):
+
+        start_time = time.perf_counter()
+
+        sql_schema_dt = await self.processor.getMySQLSchemaAsync(tables)
+        report['query'] = await self.async_query_executor.runBlocking(generate_sql_query, natural_query,
+                                                                      sql_schema_dt, self.limit)
+
+        report['compile_ms'] = (time.perf_counter() - start_time) * 1000
+
+    # Compile the question to a MongoDB query.
+    async def compileMongo(self, natural_query: str, report: dict):
+
+        start_time = time.perf_counter()
+
+        mongo_schema_dt = await self.processor.getMongoDBSchemaAsync()
+        report['query'] = await self.async_query_executor.runBlocking(mongo_compile, mongo_schema_dt,
+                                                                      natural_query, self.limit)
+
+        report['compile_ms'] = (time.perf_counter() - start_time) * 1000
+
+    # Execute the SQL translation.
+    async def executeSQL(self, report: dict, timeout: float = None, cancel_handle: CancelHandle = None):
+
+        start_time = time.perf_counter()
+
+        report['result'] = await self.async_query_executor.execMySQLQuery(report['query'], timeout=timeout,
+                                                                          cancel_handle=cancel_handle)
+
+        report['execute_ms'] = (time.perf_counter() - start_time) * 1000
+
+    # Execute the MongoDB translation, a (method, collection, pipeline) tuple.
+    async def executeMongo(self, report: dict, timeout: float = None, cancel_handle: CancelHandle = None):
+
+        start_time = time.perf_counter()
+
+        execute_on, collection_name, pipeline = report['query']
+
+        if execute_on == "find":
+            find_filter = next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+            find_projection = next((stage["$project"] for stage in pipeline if "$project" in stage), None)
+            report['result'] = await self.async_query_executor.execMongoFind(collection_name, find_filter,
+                                                                             self.limit or 0, find_projection,
+                                                                             timeout=timeout,
+                                                                             cancel_handle=cancel_handle)
+        else:
+            report['result'] = await self.async_query_executor.execMongoAggregate(collection_name, pipeline,
+                                                                                  timeout=timeout,
+                                                                                  cancel_handle=cancel_handle)
+
+        report['execute_ms'] = (time.perf_counter() - start_time) * 1000
+
+    # Run the given steps of one engine, recording the first error and the total time.
+    @staticmethod
+    async def runSteps(report: dict, *steps):
+
+        start_time = time.perf_counter()
+
+        try:
+            for step in steps:
+                await step()
+
+        except asyncio.TimeoutError:
+            report['error'] = "The query timed out."
+
+        except Exception as ex:
+            report['error'] = str(ex) or type(ex).__name__
+
+        report['total_ms'] = (time.perf_counter() - start_time) * 1000
+
+        return report
+
+    # Compile the question for both engines concurrently.
+    # Returns (sql report, mongo report, wall time in milliseconds).
+    async def compileBoth(self, natural_query: str, tables: list):
+
+        sql_report, mongo_report = dict(), dict()
+
+        return await self.runBoth(
+            self.runSteps(sql_report, lambda: self.compileSQL(natural_query, tables, sql_report)),
+            self.runSteps(mongo_report, lambda: self.compileMongo(natural_query, mongo_report)))
+
+    # Execute compiled translations on both engines concurrently.
+    # cancel_handle (optional) stops the queries of both engines.
+    # Returns (sql report, mongo report, wall time in milliseconds).
+    async def executeBoth(self, sql_query: str, mongo_query: tuple, timeout: float = None,
+                          cancel_handle: CancelHandle = None):
+
+        sql_report, mongo_report = {'query': sql_query}, {'query': mongo_query}
+
+        return await self.runBoth(
+            self.runSteps(sql_report, lambda: self.executeSQL(sql_report, timeout, cancel_handle)),
+            self.runSteps(mongo_report, lambda: self.executeMongo(mongo_report, timeout, cancel_handle)))
+
+    # Compile and execute the question on both engines concurrently.
+    # cancel_handle (optional) stops the queries of both engines.
+    # Returns (sql report, mongo report, wall time in milliseconds).
+    async def askBoth(self, natural_query: str, tables: list, timeout: float = None,
+                      cancel_handle: CancelHandle = None):
+
+        sql_report, mongo_report = dict(), dict()
+
+        return await self.runBoth(
+            self.runSteps(sql_report, lambda: self.compileSQL(natural_query, tables, sql_report),
+                          lambda: self.executeSQL(sql_report, timeout, cancel_handle)),
+            self.runSteps(mongo_report, lambda: self.compileMongo(natural_query, mongo_report),
+                          lambda: self.executeMongo(mongo_report, timeout, cancel_handle)))
+
+    # Await the SQL and MongoDB steps together and measure the wall time.
+    @staticmethod
+    async def runBoth(sql_steps, mongo_steps):
+
+        start_time = time.perf_counter()
+
+        with tracer.span("dual.run"):
+            sql_report, mongo_report = await asyncio.gather(sql_steps, mongo_steps)
+
+        return sql_report, mongo_report, (time.perf_counter() - start_time) * 1000
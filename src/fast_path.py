@@ -0,0 +1,260 @@
+'''
+Rule-based fast path for templated questions.
+
+Most questions follow the templates of sample_queries.py, e.g. "take X from T
+where C equal V" or "sum X from T by G": they only contain the keywords of the
+code generators (ping_select, ping_where, ping_agg, ...), a few function words,
+schema identifiers and literals. The clause generators read the lemma and part
+of speech of these words, which the fast path can assign from a fixed lexicon
+instead of running the statistical spaCy model.
+
+The question is split by the blank English pipeline (see nlp_models.get_tokenizer),
+which yields the same tokens and lexical flags (is_stop, like_num) as the full
+pipeline. Each token is then tagged as:
+
+    - a keyword or a function word: lemma and part of speech from the lexicon;
+    - a schema identifier (table or column name): a noun (proper noun if it
+      starts with a capital letter);
+    - a number or a punctuation mark;
+    - a literal value, only right after a condition word or a column name
+      (e.g. "female" in "person_gender equal female"): a noun or proper noun.
+
+If a token cannot be accounted for (an unknown word, a literal elsewhere, a
+capitalized keyword, which the model may tag as a proper noun, or a word that
+the model could lemmatize to a keyword, e.g. "sorted"), the fast path declines
+and the question goes through the full NLP path. A code generator can also pass
+a check that declines the questions whose translation would depend on tags the
+lexicon cannot be sure of.
+
+The hits, misses and the reasons of the misses are counted (fast_path.stats()).
+The fast path can be disabled with the CHATDB_FAST_PATH environment variable
+("0") or fast_path.configure(enabled=False).
+
+Main function:
+    doc = fast_path.parse(query, schema_index, "sql")  # ParsedQuery, or None to fall back
+'''
+import os
+import threading
+from collections import Counter
+
+from keyword_table import synonyms
+from nlp_models import get_tokenizer
+from query_parser import ParsedQuery, ParsedToken
+from tracing import traced
+
+# Whether the fast path is tried before the spaCy model.
+DEFAULT_ENABLED = os.environ.get("CHATDB_FAST_PATH", "1") != "0"
+
+# Keywords of the code generators: (lemma, part of speech) as tagged in templated questions.
+KEYWORDS = {
+    # Joins
+    "combine": ("combine", "VERB"), "unite": ("unite", "VERB"), "aggregate": ("aggregate", "VERB"),
+    "blend": ("blend", "VERB"), "mix": ("mix", "VERB"), "fuse": ("fuse", "VERB"),
+    "coalesce": ("coalesce", "VERB"), "meld": ("meld", "VERB"), "merge": ("merge", "VERB"),
+    "unify": ("unify", "VERB"), "connect": ("connect", "VERB"), "join": ("join", "VERB"),
+    "union": ("union", "NOUN"), "conjoin": ("conjoin", "VERB"), "link": ("link", "VERB"),
+    # Selection
+    "choose": ("choose", "VERB"), "take": ("take", "VERB"), "select": ("select", "VERB"),
+    "pick": ("pick", "VERB"),
+    # Conditions
+    "where": ("where", "SCONJ"), "if": ("if", "SCONJ"), "when": ("when", "SCONJ"),
+    "equal": ("equal", "ADJ"), "more": ("more", "ADJ"), "greater": ("great", "ADJ"), "less": ("less", "ADJ"),
+    # Grouping and aggregation
+    "group": ("group", "VERB"), "by": ("by", "ADP"), "for": ("for", "ADP"),
+    "sum": ("sum", "VERB"), "average": ("average", "NOUN"), "min": ("min", "NOUN"), "max": ("max", "NOUN"),
+    "count": ("count", "VERB"), "total": ("total", "NOUN"),
+    "having": ("have", "VERB"), "with": ("with", "ADP"),
+    # Ordering
+    "arrange": ("arrange", "VERB"), "order": ("order", "VERB"), "organize": ("organize", "VERB"),
+    "sort": ("sort", "VERB"), "descending": ("descend", "VERB"), "ascending": ("ascend", "VERB"),
+    # Source
+    "from": ("from", "ADP"),
+}
+# Synonyms of the join, select and sort verbs (see keyword_table.py).
+KEYWORDS.update({word: (word, "VERB") for word in synonyms() if word not in KEYWORDS})
+
+# Function words of templated questions: (lemma, part of speech).
+FUNCTION_WORDS = {
+    "the": ("the", "DET"), "a": ("a", "DET"), "an": ("an", "DET"), "all": ("all", "DET"),
+    "each": ("each", "DET"), "of": ("of", "ADP"), "to": ("to", "ADP"), "than": ("than", "ADP"),
+    "in": ("in", "ADP"), "on": ("on", "ADP"), "per": ("per", "ADP"), "and": ("and", "CCONJ"),
+    "is": ("be", "AUX"), "are": ("be", "AUX"),
+}
+
+# Words after which a literal value is expected.
+CONDITION_WORDS = {"equal", "more", "greater", "less"}
+
+# Keywords whose inflected forms (e.g. "sorted", "sums", "taking") the model lemmatizes to the
+# keyword, and irregular forms of them.
+INFLECTED_KEYWORDS = (
+    "combine", "unite", "aggregate", "blend", "mix", "fuse", "coalesce", "meld", "merge", "unify", "connect",
+    "join", "union", "conjoin", "link", "choose", "take", "select", "pick", "equal", "group", "arrange",
+    "order", "organize", "sort", "sum", "average", "min", "max", "count", "total",
+) + tuple(sorted(synonyms()))
+IRREGULAR_FORMS = {"took", "taken", "chose", "chosen"}
+KEYWORD_STEMS = tuple(keyword[:-1] if keyword[-1] in "ey" else keyword for keyword in INFLECTED_KEYWORDS)
+
+
+def may_inflect_keyword(word):
+    """
+    Check whether the model could lemmatize a word that is not a keyword to a keyword.
+
+    Args:
+        word (str): The lowercase word.
+
+    Returns:
+        bool: True for the alphabetic words that start like a keyword, and irregular forms.
+    """
+    return word in IRREGULAR_FORMS or (word.isalpha() and word.startswith(KEYWORD_STEMS))
+
+
+@traced("nlp.fast_path")
+def recognize(query, schema_index):
+    """
+    Tag a templated question with the lexicon, without the spaCy model.
+
+    Args:
+        query (str): The natural language query.
+        schema_index (SchemaIndex): The index of the schema the query is compiled against.
+
+    Returns:
+        tuple: (doc, reason), the ParsedQuery and None, or None and the reason the
+            question needs the full NLP path.
+    """
+    tokens = []
+    anchor = None  # The nearest preceding condition word or column name (stop words and punctuation skipped)
+
+    for token in get_tokenizer().make_doc(query):
+        lower = token.lower_
+        is_column = token.text in schema_index.column_tables
+
+        if token.is_space:
+            return None, "whitespace"
+        if token.is_punct:
+            lemma, pos = token.text, "PUNCT"
+        elif token.text != lower and (lower in KEYWORDS or lower in FUNCTION_WORDS):
+            return None, "capitalized keyword"
+        elif lower in KEYWORDS:
+            lemma, pos = KEYWORDS[lower]
+        elif lower in FUNCTION_WORDS:
+            lemma, pos = FUNCTION_WORDS[lower]
+        elif token.like_num:
+            lemma, pos = lower, "NUM"
+        else:
+            if not (is_column or schema_index.has_table(token.text)):
+                if not token.is_alpha:
+                    return None, "unknown word"
+                if anchor is None:
+                    return None, "literal outside a condition"
+            if may_inflect_keyword(lower):
+                return None, "inflected keyword"
+            lemma, pos = lower, "PROPN" if token.text[:1].isupper() else "NOUN"
+
+        if not token.is_punct and (not token.is_stop or lower in CONDITION_WORDS):
+            anchor = token if lower in CONDITION_WORDS or is_column else None
+
+        tokens.append(ParsedToken(token.text, lower, lemma, pos, token.is_stop, token.like_num, token.i))
+
+    return ParsedQuery(query, tokens), None
+
+
+class FastPath:
+    """
+    Thread-safe front of the recognizer with hit/miss counters.
+
+    Args:
+        enabled (bool): Whether the fast path is tried.
+    """
+
+    def __init__(self, enabled=DEFAULT_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.reasons = Counter()
+
+    def configure(self, enabled=None):
+        """
+        Enable or disable the fast path.
+        """
+        if enabled is not None:
+            self.enabled = enabled
+
+    def parse(self, query, schema_index, target="sql", check=None):
+        """
+        Tag a templated question without the spaCy model.
+
+        Args:
+            query (str): The natural language query.
+            schema_index (SchemaIndex): The index of the schema the query is compiled against.
+            target (str): "sql" or "mongo", for the counters.
+            check (callable): Optional check(query, doc, schema_index) of the code generator,
+                returning the reason to decline the parse or None.
+
+        Returns:
+            ParsedQuery: The parsed query, or None if the question needs the full NLP path.
+        """
+        if not self.enabled:
+            return None
+
+        doc, reason = recognize(query, schema_index)
+        if doc is not None and check is not None:
+            reason = check(query, doc, schema_index)
+            if reason is not None:
+                doc = None
+
+        with self._lock:
+            if doc is None:
+                self.misses[target] += 1
+                self.reasons[reason] += 1
+            else:
+                self.hits[target] += 1
+
+        return doc
+
+    def stats(self):
+        """
+        Return the hit/miss counters, the hit rate and the reasons of the misses.
+        """
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            targets = sorted(set(self.hits) | set(self.misses))
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "targets": {target: {"hits": self.hits[target], "misses": self.misses[target],
+                                     "hit_rate": self.hits[target] / (self.hits[target] + self.misses[target])}
+                            for target in targets},
+                "miss_reasons": dict(self.reasons.most_common()),
+            }
+
+    def counters(self):
+        """
+        Return a copy of the hit, miss and miss reason counters (see merge).
+        """
+        with self._lock:
+            return {"hits": Counter(self.hits), "misses": Counter(self.misses), "reasons": Counter(self.reasons)}
+
+    def merge(self, counters):
+        """
+        Add counters returned by counters(), e.g. those of a worker process, to these counters.
+        """
+        with self._lock:
+            self.hits.update(counters["hits"])
+            self.misses.update(counters["misses"])
+            self.reasons.update(counters["reasons"])
+
+    def reset(self):
+        """
+        Reset the counters.
+        """
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+            self.reasons.clear()
+
+
+# Process-wide fast path shared by both code generators.
+fast_path = FastPath()
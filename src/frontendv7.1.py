@@ -1,16 +1,26 @@
 '''
 v6.0: add mongodb generate button
 '''
+import asyncio
 import random
 import json
 import os
+import time
 import requests
 import streamlit as st
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from bson.json_util import dumps
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from sample_queries import get_sample_query
 from data_set_processor import DataSetProcessor
-from query_executor import QueryExecutor
+from index_advisor import IndexAdvisor
+from query_executor import CancelHandle, QueryExecutor, QueryGuardrailError
+from async_query_executor import AsyncQueryExecutor
+from cost_preview import CostPreview
+from tracing import tracer
+from fast_path import fast_path
+from dual_query_runner import DualQueryRunner
 from SQLCodeGenerator import generate_sql_query
 from MongoDBCodeGenerator import mongo_compile
 
@@ -21,11 +31,127 @@ if "sql_tables" not in st.session_state:
 if "mongo_collections" not in st.session_state:
     st.session_state["mongo_collections"] = []  # Initialize as an empty list
 
+# Cancel handles of the running queries of every session (by session id). The
+# registry is shared by the script runs of the process, so that the run started
+# by the cancel button can stop the query started by a previous run.
+@st.cache_resource
+def get_active_queries():
+    return {}
+
+# Threads that run the queries while the script waits for them
+@st.cache_resource
+def get_query_threads():
+    return ThreadPoolExecutor(thread_name_prefix="chatdb-query")
+
+active_queries = get_active_queries()
+session_id = get_script_run_ctx().session_id
+
+# Sidebar with the resource guardrails of the executed queries
+st.sidebar.subheader("Query Guardrails")
+QUERY_TIMEOUT = st.sidebar.number_input("Time limit (seconds)", min_value=1, value=60)
+MAX_RESULT_ROWS = st.sidebar.number_input("Maximum result rows", min_value=1, value=100000)
+MAX_RESULT_MB = st.sidebar.number_input("Maximum result size (MB)", min_value=1, value=256)
+
+# Sidebar with the cost thresholds of the generated queries (0 disables a threshold)
+st.sidebar.subheader("Cost Preview")
+WARN_ROWS = st.sidebar.number_input("Warn above rows examined", min_value=0, value=100000)
+REFUSE_ROWS = st.sidebar.number_input("Refuse above rows examined", min_value=0, value=0)
+
+# Sidebar with the per-stage timings of the sampled translations and queries
+st.sidebar.subheader("Pipeline Tracing")
+tracer.set_sample_rate(st.sidebar.slider("Trace sample rate", min_value=0.0, max_value=1.0, value=tracer.sample_rate))
+with st.sidebar.expander("Stage timings"):
+    stage_metrics = tracer.get_metrics()
+    if stage_metrics:
+        st.dataframe(pd.DataFrame.from_dict(stage_metrics, orient="index")[["count", "mean_ms", "max_ms", "errors"]])
+    else:
+        st.write("No traces recorded yet.")
+with st.sidebar.expander("NLP fast path"):
+    fast_path_stats = fast_path.stats()
+    st.metric("Fast path hit rate", f"{fast_path_stats['hit_rate']:.0%}",
+              help=f"{fast_path_stats['hits']} of {fast_path_stats['hits'] + fast_path_stats['misses']} "
+                   "questions compiled without the spaCy model.")
+    if fast_path_stats["miss_reasons"]:
+        st.write("Fallbacks to the spaCy model:", fast_path_stats["miss_reasons"])
+
+# Clicking the button reruns the script; the query of the previous run keeps
+# running on its thread until it is stopped here through its cancel handle
+if st.sidebar.button("Cancel Running Query"):
+    cancel_handle = active_queries.pop(session_id, None)
+    if cancel_handle is not None:
+        cancel_handle.cancel()
+        st.sidebar.info("The running query was cancelled.")
+    else:
+        st.sidebar.info("No query is running.")
+
 # Instantiate the DataSetProcessor
 processor = DataSetProcessor()
 
-# Instantiate the QueryExecutor
-query_executor = QueryExecutor()
+# Instantiate the QueryExecutor (repeated runs of the same query are served from the result cache)
+query_executor = QueryExecutor(cache_results=True, max_execution_time=QUERY_TIMEOUT, max_rows=MAX_RESULT_ROWS,
+                               max_bytes=MAX_RESULT_MB * 1024 * 1024)
+
+# Number of MongoDB documents displayed (and retrieved) when running a query
+MONGO_PREVIEW_LIMIT = 10
+
+# Run the queries on worker threads so that they can time out and be stopped on the server
+async_query_executor = AsyncQueryExecutor(query_executor, timeout=QUERY_TIMEOUT)
+
+# Compile and run a question against both databases at the same time ("Both" query type)
+dual_query_runner = DualQueryRunner(processor, async_query_executor, limit=MONGO_PREVIEW_LIMIT)
+
+# Estimate the cost of the generated queries from their execution plans
+cost_preview = CostPreview(query_executor, warn_rows=WARN_ROWS or None, refuse_rows=REFUSE_ROWS or None)
+
+# Run a query on a background thread and return its result. make_query is called with the
+# cancel handle of the query and returns the coroutine to run (it runs without the script
+# context, so it must not read st.session_state). The script polls the query instead of
+# blocking on it, so that a click on the cancel button interrupts this run and starts the
+# one that cancels the query. The handle is deregistered when the query ends. A session
+# runs one query at a time: a query still running from a previous run is cancelled.
+def run_cancellable_query(make_query):
+    cancel_handle = CancelHandle(query_executor)
+    previous_handle = active_queries.get(session_id)
+    active_queries[session_id] = cancel_handle
+    if previous_handle is not None:
+        previous_handle.cancel()
+
+    def run_query():
+        try:
+            return asyncio.run(make_query(cancel_handle))
+        finally:
+            if active_queries.get(session_id) is cancel_handle:
+                active_queries.pop(session_id, None)
+
+    query_future = get_query_threads().submit(run_query)
+    query_status = st.empty()
+    start_time = time.monotonic()
+    while not query_future.done():
+        query_status.caption(f"Running the query ({time.monotonic() - start_time:,.0f} s)...")
+        time.sleep(0.2)
+    query_status.empty()
+
+    return query_future.result()
+
+# Display the cost estimate of a generated query
+def show_cost_preview(engine, estimate):
+    if estimate is None:
+        return
+    st.caption(f"{engine} cost preview: {CostPreview.describeEstimate(estimate)}")
+    if estimate["status"] == "refuse":
+        st.error("\n\n".join(estimate["warnings"]))
+    elif estimate["status"] == "warn":
+        st.warning("\n\n".join(estimate["warnings"]))
+    elif estimate["warnings"]:
+        st.info("\n\n".join(estimate["warnings"]))
+
+# Return True (and display an error) if the cost estimate of a query is above the refuse threshold
+def is_refused(engine, estimate):
+    if estimate is not None and estimate["status"] == "refuse":
+        st.error(f"The {engine} query was not run: it would examine about {estimate['rows_examined']:,} rows "
+                 f"(the limit is {REFUSE_ROWS:,}).")
+        return True
+    return False
 
 # Title and description
 st.title('ChatDB Query Interface')
@@ -55,7 +181,7 @@ st.markdown("---")
 st.subheader("Generate Query from Natural Language")
 
 # Dropdown to select query type
-query_type = st.selectbox("Select Query Type", ["SQL", "MongoDB"])
+query_type = st.selectbox("Select Query Type", ["SQL", "MongoDB", "Both"])
 
 # Input for natural language query
 natural_query = st.text_input("Enter your natural language query")
@@ -67,6 +193,13 @@ if "generated_sql" not in st.session_state:
 if "generated_mongo" not in st.session_state:
     st.session_state["generated_mongo"] = None
 
+# Cost estimates of the generated queries
+if "sql_cost" not in st.session_state:
+    st.session_state["sql_cost"] = None
+
+if "mongo_cost" not in st.session_state:
+    st.session_state["mongo_cost"] = None
+
 # Button to generate query
 if st.button("Generate Query"):
     if natural_query:
@@ -74,39 +207,95 @@ if st.button("Generate Query"):
             if query_type == "SQL":
                 sql_schema_dt = processor.getMySQLSchema(st.session_state["sql_tables"])
                 st.session_state["generated_sql"] = generate_sql_query(natural_query, sql_schema_dt)
+                st.session_state["sql_cost"] = cost_preview.estimateMySQLQuery(st.session_state["generated_sql"])
                 st.success("Generated SQL Query:")
             elif query_type == "MongoDB":
                 mongo_schema_dt = processor.getMongoDBSchema()
-                method, collection, execute = mongo_compile(mongo_schema_dt, natural_query)
+                # Only the displayed documents are requested from the server
+                method, collection, execute = mongo_compile(mongo_schema_dt, natural_query, limit=MONGO_PREVIEW_LIMIT)
                 st.session_state["generated_mongo"] = (method, collection, execute)
+                st.session_state["mongo_cost"] = cost_preview.estimateMongoQuery(st.session_state["generated_mongo"])
                 st.success("Generated MongoDB Query:")
+            elif query_type == "Both":
+                # Compile for both databases concurrently
+                sql_report, mongo_report, wall_ms = asyncio.run(
+                    dual_query_runner.compileBoth(natural_query, st.session_state["sql_tables"]))
+                st.session_state["generated_sql"] = sql_report.get("query")
+                st.session_state["generated_mongo"] = mongo_report.get("query")
+                st.session_state["sql_cost"] = (cost_preview.estimateMySQLQuery(st.session_state["generated_sql"])
+                                                if st.session_state["generated_sql"] else None)
+                st.session_state["mongo_cost"] = (cost_preview.estimateMongoQuery(st.session_state["generated_mongo"])
+                                                  if st.session_state["generated_mongo"] else None)
+                for engine, report in (("SQL", sql_report), ("MongoDB", mongo_report)):
+                    if "error" in report:
+                        st.error(f"Error generating {engine} query: {report['error']}")
+                st.success(f"Generated both queries in {wall_ms:,.0f} ms "
+                           f"(SQL {sql_report['total_ms']:,.0f} ms, MongoDB {mongo_report['total_ms']:,.0f} ms).")
         except Exception as e:
             st.error(f"Error generating query: {e}")
     else:
         st.warning("Please enter a natural language query.")
 
 # Display the generated queries (if they exist)
-if st.session_state["generated_sql"] and query_type == "SQL":
+if st.session_state["generated_sql"] and query_type in ("SQL", "Both"):
     st.code(st.session_state["generated_sql"], language="sql")
+    show_cost_preview("SQL", st.session_state["sql_cost"])
 
-if st.session_state["generated_mongo"] and query_type == "MongoDB":
+if st.session_state["generated_mongo"] and query_type in ("MongoDB", "Both"):
     st.code(st.session_state["generated_mongo"][2], language="json")
+    show_cost_preview("MongoDB", st.session_state["mongo_cost"])
 
 
 # Logic for running the query
-if st.session_state["generated_sql"] and query_type == "SQL":
-    if st.button("Run Query"):
+if query_type == "Both" and st.session_state["generated_sql"] and st.session_state["generated_mongo"]:
+    if st.button("Run Query") and not is_refused("SQL", st.session_state["sql_cost"]) \
+            and not is_refused("MongoDB", st.session_state["mongo_cost"]):
         try:
-            sql_result = query_executor.execMySQLQuery(st.session_state["generated_sql"])
+            # Execute both queries concurrently; the wall time is close to the slower database
+            generated_sql, generated_mongo = st.session_state["generated_sql"], st.session_state["generated_mongo"]
+            sql_report, mongo_report, wall_ms = run_cancellable_query(
+                lambda cancel_handle: dual_query_runner.executeBoth(generated_sql, generated_mongo,
+                                                                    cancel_handle=cancel_handle))
+            st.write(f"Both queries finished in {wall_ms:,.0f} ms.")
+
+            sql_col, mongo_col = st.columns(2)
+            with sql_col:
+                st.write(f"### SQL Query Results ({sql_report['total_ms']:,.0f} ms):")
+                if "error" in sql_report:
+                    st.error(f"Error executing SQL query: {sql_report['error']}")
+                elif sql_report["result"] is not None:
+                    st.dataframe(sql_report["result"])
+                else:
+                    st.error("No results returned.")
+            with mongo_col:
+                st.write(f"### MongoDB Query Results ({mongo_report['total_ms']:,.0f} ms):")
+                if "error" in mongo_report:
+                    st.error(f"Error executing MongoDB query: {mongo_report['error']}")
+                elif mongo_report["result"] is not None:
+                    st.json(dumps(mongo_report["result"].head(MONGO_PREVIEW_LIMIT).to_dict(orient="records")))
+                else:
+                    st.error("No results returned.")
+        except Exception as e:
+            st.error(f"Error executing the queries: {e}")
+elif st.session_state["generated_sql"] and query_type == "SQL":
+    if st.button("Run Query") and not is_refused("SQL", st.session_state["sql_cost"]):
+        try:
+            generated_sql = st.session_state["generated_sql"]
+            sql_result = run_cancellable_query(lambda cancel_handle: async_query_executor.execMySQLQuery(
+                generated_sql, cancel_handle=cancel_handle))
             if sql_result is not None:
                 st.write("### SQL Query Results:")
                 st.dataframe(sql_result)
             else:
                 st.error("No results returned.")
+        except asyncio.TimeoutError:
+            st.error(f"The SQL query was stopped after {QUERY_TIMEOUT} seconds.")
+        except QueryGuardrailError as e:
+            st.error(f"The SQL query was stopped: {e}")
         except Exception as e:
             st.error(f"Error executing SQL query: {e}")
 elif st.session_state["generated_mongo"] and query_type == "MongoDB":
-    if st.button("Run Query"):
+    if st.button("Run Query") and not is_refused("MongoDB", st.session_state["mongo_cost"]):
         try:
             # Retrieve the generated Mongo data
             mongo_query_tp = st.session_state["generated_mongo"]
@@ -114,25 +303,33 @@ elif st.session_state["generated_mongo"] and query_type == "MongoDB":
             collection_name = mongo_query_tp[1]
             pipeline = mongo_query_tp[2]
 
-            # Execute the query based on the operation
+            # Execute the query based on the operation (the limit is applied by the server)
             if execute_on == "find":
-                mongo_result_df = query_executor.execMongoFind(collection_name, pipeline[0])
+                find_filter = next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+                find_projection = next((stage["$project"] for stage in pipeline if "$project" in stage), None)
+                mongo_result_df = run_cancellable_query(lambda cancel_handle: async_query_executor.previewMongoFind(
+                    collection_name, find_filter, MONGO_PREVIEW_LIMIT, find_projection, cancel_handle=cancel_handle))
             else:
-                mongo_result_df = query_executor.execMongoAggregate(collection_name, pipeline)
+                mongo_result_df = run_cancellable_query(lambda cancel_handle: async_query_executor.previewMongoAggregate(
+                    collection_name, pipeline, MONGO_PREVIEW_LIMIT, cancel_handle=cancel_handle))
 
             # Display the results
             if mongo_result_df is not None:
                 st.write("### MongoDB Query Results:")
                 
                 # Retrieve the result set.
-                # NOTE: We are only displaying up to 10 documents.
-                mongo_result_set_dt = mongo_result_df.head(10).to_dict(orient="records")
+                # NOTE: We are only displaying up to MONGO_PREVIEW_LIMIT documents.
+                mongo_result_set_dt = mongo_result_df.head(MONGO_PREVIEW_LIMIT).to_dict(orient="records")
                 
                 # Display the results
                 st.json(dumps(mongo_result_set_dt))
 
             else:
                 st.error("No results returned.")
+        except asyncio.TimeoutError:
+            st.error(f"The MongoDB query was stopped after {QUERY_TIMEOUT} seconds.")
+        except QueryGuardrailError as e:
+            st.error(f"The MongoDB query was stopped: {e}")
         except Exception as e:
             st.error(f"Error executing MongoDB query: {e}")
 else:
@@ -218,9 +415,15 @@ if st.button('Load Data'):
         file_path = f"./{uploaded_file.name}"
         with open(file_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
+
+        # Report the load progress as each chunk is written
+        load_progress = st.empty()
+        def show_load_progress(name, rows_loaded, rows_per_sec):
+            load_progress.write(f"Loaded {rows_loaded} rows into `{name}` ({rows_per_sec:,.0f} rows/sec)")
+
         if load_db_type == 'MySQL' and uploaded_file.name.endswith('.csv'):
             try:
-                result = processor.insertSetToMySQL(file_path)
+                result = processor.insertSetToMySQL(file_path, progress=show_load_progress)
                 if result is None:
                     st.error("Failed to load data.")
                 else:
@@ -230,7 +433,7 @@ if st.button('Load Data'):
                 st.error(f"Error loading data into MySQL: {e}")
         elif load_db_type == 'MongoDB' and uploaded_file.name.endswith('.json'):
             try:
-                result = processor.insertSetToMongoDB(file_path)
+                result = processor.insertSetToMongoDB(file_path, progress=show_load_progress)
                 if result is None:
                     st.error("Failed to load data.")
                 else:
@@ -242,3 +445,29 @@ if st.button('Load Data'):
             st.error(f"Please upload a {'CSV' if load_db_type == 'MySQL' else 'JSON'} file for {load_db_type}.")
     else:
         st.warning("Please upload a file before attempting to load data.")
+
+# Divider line for better organization
+st.markdown("---")
+
+# Section for the Index Advisor
+st.subheader("Index Advisor")
+st.write("Recommends indexes for the columns that the executed queries filter, join, group and sort on.")
+index_db_type = st.selectbox('Select Database for Index Advice', ('MySQL', 'MongoDB'))
+index_backends = ('mysql',) if index_db_type == 'MySQL' else ('mongodb',)
+index_advisor = IndexAdvisor(query_executor)
+
+col1, col2 = st.columns(2)
+with col1:
+    show_index_advice = st.button('Show Recommended Indexes')
+with col2:
+    build_index_advice = st.button('Create Recommended Indexes')
+
+if show_index_advice or build_index_advice:
+    try:
+        recommendations = index_advisor.buildIndexes(index_backends, dry_run=not build_index_advice)
+        if recommendations:
+            st.dataframe(pd.DataFrame(recommendations).drop(columns=['backend']))
+        else:
+            st.write("No indexes to recommend yet. Run some queries first.")
+    except Exception as e:
+        st.error(f"Error running the index advisor: {e}")
@@ -0,0 +1,246 @@
+# Load dependent libraries.
+from pymongo import ASCENDING
+
+from sqlalchemy import text
+
+from query_executor import QueryExecutor
+
+from query_log import query_log
+
+# MySQL data types that can only be indexed on a prefix of the value.
+PREFIX_INDEX_TYPES = {'tinytext', 'text', 'mediumtext', 'longtext', 'tinyblob', 'blob', 'mediumblob', 'longblob'}
+
+# Number of leading characters indexed for TEXT/BLOB columns.
+INDEX_PREFIX_LENGTH = 255
+
+# Maximum length of a MySQL identifier.
+MAX_INDEX_NAME_LENGTH = 64
+
+#
+# This class recommends and builds secondary indexes for the columns that
+# the executed queries filter, join, group and sort on. The column usage is
+# read from the query log (see query_log.py), which QueryExecutor fills as
+# statements are executed.
+#
+# Each recommendation is a dictionary with the backend, the table/collection
+# name, the column, the number of uses per role, the index name, the
+# statement that creates the index and its status:
+#   'planned': the index would be created (dry run).
+#   'created': the index was created.
+#   'exists':  an index on the column already exists.
+#   'failed':  the index could not be created (see 'error').
+#
+class IndexAdvisor:
+
+    # Constructor method to initialize class variables.
+    # min_uses: number of recorded uses a column needs to be indexed.
+    # max_indexes: maximum number of recommended indexes per table/collection.
+    def __init__(self, query_executor: QueryExecutor = None, log=None, min_uses: int = 1, max_indexes: int = 5):
+
+        self.query_executor = query_executor or QueryExecutor()
+        self.database = self.query_executor.database
+        self.query_log = log if log is not None else query_log
+
+        self.min_uses = min_uses
+        self.max_indexes = max_indexes
+
+    # Return the index recommendations for the recorded queries, ranked by the
+    # number of uses. names (optional) restricts them to the given tables/collections.
+    def getRecommendations(self, backends=('mysql', 'mongodb'), names=None):
+
+        # Group the used columns by table/collection.
+        table_columns = dict()
+        for (backend, name, column), roles in self.query_log.getColumnUsage().items():
+            if backend in backends and (names is None or name in names) and sum(roles.values()) >= self.min_uses:
+                table_columns.setdefault((backend, name), []).append((column, roles))
+
+        mysql_columns = {name: columns for (backend, name), columns in table_columns.items() if backend == 'mysql'}
+        mongo_columns = {name: columns for (backend, name), columns in table_columns.items() if backend == 'mongodb'}
+
+        recommendations = []
+
+        if mysql_columns:
+            recommendations.extend(self.getMySQLRecommendations(mysql_columns))
+
+        if mongo_columns:
+            recommendations.extend(self.getMongoRecommendations(mongo_columns))
+
+        return recommendations
+
+    # Return the recommendations of the MySQL tables.
+    # table_columns: mapping of table name to a list of (column, roles).
+    def getMySQLRecommendations(self, table_columns: dict):
+
+        column_types = self.getMySQLColumnTypes()
+        existing_indexes = self.getMySQLIndexes()
+
+        if column_types is None or existing_indexes is None:
+            return []
+
+        recommendations = []
+        for table_name, columns in sorted(table_columns.items()):
+
+            # Skip the tables and columns that do not exist (e.g. catalog queries).
+            columns = [(column, roles) for column, roles in columns if (table_name, column) in column_types]
+
+            for column, roles in self.rankColumns(columns):
+
+                data_type = column_types[(table_name, column)]
+                index_name = self.getIndexName(table_name, column)
+
+                # TEXT/BLOB columns need a prefix length.
+                key_part = f"`{column}`"
+                if data_type in PREFIX_INDEX_TYPES:
+                    key_part = f"`{column}`({INDEX_PREFIX_LENGTH})"
+
+                recommendations.append({
+                    'backend': 'mysql',
+                    'name': table_name,
+                    'column': column,
+                    'roles': roles,
+                    'uses': sum(roles.values()),
+                    'index_name': index_name,
+                    'statement': f"CREATE INDEX `{index_name}` ON `{table_name}` ({key_part})",
+                    'status': 'exists' if column in existing_indexes.get(table_name, set()) else 'planned',
+                })
+
+        return recommendations
+
+    # Return the recommendations of the MongoDB collections.
+    # table_columns: mapping of collection name to a list of (field, roles).
+    def getMongoRecommendations(self, table_columns: dict):
+
+        my_mongo_db = self.query_executor.getMongoClient()[self.database]
+
+        try:
+
+            collection_names = set(my_mongo_db.list_collection_names())
+
+            # Map each collection to the leading field of every existing index.
+            existing_indexes = dict()
+            for collection_name in table_columns:
+                if collection_name in collection_names:
+                    index_information = my_mongo_db[collection_name].index_information()
+                    existing_indexes[collection_name] = {index_spec['key'][0][0]
+                                                         for index_spec in index_information.values()}
+
+        except Exception as ex:
+            print(f"Error::getMongoRecommendations::{ex}")
+            return []
+
+        recommendations = []
+        for collection_name, fields in sorted(table_columns.items()):
+
+            # Skip the collections that do not exist.
+            existing_fields = existing_indexes.get(collection_name)
+            if existing_fields is None:
+                continue
+
+            for field, roles in self.rankColumns(fields):
+
+                index_name = self.getIndexName(collection_name, field)
+
+                recommendations.append({
+                    'backend': 'mongodb',
+                    'name': collection_name,
+                    'column': field,
+                    'roles': roles,
+                    'uses': sum(roles.values()),
+                    'index_name': index_name,
+                    'statement': f"db.{collection_name}.createIndex({{'{field}': 1}}, {{name: '{index_name}'}})",
+                    'status': 'exists' if field in existing_fields else 'planned',
+                })
+
+        return recommendations
+
+    # Return the most used columns of a table, at most max_indexes of them.
+    def rankColumns(self, columns: list):
+
+        ranked_columns = sorted(columns, key=lambda column_roles: (-sum(column_roles[1].values()), column_roles[0]))
+
+        return ranked_columns[:self.max_indexes]
+
+    # Return the name of the index of a column.
+    @staticmethod
+    def getIndexName(name: str, column: str):
+
+        return f"ix_{name}_{column}".replace('.', '_')[:MAX_INDEX_NAME_LENGTH]
+
+    # Return the mapping of (table, column) to the data type of every column in the database.
+    def getMySQLColumnTypes(self):
+
+        columns_df = self.query_executor.execMySQLQuery(
+            "SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, DATA_TYPE AS data_type "
+            "FROM information_schema.columns WHERE TABLE_SCHEMA = :table_schema",
+            {'table_schema': self.database})
+
+        if columns_df is None:
+            return None
+
+        return {(table_name, column_name): str(data_type).lower()
+                for table_name, column_name, data_type in zip(columns_df.table_name, columns_df.column_name,
+                                                              columns_df.data_type)}
+
+    # Return the mapping of table to the set of columns that lead an existing index.
+    def getMySQLIndexes(self):
+
+        indexes_df = self.query_executor.execMySQLQuery(
+            "SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name "
+            "FROM information_schema.statistics WHERE TABLE_SCHEMA = :table_schema AND SEQ_IN_INDEX = 1",
+            {'table_schema': self.database})
+
+        if indexes_df is None:
+            return None
+
+        existing_indexes = dict()
+        for table_name, column_name in zip(indexes_df.table_name, indexes_df.column_name):
+            existing_indexes.setdefault(table_name, set()).add(column_name)
+
+        return existing_indexes
+
+    # Create the recommended indexes and return the recommendations with their status.
+    # With dry_run, nothing is created and the planned indexes are reported.
+    def buildIndexes(self, backends=('mysql', 'mongodb'), names=None, dry_run: bool = True):
+
+        recommendations = self.getRecommendations(backends, names)
+
+        if not dry_run:
+            for recommendation in recommendations:
+                if recommendation['status'] == 'planned':
+                    self.createIndex(recommendation)
+
+        self.printReport(recommendations, dry_run)
+
+        return recommendations
+
+    # Create the index of a recommendation and update its status.
+    def createIndex(self, recommendation: dict):
+
+        try:
+
+            if recommendation['backend'] == 'mysql':
+                with self.query_executor.getMySQLEngine().begin() as mysqlConnection:
+                    mysqlConnection.execute(text(recommendation['statement']))
+            else:
+                my_mongo_coll = self.query_executor.getMongoClient()[self.database][recommendation['name']]
+                my_mongo_coll.create_index([(recommendation['column'], ASCENDING)],
+                                           name=recommendation['index_name'])
+
+            recommendation['status'] = 'created'
+
+        except Exception as ex:
+            recommendation['status'] = 'failed'
+            recommendation['error'] = str(ex)
+
+    # Print the index report.
+    @staticmethod
+    def printReport(recommendations: list, dry_run: bool = True):
+
+        print(f"Index advisor report{' (dry run)' if dry_run else ''}: {len(recommendations)} indexes.")
+
+        for recommendation in recommendations:
+            roles = ", ".join(f"{role}={count}" for role, count in sorted(recommendation['roles'].items()))
+            print(f"  [{recommendation['status']}] {recommendation['backend']} "
+                  f"{recommendation['name']}.{recommendation['column']} ({roles}): {recommendation['statement']}")
+            if 'error' in recommendation:
+                print(f"      {recommendation['error']}")
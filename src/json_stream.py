@@ -0,0 +1,96 @@
+#
+# Incremental reader for JSON data set files.
+#
+# Reads the documents of a JSON array file (as written by
+# convert_csv_to_json.py) or of a newline-delimited JSON (NDJSON) file one at a
+# time, so the whole file never has to fit in memory. Peak memory is
+# proportional to the read size and the batch size, not the file size.
+#
+# Usage:
+#     with open(file_name, 'r', encoding='utf-8') as jf:
+#         for batch in iterJSONBatches(jf, 10000):
+#             collection.insert_many(batch)
+#
+# Load dependent libraries.
+import json
+
+# Number of characters read from the file at a time.
+READ_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = " \t\n\r\ufeff"
+
+# Characters that can follow a complete top-level document.
+_DELIMITERS = _WHITESPACE + ",[]{}\""
+
+
+# Yield the documents of a JSON array or NDJSON file one at a time.
+def iterJSONDocuments(jf, read_size: int = READ_SIZE):
+
+    buffer = ""
+    pos = 0
+    at_eof = False
+    in_array = None
+
+    while True:
+
+        # Skip whitespace (and the separators of an array).
+        while True:
+            while pos < len(buffer) and (buffer[pos] in _WHITESPACE or (in_array and buffer[pos] == ",")):
+                pos += 1
+            if pos < len(buffer) or at_eof:
+                break
+            buffer, pos = jf.read(read_size), 0
+            at_eof = buffer == ""
+
+        if pos >= len(buffer):
+            if in_array:
+                raise ValueError("Unexpected end of file: the JSON array is not closed.")
+            return
+
+        # The first character decides between a JSON array and NDJSON.
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+
+        if in_array and buffer[pos] == "]":
+            return
+
+        # Decode the next document, reading more of the file while it is incomplete.
+        while True:
+            try:
+                document, end = _decoder.raw_decode(buffer, pos)
+                # A value that is not followed by a delimiter (e.g. "2." of "2.5") may continue.
+                if at_eof or (end < len(buffer) and buffer[end] in _DELIMITERS):
+                    break
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+
+            chunk = jf.read(read_size)
+            at_eof = chunk == ""
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        pos = end
+        yield document
+
+        # Drop the consumed part of the buffer.
+        if pos > read_size:
+            buffer, pos = buffer[pos:], 0
+
+
+# Yield the documents of a JSON array or NDJSON file in lists of at most batch_size documents.
+def iterJSONBatches(jf, batch_size: int, read_size: int = READ_SIZE):
+
+    batch = []
+    for document in iterJSONDocuments(jf, read_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
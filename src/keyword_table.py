@@ -0,0 +1,88 @@
+'''
+Frozen synonym table of the trigger keywords.
+
+The code generators recognize each clause by a small hand-written keyword set
+(ping_select, ping_join, ping_order, ...). tools/build_keyword_table.py expands
+these sets once through WordNet and writes the synonyms to keyword_table.json,
+which is read here at startup. No WordNet corpus is needed at runtime.
+
+The table only holds the words added to each set; the hand-written sets stay in
+the code generators. If the table is missing or invalid, the generators use the
+hand-written sets alone. The CHATDB_KEYWORD_TABLE environment variable points
+to another table file ("" disables the table, as the build step does).
+
+Main function:
+    ping_select = expand_keywords("ping_select", {'choose', 'take', 'select', 'pick'})
+'''
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Path of the table written by tools/build_keyword_table.py.
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_table.json")
+KEYWORD_TABLE_PATH = os.environ.get("CHATDB_KEYWORD_TABLE", DEFAULT_TABLE_PATH)
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def load_keyword_table(path=None):
+    """
+    Return the synonyms of each keyword set, reading the table file once per process.
+
+    Args:
+        path (str): The table file. Defaults to KEYWORD_TABLE_PATH.
+
+    Returns:
+        dict: The mapping of keyword set names (e.g. "ping_select") to frozensets of
+            synonyms. Empty if the table is disabled, missing or invalid.
+    """
+    if path is None:
+        path = KEYWORD_TABLE_PATH
+    if not path:
+        return {}
+
+    table = _tables.get(path)
+    if table is not None:
+        return table
+
+    with _tables_lock:
+        table = _tables.get(path)
+        if table is None:
+            try:
+                with open(path, encoding="utf-8") as table_file:
+                    data = json.load(table_file)
+                table = {name: frozenset(words) for name, words in data["keywords"].items()}
+            except FileNotFoundError:
+                logger.warning("Keyword table %s not found, using the hand-written keywords only.", path)
+                table = {}
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+                logger.warning("Invalid keyword table %s, using the hand-written keywords only: %s", path, ex)
+                table = {}
+            _tables[path] = table
+
+    return table
+
+
+def expand_keywords(name, keywords):
+    """
+    Add the synonyms of the table to a hand-written keyword set.
+
+    Args:
+        name (str): The name of the set in the table, e.g. "ping_select".
+        keywords (set): The hand-written keywords.
+
+    Returns:
+        set: The keywords and their synonyms.
+    """
+    return set(keywords) | load_keyword_table().get(name, frozenset())
+
+
+def synonyms():
+    """
+    Return every word added by the table, across all keyword sets.
+    """
+    return frozenset().union(*load_keyword_table().values())
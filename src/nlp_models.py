@@ -0,0 +1,101 @@
+'''
+Process-wide registry for the spaCy pipeline used by the code generators.
+
+The pipeline is loaded lazily on the first request and only once per process,
+no matter how many modules ask for it. Importing this module (or the code
+generators) does not import spaCy, load a model or touch the network.
+
+The clause generators only read token text, lemmas, part of speech tags and
+lexical flags, so the dependency parser and the named entity recognizer are
+excluded when the pipeline is loaded.
+
+The rule-based fast path (see fast_path.py) only needs the tokenizer and the
+lexical attributes, which a blank English pipeline provides without loading a
+trained model.
+
+Main functions:
+    nlp = get_nlp()
+    tokenizer = get_tokenizer()
+'''
+import threading
+
+# Name of the installed spaCy model package.
+MODEL_NAME = "en_core_web_sm"
+
+# Pipeline components that the clause generators never read.
+EXCLUDED_COMPONENTS = ("parser", "ner")
+
+# Language of the blank pipeline returned by get_tokenizer.
+TOKENIZER_LANGUAGE = "en"
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_nlp(model_name=MODEL_NAME):
+    """
+    Return the shared spaCy pipeline, loading it on first use.
+
+    Args:
+        model_name (str): Name of the installed spaCy model package.
+
+    Returns:
+        spacy.language.Language: The loaded pipeline.
+    """
+    nlp = _models.get(model_name)
+    if nlp is not None:
+        return nlp
+
+    with _models_lock:
+        # Another thread may have loaded the model while we were waiting.
+        nlp = _models.get(model_name)
+        if nlp is None:
+            import spacy
+
+            nlp = spacy.load(model_name, exclude=list(EXCLUDED_COMPONENTS))
+            _models[model_name] = nlp
+
+    return nlp
+
+
+def get_tokenizer(language=TOKENIZER_LANGUAGE):
+    """
+    Return a shared blank spaCy pipeline, creating it on first use.
+
+    The blank pipeline splits text into the same tokens, with the same lexical
+    attributes (lower_, is_stop, like_num, is_punct), as the trained pipeline of
+    the language, but has no statistical components: no tags and no lemmas.
+
+    Args:
+        language (str): The spaCy language code.
+
+    Returns:
+        spacy.language.Language: The blank pipeline (use make_doc to tokenize).
+    """
+    key = f"blank:{language}"
+    tokenizer = _models.get(key)
+    if tokenizer is not None:
+        return tokenizer
+
+    with _models_lock:
+        tokenizer = _models.get(key)
+        if tokenizer is None:
+            import spacy
+
+            tokenizer = spacy.blank(language)
+            _models[key] = tokenizer
+
+    return tokenizer
+
+
+def is_loaded(model_name=MODEL_NAME):
+    """
+    Check whether the pipeline has already been loaded in this process.
+
+    Args:
+        model_name (str): Name of the installed spaCy model package.
+
+    Returns:
+        bool: True if the pipeline is loaded.
+    """
+    return model_name in _models
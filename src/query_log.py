@@ -0,0 +1,181 @@
+# Load dependent libraries.
+import re
+import threading
+
+from collections import deque
+
+# SQL clause keywords and the role of the columns referenced in each clause.
+# ORDER is not preceded by a word boundary because the generator may emit
+# "... > 5000ORDER BY ...".
+_SQL_CLAUSE_PATTERN = re.compile(r"(?<![A-Za-z_])(SELECT|FROM|JOIN|ON|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b",
+                                 flags=re.IGNORECASE)
+_SQL_CLAUSE_ROLES = {'ON': 'join', 'WHERE': 'filter', 'GROUP BY': 'group', 'ORDER BY': 'sort'}
+
+_SQL_STRING_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'")
+_SQL_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", flags=re.IGNORECASE)
+_SQL_COLUMN_PATTERN = re.compile(r"`?\b([A-Za-z_]\w*)`?\.`?([A-Za-z_]\w*)\b`?")
+_SQL_KEYWORDS = {'AS', 'INNER', 'LEFT', 'RIGHT', 'OUTER', 'CROSS', 'JOIN', 'ON', 'WHERE', 'GROUP', 'ORDER',
+                 'HAVING', 'LIMIT', 'UNION', 'NATURAL', 'FULL'}
+
+# Aggregation stages after which the field names no longer refer to the stored documents.
+_MONGO_RESHAPING_STAGES = {'$group', '$project', '$unwind', '$addFields', '$set', '$unset', '$replaceRoot',
+                           '$replaceWith', '$bucket', '$bucketAuto', '$facet', '$count', '$unionWith'}
+
+#
+# This class records the statements executed by QueryExecutor so that the
+# columns they filter, join, group and sort on can be analyzed later (see
+# index_advisor.py). Recording only appends the statement to a bounded
+# queue; the statements are parsed when the column usage is requested.
+#
+class QueryLog:
+
+    # Constructor method to initialize class variables.
+    # maxsize: number of most recent statements kept in the log.
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+
+        # Queue of (backend, collection name or None, statement).
+        self._entries = deque(maxlen=maxsize)
+
+        self._lock = threading.Lock()
+
+    # Record a SQL statement executed in MySQL.
+    def recordMySQLQuery(self, query: str):
+
+        with self._lock:
+            self._entries.append(('mysql', None, query))
+
+    # Record a find filter or an aggregation pipeline executed in MongoDB.
+    def recordMongoQuery(self, collection_name: str, query):
+
+        with self._lock:
+            self._entries.append(('mongodb', collection_name, query))
+
+    # Remove every recorded statement.
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+
+    # Return the number of recorded statements.
+    def __len__(self):
+
+        with self._lock:
+            return len(self._entries)
+
+    # Return the column usage of the recorded statements as a mapping of
+    # (backend, table/collection, column) to a mapping of role to count.
+    # The roles are 'filter', 'join', 'group' and 'sort'.
+    def getColumnUsage(self):
+
+        with self._lock:
+            entries = list(self._entries)
+
+        column_usage = dict()
+        for backend, collection_name, query in entries:
+
+            if backend == 'mysql':
+                references = self.getMySQLColumns(query)
+            else:
+                references = self.getMongoFields(collection_name, query)
+
+            for name, column, role in references:
+                roles = column_usage.setdefault((backend, name, column), dict())
+                roles[role] = roles.get(role, 0) + 1
+
+        return column_usage
+
+    # Return the (table, column, role) references of a SQL statement.
+    # Only qualified column names (table.column) are recognized; this is the
+    # form produced by the SQL code generator.
+    @staticmethod
+    def getMySQLColumns(query: str):
+
+        # Remove string literals so that their content is not mistaken for names.
+        statement = _SQL_STRING_PATTERN.sub("''", query)
+
+        # Map the table aliases to their tables.
+        aliases = dict()
+        for table_name, alias in _SQL_TABLE_PATTERN.findall(statement):
+            aliases[table_name] = table_name
+            if alias and alias.upper() not in _SQL_KEYWORDS:
+                aliases[alias] = table_name
+
+        references = []
+        clauses = _SQL_CLAUSE_PATTERN.split(statement)
+
+        # split() alternates text and clause keywords: [text, keyword, text, keyword, text, ...].
+        for keyword, clause in zip(clauses[1::2], clauses[2::2]):
+
+            role = _SQL_CLAUSE_ROLES.get(" ".join(keyword.upper().split()))
+            if role is None:
+                continue
+
+            for alias, column in _SQL_COLUMN_PATTERN.findall(clause):
+                if alias in aliases:
+                    references.append((aliases[alias], column, role))
+
+        return references
+
+    # Return the (collection, field, role) references of a find filter or an
+    # aggregation pipeline. Only the stages that run on the stored documents
+    # (before the first reshaping stage) are considered.
+    @classmethod
+    def getMongoFields(cls, collection_name: str, query):
+
+        # A find filter.
+        if isinstance(query, dict):
+            return [(collection_name, field, 'filter') for field in cls.getMatchFields(query)]
+
+        references = []
+        for stage in query or []:
+
+            if not isinstance(stage, dict) or len(stage) != 1:
+                break
+
+            stage_name, stage_spec = next(iter(stage.items()))
+
+            if stage_name == '$match':
+                references.extend((collection_name, field, 'filter') for field in cls.getMatchFields(stage_spec))
+
+            elif stage_name == '$sort' and isinstance(stage_spec, dict):
+                references.extend((collection_name, field, 'sort') for field in stage_spec)
+
+            elif stage_name == '$lookup' and isinstance(stage_spec, dict):
+                if all(key in stage_spec for key in ('from', 'localField', 'foreignField')):
+                    references.append((collection_name, stage_spec['localField'], 'join'))
+                    references.append((stage_spec['from'], stage_spec['foreignField'], 'join'))
+                # The joined documents are added under a new field; the rest are unchanged.
+
+            elif stage_name == '$group' and isinstance(stage_spec, dict):
+                group_keys = stage_spec.get('_id')
+                group_keys = group_keys.values() if isinstance(group_keys, dict) else [group_keys]
+                references.extend((collection_name, group_key[1:], 'group') for group_key in group_keys
+                                  if isinstance(group_key, str) and group_key.startswith('$'))
+                break
+
+            elif stage_name in _MONGO_RESHAPING_STAGES:
+                break
+
+        return references
+
+    # Return the field names tested by a $match/find filter.
+    @classmethod
+    def getMatchFields(cls, match_filter):
+
+        fields = []
+        if not isinstance(match_filter, dict):
+            return fields
+
+        for key, value in match_filter.items():
+            if key in ('$and', '$or', '$nor') and isinstance(value, list):
+                for sub_filter in value:
+                    fields.extend(cls.getMatchFields(sub_filter))
+            elif not key.startswith('$'):
+                fields.append(key)
+
+        return fields
+
+
+# Process-wide log of the statements executed by every QueryExecutor.
+query_log = QueryLog()
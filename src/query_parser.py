@@ -0,0 +1,121 @@
+'''
+Parsed query shared by the SQL and MongoDB code generators.
+
+The natural language query is run through the spaCy pipeline once per request.
+The token attributes that the clause generators read are copied into a
+ParsedQuery, which every clause generator then reads from instead of calling
+nlp(query) again.
+
+Token attributes kept:
+    text, lower_, lemma_, pos_, is_stop, like_num, i (index position)
+
+Main functions:
+    doc = parse_query(query)
+    docs = parse_queries(queries)
+'''
+from typing import NamedTuple
+
+from nlp_models import get_nlp
+from tracing import traced
+
+
+class ParsedToken(NamedTuple):
+    """
+    A single token of a parsed query.
+
+    The attribute names mirror spaCy's Token so that the clause generators can
+    read a ParsedToken exactly like a spaCy token.
+    """
+    text: str
+    lower_: str
+    lemma_: str
+    pos_: str
+    is_stop: bool
+    like_num: bool
+    i: int
+
+
+class ParsedQuery:
+    """
+    Immutable, read-only view of a parsed natural language query.
+
+    Supports the subset of the spaCy Doc interface used by the clause generators:
+    iteration, len(), integer indexing and slicing. Slices return a tuple of
+    tokens that keep their original index positions in `token.i`.
+    """
+
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text, tokens):
+        self.text = text
+        self.tokens = tuple(tokens)
+
+    @classmethod
+    def from_doc(cls, doc):
+        """
+        Build a ParsedQuery from a spaCy Doc.
+
+        Args:
+            doc (spacy.tokens.Doc): The processed query.
+
+        Returns:
+            ParsedQuery: The parsed query.
+        """
+        tokens = [
+            ParsedToken(token.text, token.lower_, token.lemma_, token.pos_,
+                        token.is_stop, token.like_num, token.i)
+            for token in doc
+        ]
+        return cls(doc.text, tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, index):
+        return self.tokens[index]
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"ParsedQuery({self.text!r})"
+
+
+@traced("nlp.parse")
+def parse_query(query, nlp=None):
+    """
+    Run the query through the spaCy pipeline once and capture the token attributes.
+
+    Args:
+        query (str): The natural language query.
+        nlp (spacy.language.Language): The spaCy pipeline. Defaults to the shared
+            pipeline from nlp_models.
+
+    Returns:
+        ParsedQuery: The parsed query shared by all clause generators.
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    return ParsedQuery.from_doc(nlp(query))
+
+
+@traced("nlp.parse_batch")
+def parse_queries(queries, nlp=None, batch_size=64):
+    """
+    Run a list of queries through the spaCy pipeline in batches (nlp.pipe).
+
+    Args:
+        queries (list): The natural language queries.
+        nlp (spacy.language.Language): The spaCy pipeline. Defaults to the shared
+            pipeline from nlp_models.
+        batch_size (int): Number of queries processed together by the pipeline.
+
+    Returns:
+        list: The ParsedQuery of each query, in order.
+    """
+    if nlp is None:
+        nlp = get_nlp()
+    return [ParsedQuery.from_doc(doc) for doc in nlp.pipe(queries, batch_size=batch_size)]
@@ -0,0 +1,126 @@
+# Load dependent libraries.
+import threading
+
+from collections import OrderedDict
+
+#
+# This class tracks a data version for every table/collection. The version
+# is bumped whenever a data set is loaded, so cached results that were read
+# from the previous data are never returned again.
+#
+class DataVersions:
+
+    # Constructor method to initialize class variables.
+    def __init__(self):
+
+        # Mapping of (backend, database, name) to version. A name of None
+        # holds the database-wide version, bumped by every load.
+        self._versions = dict()
+
+        self._lock = threading.Lock()
+
+    # Bump the version of a table/collection (and of its database).
+    def bumpVersion(self, backend: str, database: str, name: str):
+
+        with self._lock:
+            for key in ((backend, database, name), (backend, database, None)):
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    # Return the versions of the given tables/collections as a hashable tuple.
+    # If no names are given, the database-wide version is returned.
+    def getVersions(self, backend: str, database: str, names):
+
+        names = sorted(set(names)) or [None]
+
+        with self._lock:
+            return tuple((name, self._versions.get((backend, database, name), 0)) for name in names)
+
+#
+# This class caches query results (data frames) in memory. The cache is
+# bounded by the total size of the cached data frames in bytes and evicts
+# the least recently used results first.
+#
+class ResultCache:
+
+    # Constructor method to initialize class variables.
+    # max_bytes: upper bound of the memory used by the cached data frames.
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Mapping of cache key to (size in bytes, data frame).
+        self._entries = OrderedDict()
+
+        self._lock = threading.Lock()
+
+    # Return a copy of the cached data frame or None if it is not cached.
+    def getResult(self, key):
+
+        with self._lock:
+
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return entry[1].copy()
+
+    # Cache a data frame, evicting the least recently used results as needed.
+    def putResult(self, key, result_df):
+
+        result_size = int(result_df.memory_usage(index=True, deep=True).sum())
+
+        # Results larger than the whole cache are not cached.
+        if result_size > self.max_bytes:
+            return
+
+        result_df = result_df.copy()
+
+        with self._lock:
+
+            # Replace an existing entry.
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.current_bytes -= old_entry[0]
+
+            self._entries[key] = (result_size, result_df)
+            self.current_bytes += result_size
+
+            # Evict the least recently used results.
+            while self.current_bytes > self.max_bytes:
+                evicted_size, _ = self._entries.popitem(last=False)[1]
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    # Remove every cached result.
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    # Return the cache statistics.
+    def stats(self):
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Process-wide data versions and result cache shared by every QueryExecutor.
+data_versions = DataVersions()
+result_cache = ResultCache()
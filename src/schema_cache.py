@@ -0,0 +1,82 @@
+# Load dependent libraries.
+import threading
+import time
+
+#
+# This class caches the schema metadata (table/collection names and their
+# columns/keys) of each database so that schema lookups on the hot path are
+# a dictionary read. Entries expire after a time-to-live and are invalidated
+# explicitly whenever a data set is loaded.
+#
+class SchemaCache:
+
+    # Constructor method to initialize class variables.
+    # ttl: number of seconds a cached schema stays valid.
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+
+        # Mapping of (backend, database) to (expiry time, schema).
+        self._entries = dict()
+
+        # Mapping of (backend, database) to the number of invalidations.
+        self._versions = dict()
+
+        self._lock = threading.Lock()
+
+    # Return the cached schema or None if it is missing or expired.
+    def getSchema(self, backend: str, database: str):
+
+        with self._lock:
+
+            entry = self._entries.get((backend, database))
+
+            if entry is None:
+                return None
+
+            expires_at, schema = entry
+
+            # Drop the expired entry.
+            if time.monotonic() >= expires_at:
+                del self._entries[(backend, database)]
+                return None
+
+            return schema
+
+    # Store the schema of a database.
+    # version (optional) is the result of getVersion read before the schema was
+    # fetched; the schema is dropped if the database was invalidated since then,
+    # so that a fetch racing with a data load does not cache the old schema.
+    def putSchema(self, backend: str, database: str, schema: dict, version: int = None):
+
+        with self._lock:
+
+            if version is not None and self._versions.get((backend, database), 0) != version:
+                return
+
+            self._entries[(backend, database)] = (time.monotonic() + self.ttl, schema)
+
+    # Invalidate the cached schema of a database.
+    # If no database is given, every database of the backend is invalidated.
+    # If no backend is given, the whole cache is cleared.
+    def invalidate(self, backend: str = None, database: str = None):
+
+        with self._lock:
+
+            keys = set(self._entries) | set(self._versions)
+            if backend is not None and database is not None:
+                keys.add((backend, database))
+
+            for key in keys:
+                if (backend is None or key[0] == backend) and (database is None or key[1] == database):
+                    self._entries.pop(key, None)
+                    self._versions[key] = self._versions.get(key, 0) + 1
+
+    # Return the number of times the schema of a database was invalidated.
+    def getVersion(self, backend: str, database: str):
+
+        with self._lock:
+            return self._versions.get((backend, database), 0)
+
+
+# Process-wide schema cache shared by every DataSetProcessor instance.
+schema_cache = SchemaCache()
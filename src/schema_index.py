@@ -0,0 +1,239 @@
+'''
+Precompiled index of a schema for the code generators.
+
+find_table_and_column_names detects the tables and columns named in a query by
+substring containment. Testing every identifier with `name in query` costs one
+scan of the query per table and column, which grows with the width of the
+schema. The SchemaIndex is built once per schema version instead and holds:
+
+    - an Aho-Corasick automaton over every table and column name, which finds
+      all the identifiers contained in the query in a single pass over it;
+    - hash maps from each table to its column set and from each column to the
+      tables that have it, so membership checks are O(1).
+
+Small schemas (up to DIRECT_SCAN_LIMIT identifiers) are matched with direct
+substring tests, which are faster than the automaton for a handful of names.
+Both give the same result.
+
+Indexes are cached in an LRU keyed by the schema fingerprint (see
+translation_cache.schema_fingerprint), so a changed schema builds a new index,
+including a schema mapping that was modified in place.
+
+Main function:
+    schema_index = get_schema_index(api_data, "tables")
+    detected_tables, columns_for_tables = schema_index.find_tables_and_columns(query)
+'''
+import threading
+from collections import OrderedDict
+
+from translation_cache import schema_fingerprint
+
+# Number of identifiers up to which direct substring tests are used.
+DIRECT_SCAN_LIMIT = 128
+
+# Number of schema versions kept in the cache.
+MAX_INDEXES = 32
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class IdentifierMatcher:
+    """
+    Finds every identifier that occurs as a substring of a text.
+
+    Args:
+        identifiers (iterable): The identifiers to look for.
+        direct_scan_limit (int): Number of identifiers up to which direct
+            substring tests are used instead of the automaton.
+    """
+
+    def __init__(self, identifiers, direct_scan_limit=DIRECT_SCAN_LIMIT):
+        self.identifiers = list(dict.fromkeys(identifiers))
+        self.direct_scan = len(self.identifiers) <= direct_scan_limit
+        if not self.direct_scan:
+            self._build()
+
+    def _build(self):
+        """
+        Build the goto, failure and output functions of the automaton.
+        """
+        goto = [{}]
+        outputs = [[]]
+
+        # The empty string is contained in every text.
+        self.always = [identifier for identifier in self.identifiers if not identifier]
+
+        for identifier in self.identifiers:
+            if not identifier:
+                continue
+            state = 0
+            for char in identifier:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(identifier)
+
+        # Breadth-first: the failure state of a state is the longest proper
+        # suffix of its path that is also a path of the trie.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = [tuple(output) for output in outputs]
+
+    def find(self, text):
+        """
+        Return the set of identifiers contained in the text.
+        """
+        if self.direct_scan:
+            return {identifier for identifier in self.identifiers if identifier in text}
+
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        found = set(self.always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class SchemaIndex:
+    """
+    Index of the tables and columns of a schema.
+
+    Args:
+        api_data (dict): The mapping of tables/collections to columns.
+        tables_key (str): The key of the table list ("tables" for MySQL,
+            "collections" for MongoDB).
+    """
+
+    def __init__(self, api_data, tables_key="tables"):
+        self.tables = list(api_data.get(tables_key, []))
+        self.table_set = frozenset(self.tables)
+        self.table_columns = {table: list(api_data.get(table, [])) for table in self.tables}
+        self.column_sets = {table: frozenset(columns) for table, columns in self.table_columns.items()}
+
+        # Positions of each table in the table list and of each column in the
+        # column lists, so that the detected names keep the schema order.
+        self.table_positions = {}
+        for position, table in enumerate(self.tables):
+            self.table_positions.setdefault(table, []).append(position)
+
+        self.column_tables = {}
+        for table, columns in self.table_columns.items():
+            for position, column in enumerate(columns):
+                self.column_tables.setdefault(column, []).append((table, position))
+
+        self.matcher = IdentifierMatcher(list(self.table_positions) + list(self.column_tables))
+
+    def has_table(self, table):
+        """
+        Return True if the schema has the table.
+        """
+        return table in self.table_set
+
+    def has_column(self, table, column):
+        """
+        Return True if the table has the column.
+        """
+        return column in self.column_sets.get(table, ())
+
+    def find_tables_and_columns(self, query):
+        """
+        Detect the tables and columns whose names occur in the query.
+
+        Equivalent to testing `table in query` for every table and `column in
+        query` for every column of the detected tables, in schema order.
+
+        Returns:
+            tuple: (detected_tables, columns_for_tables), where columns_for_tables
+                only has the detected tables with at least one detected column.
+        """
+        # Small schemas: the substring tests themselves, in schema order.
+        if self.matcher.direct_scan:
+            detected_tables = [table for table in self.tables if table in query]
+            columns_for_tables = {}
+            for table in detected_tables:
+                detected_columns = [column for column in self.table_columns[table] if column in query]
+                if detected_columns:
+                    columns_for_tables[table] = detected_columns
+            return detected_tables, columns_for_tables
+
+        found = self.matcher.find(query)
+
+        table_positions = sorted(position for name in found for position in self.table_positions.get(name, ()))
+        detected_tables = [self.tables[position] for position in table_positions]
+        detected_set = set(detected_tables)
+
+        table_hits = {}
+        for name in found:
+            for table, position in self.column_tables.get(name, ()):
+                if table in detected_set:
+                    table_hits.setdefault(table, []).append((position, name))
+
+        columns_for_tables = {}
+        for table in detected_tables:
+            if table in table_hits and table not in columns_for_tables:
+                columns_for_tables[table] = [name for position, name in sorted(table_hits[table])]
+
+        return detected_tables, columns_for_tables
+
+
+def get_schema_index(api_data, tables_key="tables"):
+    """
+    Return the index of a schema, building it on the first use of the schema version.
+
+    Args:
+        api_data (dict): The mapping of tables/collections to columns.
+        tables_key (str): The key of the table list.
+
+    Returns:
+        SchemaIndex: The shared index of the schema.
+    """
+    key = (tables_key, schema_fingerprint(api_data))
+
+    with _indexes_lock:
+        schema_index = _indexes.get(key)
+        if schema_index is not None:
+            _indexes.move_to_end(key)
+            return schema_index
+
+    schema_index = SchemaIndex(api_data, tables_key)
+
+    with _indexes_lock:
+        _indexes[key] = schema_index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+    return schema_index
+
+
+def get_column_sets(columns_for_tables, lower=False):
+    """
+    Return the detected columns of each table as sets, for O(1) membership checks.
+
+    Args:
+        columns_for_tables (dict): The mapping of tables to detected columns.
+        lower (bool): Lowercase the column names, for case-insensitive checks.
+    """
+    if lower:
+        return {table: frozenset(column.lower() for column in columns)
+                for table, columns in columns_for_tables.items()}
+    return {table: frozenset(columns) for table, columns in columns_for_tables.items()}
@@ -0,0 +1,352 @@
+# Load dependent libraries.
+import pandas as pd
+
+from sqlalchemy.dialects import mysql
+
+from json_stream import iterJSONDocuments
+
+# Integer values. A zero fraction ("22.0", written by pandas for integer
+# columns with missing values) is accepted as an integer.
+_INT_PATTERN = r"[+-]?\d+(?:\.0*)?"
+
+# Fixed-point values without an exponent.
+_DECIMAL_PATTERN = r"[+-]?(?:\d+\.?\d*|\.\d+)"
+
+# MySQL integer types ordered by size with their signed and unsigned ranges.
+_MYSQL_INT_TYPES = [
+    (mysql.TINYINT, -2 ** 7, 2 ** 7 - 1, 2 ** 8 - 1),
+    (mysql.SMALLINT, -2 ** 15, 2 ** 15 - 1, 2 ** 16 - 1),
+    (mysql.MEDIUMINT, -2 ** 23, 2 ** 23 - 1, 2 ** 24 - 1),
+    (mysql.INTEGER, -2 ** 31, 2 ** 31 - 1, 2 ** 32 - 1),
+    (mysql.BIGINT, -2 ** 63, 2 ** 63 - 1, 2 ** 64 - 1),
+]
+
+# Largest precision and scale of a MySQL DECIMAL.
+MAX_DECIMAL_PRECISION = 65
+MAX_DECIMAL_SCALE = 30
+
+# Longest VARCHAR (in characters) for utf8mb4 rows; longer strings are stored as TEXT.
+MAX_VARCHAR_LENGTH = 16383
+
+
+# Convert an integer value ("22", "22.0", 22.0 or 22) to an int without a
+# round trip through float, which would lose the digits of large integers.
+def _toInt(value):
+
+    if isinstance(value, str):
+        return int(value.strip().split('.')[0])
+
+    return int(value)
+
+#
+# This class collects the statistics of the values of one column: the
+# narrowest kind that holds every value ('int', 'decimal', 'float' or
+# 'string'), the numeric range, the digits before and after the decimal
+# point, the longest value and up to enum_max_values distinct values.
+# The kind only ever widens, so the statistics can be updated chunk by chunk.
+#
+class ColumnStats:
+
+    # Constructor method to initialize class variables.
+    def __init__(self, enum_max_values: int = 16):
+        self.enum_max_values = enum_max_values
+
+        self.kind = None
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.int_digits = 0
+        self.scale = 0
+        self.max_length = 0
+
+        # Distinct values; None once there are more than enum_max_values.
+        self.values = set()
+
+    # Update the statistics with a sequence of values (strings read from a
+    # CSV file or scalars read from a JSON file). Missing values are counted as nulls.
+    def update(self, values):
+
+        values = pd.Series(values, dtype=object)
+        present = values.dropna()
+        self.nulls += len(values) - len(present)
+
+        if present.empty:
+            return
+
+        strings = present.astype(str).str.strip()
+        self.count += len(strings)
+        self.max_length = max(self.max_length, int(strings.str.len().max()))
+
+        if self.values is not None:
+            self.values.update(strings.unique())
+            if len(self.values) > self.enum_max_values:
+                self.values = None
+
+        kind = self.kind or 'int'
+
+        # Booleans, nested documents and arrays are not numbers.
+        if kind != 'string' and present.map(lambda value: isinstance(value, (bool, dict, list))).any():
+            kind = 'string'
+
+        if kind == 'int' and not strings.str.fullmatch(_INT_PATTERN).all():
+            kind = 'decimal'
+
+        if kind == 'decimal' and not strings.str.fullmatch(_DECIMAL_PATTERN).all():
+            kind = 'float'
+
+        if kind != 'string':
+
+            numbers = pd.to_numeric(strings, errors='coerce')
+
+            if numbers.isna().any():
+                kind = 'string'
+
+            else:
+                self.min = min(numbers.min(), self.min) if self.min is not None else numbers.min()
+                self.max = max(numbers.max(), self.max) if self.max is not None else numbers.max()
+
+                if kind == 'decimal':
+                    unsigned = strings.str.lstrip('+-')
+                    int_parts = unsigned.str.split('.', n=1).str[0].str.lstrip('0')
+                    fractions = unsigned.str.split('.', n=1).str[1].fillna('').str.rstrip('0')
+                    self.int_digits = max(self.int_digits, int(int_parts.str.len().max()))
+                    self.scale = max(self.scale, int(fractions.str.len().max()))
+
+                elif kind == 'int':
+                    self.int_digits = max(self.int_digits, len(str(int(max(abs(self.min), abs(self.max))))))
+
+        self.kind = kind
+
+    # Return the distinct values if the column is a low-cardinality string column.
+    def getEnumValues(self):
+
+        if self.kind != 'string' or self.values is None or len(self.values) == 0:
+            return None
+
+        # Every value must repeat on average, so that identifiers in a small
+        # sample are not mistaken for categories.
+        if self.count < 2 * len(self.values) or self.max_length > 64:
+            return None
+
+        return sorted(self.values)
+
+#
+# This class infers compact column types for a data set. The statistics of
+# each column are collected from a sample of the file and updated with every
+# chunk that is loaded; a column type only ever widens. The types map to
+# MySQL column types (sized integers, DECIMAL, DOUBLE, ENUM, VARCHAR, TEXT)
+# and to BSON types (int32/int64, double, string) for MongoDB documents.
+#
+class SchemaInference:
+
+    # Constructor method to initialize class variables.
+    # sample_rows: number of rows/documents read to infer the initial types.
+    # enum_max_values: maximum number of distinct values of an ENUM column.
+    def __init__(self, sample_rows: int = 10000, enum_max_values: int = 16):
+        self.sample_rows = sample_rows
+        self.enum_max_values = enum_max_values
+
+    # Return the column statistics of a sample of a CSV file.
+    def inferCSVStats(self, file_name: str):
+
+        sample_df = pd.read_csv(file_name, header=0, dtype=str, nrows=self.sample_rows)
+
+        column_stats = {column: ColumnStats(self.enum_max_values) for column in sample_df.columns}
+        self.updateStats(column_stats, sample_df)
+
+        return column_stats
+
+    # Return the column statistics of a sample of a JSON array or NDJSON file.
+    def inferJSONStats(self, file_name: str):
+
+        documents = []
+        with open(file_name, 'r', encoding='utf-8') as jf:
+            for document in iterJSONDocuments(jf):
+                documents.append(document)
+                if len(documents) >= self.sample_rows:
+                    break
+
+        column_stats = dict()
+        self.updateStats(column_stats, pd.DataFrame(documents))
+
+        return column_stats
+
+    # Update the column statistics with a data frame (a chunk of rows or a batch of documents).
+    # Return the names of the columns whose MySQL type changed.
+    def updateStats(self, column_stats: dict, table_df: pd.DataFrame):
+
+        changed_columns = []
+
+        for column in table_df.columns:
+
+            stats = column_stats.get(column)
+            if stats is None:
+                stats = column_stats[column] = ColumnStats(self.enum_max_values)
+                previous_type = None
+            else:
+                previous_type = self.getSQLTypeName(stats)
+
+            stats.update(table_df[column])
+
+            if previous_type is not None and self.getSQLTypeName(stats) != previous_type:
+                changed_columns.append(column)
+
+        return changed_columns
+
+    # Update the column statistics with the rows of a chunk that the sample did not
+    # cover; first_row is the position of the first row of the chunk in the file.
+    # The sampled rows were already counted by inferCSVStats/inferJSONStats, and
+    # counting them again would make every sampled value repeat (see getEnumValues).
+    # Return the names of the columns whose MySQL type changed.
+    def updateUnsampledStats(self, column_stats: dict, table_df: pd.DataFrame, first_row: int):
+
+        sampled_rows = max(0, self.sample_rows - first_row)
+        if sampled_rows >= len(table_df):
+            return []
+
+        return self.updateStats(column_stats, table_df.iloc[sampled_rows:])
+
+    # Return the MySQL column type of a column.
+    def getSQLType(self, stats: ColumnStats):
+
+        if stats.kind == 'int':
+
+            unsigned = stats.min >= 0
+            for int_type, signed_min, signed_max, unsigned_max in _MYSQL_INT_TYPES:
+                if unsigned and stats.max <= unsigned_max:
+                    return int_type(unsigned=True)
+                if not unsigned and stats.min >= signed_min and stats.max <= signed_max:
+                    return int_type()
+
+            # Integers beyond BIGINT.
+            if stats.int_digits <= MAX_DECIMAL_PRECISION:
+                return mysql.DECIMAL(precision=stats.int_digits, scale=0)
+
+            return mysql.TEXT()
+
+        if stats.kind == 'decimal':
+
+            precision = max(stats.int_digits + stats.scale, 1)
+            if precision <= MAX_DECIMAL_PRECISION and stats.scale <= MAX_DECIMAL_SCALE:
+                return mysql.DECIMAL(precision=precision, scale=stats.scale)
+
+            return mysql.DOUBLE()
+
+        if stats.kind == 'float':
+            return mysql.DOUBLE()
+
+        # The values are sorted, so ORDER BY (which sorts an ENUM by the
+        # position of its values) matches the order of the strings.
+        enum_values = stats.getEnumValues()
+        if enum_values is not None:
+            return mysql.ENUM(*enum_values)
+
+        # Round the length up to a power of two, so that slightly longer
+        # values in later chunks do not widen the column.
+        if stats.max_length <= MAX_VARCHAR_LENGTH:
+            length = 16
+            while length < stats.max_length:
+                length *= 2
+            return mysql.VARCHAR(min(length, MAX_VARCHAR_LENGTH))
+
+        return mysql.TEXT()
+
+    # Return the MySQL column types of every column (the dtype argument of to_sql).
+    def getSQLTypes(self, column_stats: dict):
+
+        return {column: self.getSQLType(stats) for column, stats in column_stats.items()}
+
+    # Return the DDL of the MySQL column type of a column.
+    def getSQLTypeName(self, stats: ColumnStats):
+
+        return self.getSQLType(stats).compile(dialect=mysql.dialect())
+
+    # Return the statements that change the MySQL type of the given columns.
+    def getAlterStatements(self, table_name: str, column_stats: dict, columns: list):
+
+        return [f"ALTER TABLE `{table_name}` MODIFY COLUMN `{column}` {self.getSQLTypeName(column_stats[column])} NULL"
+                for column in columns]
+
+    # Convert the string columns of a CSV chunk to their inferred kinds.
+    def convertChunk(self, table_df: pd.DataFrame, column_stats: dict):
+
+        table_df = table_df.copy()
+
+        for column in table_df.columns:
+
+            stats = column_stats[column]
+
+            # Integers beyond BIGINT (and BIGINT UNSIGNED values above the int64
+            # range) stay strings, which MySQL converts exactly. The others are
+            # parsed to nullable integers without a round trip through float64,
+            # which would lose the digits of values above 2**53.
+            if stats.kind == 'int' and stats.max <= 2 ** 63 - 1 and \
+                    not isinstance(self.getSQLType(stats), (mysql.DECIMAL, mysql.TEXT)):
+                integers = table_df[column].str.strip().str.split('.', n=1).str[0]
+                table_df[column] = pd.to_numeric(integers, dtype_backend='numpy_nullable').astype('Int64')
+            elif stats.kind in ('decimal', 'float'):
+                table_df[column] = pd.to_numeric(table_df[column])
+
+        return table_df
+
+    # Convert the values of a batch of documents to the BSON types of their
+    # inferred kinds: integers to int32/int64, decimals and floats to double
+    # and numbers in string columns to strings. Booleans, nested documents
+    # and arrays are left unchanged. Documents are modified in place.
+    def coerceDocuments(self, documents: list, column_stats: dict):
+
+        for document in documents:
+
+            for field, value in document.items():
+
+                stats = column_stats.get(field)
+                if stats is None or value is None or isinstance(value, (bool, dict, list)):
+                    continue
+
+                try:
+
+                    if stats.kind == 'int' and stats.int_digits <= 18:
+                        document[field] = _toInt(value)
+                    elif stats.kind in ('decimal', 'float'):
+                        document[field] = float(value)
+                    elif stats.kind == 'string' and not isinstance(value, str):
+                        document[field] = str(value)
+
+                except (TypeError, ValueError):
+                    pass
+
+        return documents
+
+    # Return the kind of every field, to find the fields widened by a later batch (see getCoerceUpdates).
+    def getKinds(self, column_stats: dict):
+
+        return {field: stats.kind for field, stats in column_stats.items()}
+
+    # Return the (filter, pipeline) pairs of the update_many calls that convert the
+    # values of the documents already stored by coerceDocuments to the BSON types of
+    # the fields whose kind widened since previous_kinds: integers to double for
+    # decimal and float fields and numbers to strings for string fields.
+    def getCoerceUpdates(self, column_stats: dict, previous_kinds: dict):
+
+        updates = []
+
+        for field, stats in column_stats.items():
+
+            previous_kind = previous_kinds.get(field)
+            if previous_kind is None or previous_kind == stats.kind:
+                continue
+
+            if stats.kind == 'string':
+                updates.append(({field: {'$type': ['int', 'long', 'double', 'decimal']}},
+                                [{'$set': {field: {'$toString': f"${field}"}}}]))
+            elif stats.kind in ('decimal', 'float') and previous_kind == 'int':
+                updates.append(({field: {'$type': ['int', 'long']}},
+                                [{'$set': {field: {'$toDouble': f"${field}"}}}]))
+
+        return updates
+
+    # Return a printable summary of the inferred MySQL column types.
+    def describeTypes(self, column_stats: dict):
+
+        return ", ".join(f"{column} {self.getSQLTypeName(stats)}" for column, stats in column_stats.items())
@@ -0,0 +1,20 @@
+# Tests of the statements built by the query executor.
+from query_executor import QueryExecutor
+
+
+# A trailing LIMIT is lowered in place, so that joins with duplicate column
+# names are not wrapped in a derived table.
+def test_preview_lowers_a_trailing_limit():
+
+    join = "SELECT a.id, b.id FROM a JOIN b ON a.x = b.x"
+
+    assert QueryExecutor.getPreviewStatement(f"{join} LIMIT 50;", 11) == f"{join} LIMIT 11"
+    assert QueryExecutor.getPreviewStatement(f"{join} LIMIT 5", 11) == f"{join} LIMIT 5"
+    assert QueryExecutor.getPreviewStatement(f"{join} LIMIT 20, 50", 11) == f"{join} LIMIT 20, 11"
+    assert QueryExecutor.getPreviewStatement(f"{join} LIMIT 50 OFFSET 20", 11) == f"{join} LIMIT 11 OFFSET 20"
+
+
+def test_preview_appends_a_limit():
+
+    assert QueryExecutor.getPreviewStatement("SELECT * FROM t", 10) == "SELECT * FROM t LIMIT 10"
+    assert QueryExecutor.getPreviewStatement("UPDATE t SET x = 1", 10) == "UPDATE t SET x = 1"
@@ -0,0 +1,24 @@
+# Tests of the schema cache shared by the data set processors.
+from schema_cache import SchemaCache
+
+
+def test_put_after_invalidate_is_dropped():
+
+    cache = SchemaCache()
+
+    # A fetch starts, a data load invalidates the schema, then the fetch stores its result.
+    version = cache.getVersion('mysql', 'chatdb')
+    cache.invalidate('mysql', 'chatdb')
+    cache.putSchema('mysql', 'chatdb', {'old_table': ['id']}, version)
+
+    assert cache.getSchema('mysql', 'chatdb') is None
+
+
+def test_put_without_invalidate_is_cached():
+
+    cache = SchemaCache()
+
+    version = cache.getVersion('mongodb', 'chatdb')
+    cache.putSchema('mongodb', 'chatdb', {'collections': ['users']}, version)
+
+    assert cache.getSchema('mongodb', 'chatdb') == {'collections': ['users']}
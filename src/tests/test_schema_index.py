@@ -0,0 +1,16 @@
+# Tests of the schema index cache of the code generators.
+from schema_index import get_schema_index
+
+
+def test_schema_changed_in_place_is_reindexed():
+
+    api_data = {'tables': ['users'], 'users': ['id', 'name']}
+    get_schema_index(api_data, 'tables')
+
+    api_data['tables'].append('orders')
+    api_data['orders'] = ['id', 'total']
+    detected_tables, columns_for_tables = get_schema_index(api_data, 'tables').find_tables_and_columns(
+        "show the total of orders")
+
+    assert 'orders' in detected_tables
+    assert columns_for_tables['orders'] == ['total']
@@ -0,0 +1,74 @@
+# Tests of the column type inference of the data set loader.
+import pandas as pd
+
+from schema_inference import SchemaInference
+
+
+# Collect the statistics of a CSV file as DataSetProcessor.insertSetToMySQL does:
+# from the sample, then from the rows of each chunk that the sample did not cover.
+def loadCSVStats(schema_inference, file_name, chunk_size):
+
+    column_stats = schema_inference.inferCSVStats(file_name)
+
+    rows_loaded = 0
+    for chunk in pd.read_csv(file_name, header=0, chunksize=chunk_size, dtype=str):
+        schema_inference.updateUnsampledStats(column_stats, chunk, rows_loaded)
+        rows_loaded += len(chunk)
+
+    return column_stats
+
+
+def test_unique_strings_are_not_an_enum(tmp_path):
+
+    file_name = tmp_path / "people.csv"
+    file_name.write_text("id,name\n1,alice\n2,bob\n3,carol\n4,dave\n")
+
+    schema_inference = SchemaInference()
+    column_stats = loadCSVStats(schema_inference, file_name, chunk_size=2)
+
+    assert column_stats['name'].count == 4
+    assert schema_inference.getSQLTypeName(column_stats['name']) == "VARCHAR(16)"
+
+
+def test_rows_after_the_sample_are_counted(tmp_path):
+
+    file_name = tmp_path / "people.csv"
+    file_name.write_text("id,name\n1,alice\n2,bob\n3,alice\n4,bob\n5,carol\n")
+
+    schema_inference = SchemaInference(sample_rows=3)
+    column_stats = loadCSVStats(schema_inference, file_name, chunk_size=2)
+
+    assert column_stats['id'].count == 5
+    assert column_stats['name'].values == {'alice', 'bob', 'carol'}
+
+
+def test_large_integers_keep_their_digits():
+
+    chunk = pd.DataFrame({'id': ['9007199254740993', None, '22.0', '-5']}, dtype=object)
+
+    schema_inference = SchemaInference()
+    column_stats = {}
+    schema_inference.updateStats(column_stats, chunk)
+    converted = schema_inference.convertChunk(chunk, column_stats)
+
+    assert str(converted['id'].dtype) == 'Int64'
+    assert converted['id'].tolist()[0] == 9007199254740993
+    assert converted['id'].tolist()[2:] == [22, -5]
+
+
+def test_widened_mongo_fields_are_converted():
+
+    schema_inference = SchemaInference(sample_rows=3)
+    column_stats = {}
+    schema_inference.updateStats(column_stats, pd.DataFrame([{'z': "1", 'y': "1"}, {'z': "2", 'y': "2"},
+                                                             {'z': "3", 'y': "3"}]))
+
+    previous_kinds = schema_inference.getKinds(column_stats)
+    schema_inference.updateUnsampledStats(column_stats, pd.DataFrame([{'z': "N/A", 'y': "2.5"}, {'z': "4", 'y': "4"}]),
+                                          3)
+
+    assert schema_inference.getCoerceUpdates(column_stats, previous_kinds) == [
+        ({'z': {'$type': ['int', 'long', 'double', 'decimal']}}, [{'$set': {'z': {'$toString': "$z"}}}]),
+        ({'y': {'$type': ['int', 'long']}}, [{'$set': {'y': {'$toDouble': "$y"}}}]),
+    ]
+    assert schema_inference.coerceDocuments([{'z': "4", 'y': "4"}], column_stats) == [{'z': "4", 'y': 4.0}]
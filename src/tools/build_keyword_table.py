@@ -0,0 +1,129 @@
+'''
+Build step of the frozen keyword synonym table (see keyword_table.py).
+
+Expands the trigger keyword sets of the code generators through WordNet and
+writes the synonyms to keyword_table.json, which the generators load at
+startup. Only this script needs NLTK (listed in requirements-build.txt, not in
+requirements.txt) and the WordNet corpus; rerun it when a keyword set or SENSES
+changes and commit the table.
+
+Only the WordNet senses listed in SENSES are expanded: most keywords have
+senses unrelated to queries (e.g. "order" as "give instructions", whose
+synonyms are "tell" and "say"). Each listed sense must contain a keyword of
+its set. A synonym is kept if it is a single alphabetic word of at least
+MIN_LENGTH letters (the SQL generator matches join words as substrings of
+the query), is not a stop word, and is not already a keyword of any set.
+
+Usage (from the src directory):
+    pip install -r requirements-build.txt
+    python tools/build_keyword_table.py [--output keyword_table.json] [--no-download]
+'''
+import argparse
+import json
+import os
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# Read the hand-written keyword sets, without the synonyms of the current table.
+os.environ["CHATDB_KEYWORD_TABLE"] = ""
+
+import MongoDBCodeGenerator  # noqa: E402
+import SQLCodeGenerator  # noqa: E402
+from fast_path import FUNCTION_WORDS  # noqa: E402
+from keyword_table import DEFAULT_TABLE_PATH  # noqa: E402
+
+# WordNet senses (synset names) expanded for each keyword set.
+SENSES = {
+    "ping_select": ["choose.v.01", "pick.v.01", "pick.v.02"],
+    "ping_join": ["blend.v.01", "blend.v.03", "mix.v.05", "unify.v.01", "unite.v.06", "connect.v.03",
+                  "join.v.02", "join.v.04", "compound.v.05", "aggregate.v.02"],
+    "ping_order": ["arrange.v.01", "order.v.06", "organize.v.02"],
+}
+
+# Shortest synonym kept.
+MIN_LENGTH = 5
+
+
+def get_keyword_sets():
+    """
+    Return the hand-written keyword sets of both code generators, by name.
+    """
+    keyword_sets = {}
+    for module in (SQLCodeGenerator, MongoDBCodeGenerator):
+        for name, value in vars(module).items():
+            if isinstance(value, (set, frozenset, dict)) and (
+                    name.startswith("ping_") or name.endswith("_triggers") or name in {
+                        "aggregation_functions", "order_directions"}):
+                keyword_sets.setdefault(name, set()).update(value)
+    return keyword_sets
+
+
+def expand_senses(wordnet, senses, keywords, reserved, stop_words):
+    """
+    Collect the synonyms of the listed senses of a keyword set.
+
+    Args:
+        wordnet: The NLTK WordNet corpus reader.
+        senses (list): The synset names to expand.
+        keywords (set): The hand-written keywords of the set.
+        reserved (set): The keywords of every set, never added as synonyms.
+        stop_words (set): The stop words, never added as synonyms.
+
+    Returns:
+        set: The synonyms kept.
+    """
+    words = set()
+    for sense in senses:
+        lemma_names = [name.lower() for name in wordnet.synset(sense).lemma_names()]
+        if not keywords.intersection(lemma_names):
+            raise ValueError(f"The sense {sense} contains none of the keywords {sorted(keywords)}")
+        words.update(name for name in lemma_names
+                     if name.isalpha() and len(name) >= MIN_LENGTH and name not in reserved
+                     and name not in stop_words)
+    return words
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand the trigger keywords through WordNet into a frozen table.")
+    parser.add_argument("--output", default=DEFAULT_TABLE_PATH, help="Path of the JSON table.")
+    parser.add_argument("--no-download", action="store_true",
+                        help="Do not download the WordNet corpus (use the installed NLTK data).")
+    args = parser.parse_args()
+
+    import nltk
+    from nltk.corpus import wordnet
+    from spacy.lang.en.stop_words import STOP_WORDS
+
+    if not args.no_download:
+        nltk.download("wordnet", quiet=True)
+
+    keyword_sets = get_keyword_sets()
+    reserved = set().union(*keyword_sets.values()) | set(FUNCTION_WORDS)
+
+    expanded = {name: expand_senses(wordnet, senses, keyword_sets[name], reserved, STOP_WORDS)
+                for name, senses in SENSES.items()}
+
+    # A word that would trigger two clauses is left out of both sets
+    shared = {word for name, words in expanded.items() for other, other_words in expanded.items()
+              if name < other for word in words & other_words}
+
+    table = {
+        "source": f"WordNet {wordnet.get_version()}",
+        "min_length": MIN_LENGTH,
+        "senses": SENSES,
+        "keywords": {name: sorted(words - shared) for name, words in expanded.items()},
+    }
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(table, out, indent=4)
+        out.write("\n")
+
+    for name, words in table["keywords"].items():
+        print(f"{name}: {len(keyword_sets[name])} keywords + {len(words)} synonyms: {', '.join(words)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+'''
+Sampled tracing of the translation and execution pipeline.
+
+A trace is a tree of timed spans: the root span covers one request (e.g. the
+translation of a question) and its children cover the stages it runs (the NLP
+parse, each clause generator, the schema fetch, the query execution). The
+current span is kept in a context variable, so spans opened in nested calls
+become children of the enclosing span, including on the worker threads of
+AsyncQueryExecutor, which run in a copy of the caller's context.
+
+Only a fraction of the root spans (the sample rate) is recorded. When a root
+span is not sampled, none of its children are either, and with a sample rate
+of 0 (the default, or the CHATDB_TRACE_SAMPLE_RATE environment variable)
+opening a span returns a shared no-op context manager.
+
+Every recorded span adds its duration to the metrics of its name (count,
+total, mean and maximum in milliseconds). Finished traces are kept in a
+bounded buffer and passed to the optional exporter.
+
+Main functions:
+    with tracer.span("sql.where"):
+        ...
+
+    @traced("nlp.parse")
+    def parse_query(query): ...
+
+    tracer.get_metrics()
+'''
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+
+# Default fraction of the root spans that are recorded.
+DEFAULT_SAMPLE_RATE = float(os.environ.get("CHATDB_TRACE_SAMPLE_RATE", "0"))
+
+# Number of finished traces kept in memory.
+MAX_TRACES = 100
+
+# Current span of the running request (None outside a trace).
+_current_span = contextvars.ContextVar("chatdb_current_span", default=None)
+
+# Marker of the current span when the trace is not sampled.
+_UNSAMPLED = object()
+
+# Shared no-op context manager returned for spans that are not recorded.
+_NULL_SPAN = nullcontext()
+
+
+class Span:
+    """
+    A timed stage of a trace. Used as a context manager by Tracer.span.
+    """
+
+    __slots__ = ("tracer", "name", "trace_id", "parent", "attributes", "children",
+                 "start_time", "duration_ms", "error", "_token")
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.attributes = attributes or {}
+        self.children = []
+        self.start_time = None
+        self.duration_ms = None
+        self.error = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration_ms = (time.perf_counter() - self.start_time) * 1000
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _current_span.reset(self._token)
+
+        if self.parent is not None:
+            self.parent.children.append(self)
+        self.tracer.finish(self)
+        return False
+
+    def set_attribute(self, key, value):
+        """
+        Attach a value (e.g. the number of result rows) to the span.
+        """
+        self.attributes[key] = value
+
+    def to_dict(self):
+        """
+        Return the span and its children as a dictionary.
+        """
+        span_dt = {"name": self.name, "trace_id": self.trace_id, "duration_ms": self.duration_ms,
+                   "children": [child.to_dict() for child in self.children]}
+        if self.attributes:
+            span_dt["attributes"] = dict(self.attributes)
+        if self.error is not None:
+            span_dt["error"] = self.error
+        return span_dt
+
+
+class _UnsampledRoot:
+    """
+    Root of a trace that is not recorded; its nested spans are skipped.
+    """
+
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current_span.set(_UNSAMPLED)
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        return False
+
+
+class Tracer:
+    """
+    Records sampled traces and aggregates per-stage timing metrics.
+    """
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, max_traces=MAX_TRACES, exporter=None):
+        """
+        Args:
+            sample_rate (float): Fraction of the root spans that are recorded (0 to 1).
+            max_traces (int): Number of finished traces kept in memory.
+            exporter (callable): Optional function called with each finished trace (a dictionary).
+        """
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self._traces = deque(maxlen=max_traces)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        """
+        Return a context manager that times a stage of the current trace.
+
+        A span opened outside a trace starts a new trace, which is recorded
+        with probability sample_rate.
+
+        Args:
+            name (str): Name of the stage, e.g. "sql.where".
+            **attributes: Values attached to the span.
+
+        Returns:
+            A context manager that yields the Span (or None if it is not recorded).
+        """
+        if self.sample_rate <= 0:
+            return _NULL_SPAN
+
+        parent = _current_span.get()
+        if parent is _UNSAMPLED:
+            return _NULL_SPAN
+
+        if parent is None and random.random() >= self.sample_rate:
+            return _UnsampledRoot()
+
+        return Span(self, name, parent, attributes)
+
+    def finish(self, span):
+        """
+        Add a finished span to the metrics and record the trace of a finished root span.
+        """
+        with self._lock:
+            metric = self._metrics.get(span.name)
+            if metric is None:
+                metric = self._metrics[span.name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            metric["count"] += 1
+            metric["total_ms"] += span.duration_ms
+            metric["max_ms"] = max(metric["max_ms"], span.duration_ms)
+            if span.error is not None:
+                metric["errors"] += 1
+
+        if span.parent is None:
+            trace = span.to_dict()
+            self._traces.append(trace)
+            if self.exporter is not None:
+                self.exporter(trace)
+
+    def get_metrics(self):
+        """
+        Return the timing metrics of every stage.
+
+        Returns:
+            dict: Mapping of span name to count, errors, total_ms, mean_ms and max_ms.
+        """
+        with self._lock:
+            return {name: dict(metric, mean_ms=metric["total_ms"] / metric["count"])
+                    for name, metric in self._metrics.items()}
+
+    def merge_metrics(self, metrics):
+        """
+        Add metrics returned by get_metrics(), e.g. those of a worker process, to these metrics.
+        """
+        with self._lock:
+            for name, other in metrics.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+                metric["count"] += other["count"]
+                metric["errors"] += other["errors"]
+                metric["total_ms"] += other["total_ms"]
+                metric["max_ms"] = max(metric["max_ms"], other["max_ms"])
+
+    def get_traces(self):
+        """
+        Return the most recent finished traces (oldest first).
+        """
+        return list(self._traces)
+
+    def set_sample_rate(self, sample_rate):
+        """
+        Change the fraction of the root spans that are recorded.
+        """
+        self.sample_rate = sample_rate
+
+    def reset(self):
+        """
+        Clear the recorded traces and metrics.
+        """
+        with self._lock:
+            self._traces.clear()
+            self._metrics.clear()
+
+
+def traced(name):
+    """
+    Decorator that runs a function in a span of the shared tracer.
+
+    Args:
+        name (str): Name of the span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Shared tracer of the process.
+tracer = Tracer()
@@ -0,0 +1,167 @@
+'''
+Translation result cache for the natural language code generators.
+
+Memoizes the output of generate_sql_query (SQL string) and mongo_compile
+((execute, collection, pipeline) tuple). Entries are keyed by the target
+language, the normalized query text and a fingerprint of the schema the query
+was compiled against. A schema change produces a new fingerprint, so entries
+compiled against the old schema are never returned again; they age out through
+the size bound and the time-to-live.
+
+Usage:
+    key = translation_cache.make_key("sql", query, api_data)
+    hit, value = translation_cache.get(key)
+    if not hit:
+        value = ...
+        translation_cache.put(key, value)
+'''
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+    Normalize a natural language query for caching.
+
+    Collapses runs of whitespace and strips the ends. Case is preserved because
+    the code generators match table and column names case-sensitively.
+
+    Args:
+        query (str): The natural language query.
+
+    Returns:
+        str: The normalized query.
+    """
+    return " ".join(query.split())
+
+
+def schema_fingerprint(api_data):
+    """
+    Compute a stable fingerprint of a schema mapping.
+
+    Args:
+        api_data (dict): The mapping of tables/collections to columns.
+
+    Returns:
+        str: A hex digest that changes whenever the schema changes.
+    """
+    encoded = json.dumps(api_data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class TranslationCache:
+    """
+    Thread-safe LRU cache with a time-to-live and hit/miss counters.
+
+    Args:
+        maxsize (int): Maximum number of entries. 0 disables the cache.
+        ttl (float): Seconds an entry stays valid. None keeps entries until evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        """
+        Change the size bound and/or time-to-live, evicting entries as needed.
+        """
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def make_key(self, target, query, api_data, *options):
+        """
+        Build the cache key of a translation.
+
+        Args:
+            target (str): "sql" or "mongo".
+            query (str): The natural language query.
+            api_data (dict): The schema the query is compiled against.
+            *options: Any further arguments that change the output.
+
+        Returns:
+            tuple: The cache key.
+        """
+        return (target, normalize_query(query), schema_fingerprint(api_data)) + options
+
+    def get(self, key):
+        """
+        Look up a translation.
+
+        Returns:
+            tuple: (hit, value). The value is a copy that the caller may modify.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() >= entry[0]:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+
+        return True, copy.deepcopy(value)
+
+    def put(self, key, value):
+        """
+        Store a translation, evicting the least recently used entries if full.
+        """
+        if self.maxsize <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        """
+        Remove every entry. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _evict(self):
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+# Process-wide translation cache shared by both code generators.
+translation_cache = TranslationCache()